@@ -7,33 +7,61 @@ specified event, runs predictions, and generates the final visual maps.
 
 Example usage from the terminal in the project's root directory:
 > python inference.py --event Bathinda-PinkBollworm
+
+After a new date has been added to the event's patch store, only that date
+needs to go through the CNN; this mode forecasts from the latest N_STEPS_IN
+dates instead of the first ones:
+> python inference.py --event Bathinda-PinkBollworm --incremental
+
+On CPU-only servers, the INT8 model written by quantize.py can be used instead:
+> python inference.py --event Bathinda-PinkBollworm --quantized
 """
 import os
 import torch
 import joblib
 import argparse
 import numpy as np
-from torch.utils.data import DataLoader
 
 # Import from our source code library
 from src.config import globals as config
 from src.dataset.dataset import InferenceDataset
-from src.models.cnn_encoder import ResNetEncoder
-from src.models.seq2seq_model import MultiModalSeq2Seq
+from src.dataset.patch_store import open_event_store
+from src.dataset.loader import make_loader
 from src.inference.predictor import run_predictions
+from src.inference.incremental import run_incremental_predictions
+from src.inference.model_loader import MODEL_FILENAMES, load_model, optimize_for_inference
+from src.inference.quantization import QUANTIZED_MODEL_FILENAME
 from src.inference.map_generator import generate_maps
+from src.inference.runner import class_names
 
-def main(event_name):
-    """Orchestrates the entire inference process for a given event."""
+def main(event_name, incremental=False, quantized=False, encoder='resnet', save_png=False):
+    """
+    Orchestrates the entire inference process for a given event. With
+    incremental=True the latest N_STEPS_IN dates, rather than the first, are
+    predicted from cached per-date CNN embeddings (see
+    src/inference/incremental.py); with
+    quantized=True the INT8 model from quantize.py is run on the CPU.
+    encoder='light' uses the distilled light encoder (train.py --distill).
+    The maps are written as GeoTIFFs on the event's grid, plus a PNG preview
+    with save_png=True.
+    """
     print(f"--- Starting inference for event: {event_name} ---")
     
     # --- 1. Setup Environment ---
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    if quantized and incremental:
+        print("ERROR: --quantized cannot be combined with --incremental.")
+        return
+    if quantized and encoder != 'resnet':
+        print("ERROR: --quantized is only available for the resnet encoder.")
+        return
+    # Quantized kernels only run on the CPU
+    device = torch.device('cuda' if torch.cuda.is_available() and not quantized else 'cpu')
     print(f"Using device: {device}")
     
-    model_path = os.path.join(config.OUTPUT_MODEL_DIR, 'best_crop_model.pth')
+    model_path = os.path.join(config.OUTPUT_MODEL_DIR, QUANTIZED_MODEL_FILENAME if quantized else MODEL_FILENAMES[encoder])
     if not os.path.exists(model_path):
-        print(f"ERROR: Model file not found at {model_path}. Please run train.py first.")
+        producer = 'quantize.py' if quantized else 'train.py --distill' if encoder == 'light' else 'train.py'
+        print(f"ERROR: Model file not found at {model_path}. Please run {producer} first.")
         return
 
     # --- 2. Load Preprocessing Objects ---
@@ -41,11 +69,18 @@ def main(event_name):
     # NOTE: In a real-world scenario, you would generate or load the actual IoT data
     # that corresponds to the timeframe of your inference data. For this project,
     # we are re-using the dummy data generated during training.
+    # IoT readings are one per store date; --incremental reads those of the latest dates
+    num_readings = config.N_STEPS_IN + config.N_STEPS_OUT
+    if incremental:
+        try:
+            num_readings = max(num_readings, open_event_store(os.path.join(config.PATCH_STORE_DIR, event_name))[0].shape[0])
+        except FileNotFoundError:
+            pass
     iot_data = {}
     for event in config.EVENT_METADATA:
         # This part assumes dummy/simulated data is available for all events.
         # In a real application, you would load the specific data for the `event_name`.
-        iot_data[event] = np.random.rand(config.N_STEPS_IN + config.N_STEPS_OUT, 3) 
+        iot_data[event] = np.random.rand(num_readings, 3) 
 
     try:
         scalers = {'iot': joblib.load(os.path.join(config.OUTPUT_MODEL_DIR, 'iot_scaler.gz'))}
@@ -58,27 +93,39 @@ def main(event_name):
         return
     
     # --- 3. Prepare Data Loader ---
-    inference_dataset = InferenceDataset(config.INPUT_DATA_DIR, event_name, iot_data, scalers, encoders)
+    inference_dataset = InferenceDataset(config.PATCH_STORE_DIR, event_name, iot_data, scalers, encoders)
     if len(inference_dataset) == 0:
-        print(f"No data found for event '{event_name}' in '{config.INPUT_DATA_DIR}'. Exiting.")
+        print(f"No data found for event '{event_name}' in '{config.PATCH_STORE_DIR}'. Exiting.")
         return
     
-    inference_loader = DataLoader(inference_dataset, batch_size=config.BATCH_SIZE, shuffle=False, num_workers=0)
+    if not incremental:
+        inference_loader = make_loader(inference_dataset, device, shuffle=False)
     
     # --- 4. Load Trained Model ---
     print("Loading trained model architecture and weights...")
-    num_tabular_features = 3 + len(encoders['crop'].categories_[0]) + len(encoders['disease'].categories_[0])
-    num_classes = len(set(meta['label'] for meta in config.EVENT_METADATA.values()))
-    
-    cnn = ResNetEncoder(feature_vector_size=config.FEATURE_VECTOR_SIZE)
-    model = MultiModalSeq2Seq(cnn, num_tabular_features, num_classes).to(device)
-    model.load_state_dict(torch.load(model_path, map_location=device))
+    if quantized:
+        model = torch.jit.load(model_path, map_location=device)
+    elif incremental:
+        model = load_model(model_path, encoders, device, encoder)
+        # Cached embeddings bypass the CNN, so the model stays an nn.Module; only BatchNorm is fused
+        model = optimize_for_inference(model)
+    else:
+        model = load_model(model_path, encoders, device, encoder)
+        (X_img_b, X_tab_b) = next(iter(inference_loader))
+        model = optimize_for_inference(model, (X_img_b, X_tab_b.to(device)))
     
     # --- 5. Run Predictions ---
-    class_preds, health_preds = run_predictions(model, inference_loader, device)
+    if incremental:
+        class_preds, health_preds = run_incremental_predictions(model, config.PATCH_STORE_DIR, event_name, iot_data, scalers,
+                                                                encoders, device, config.EMBEDDING_CACHE_DIR,
+                                                                config.EMBEDDING_BATCH_SIZE)
+    else:
+        class_preds, health_preds = run_predictions(model, inference_loader, device)
     
     # --- 6. Generate and Save Maps ---
-    generate_maps(class_preds, health_preds, encoders['disease'], event_name, config.OUTPUT_MODEL_DIR)
+    _, store_index = open_event_store(os.path.join(config.PATCH_STORE_DIR, event_name))
+    generate_maps(class_preds, health_preds, class_names(config.EVENT_METADATA), event_name, config.OUTPUT_MODEL_DIR,
+                  store_index=store_index, save_png=save_png)
 
 if __name__ == '__main__':
     # --- Argument Parser to select the event from the command line ---
@@ -86,9 +133,17 @@ if __name__ == '__main__':
     parser.add_argument('--event', type=str, required=True, 
                         choices=config.EVENT_METADATA.keys(),
                         help='The name of the event folder to process.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Predict the latest dates, encoding only dates without cached CNN embeddings.')
+    parser.add_argument('--quantized', action='store_true',
+                        help='Run the INT8 model written by quantize.py on the CPU.')
+    parser.add_argument('--encoder', choices=MODEL_FILENAMES.keys(), default='resnet',
+                        help="CNN encoder: the ResNet-34 model, or the distilled 'light' model from train.py --distill.")
+    parser.add_argument('--png', action='store_true',
+                        help='Also save a PNG preview of the maps next to the GeoTIFFs.')
     args = parser.parse_args()
     
-    main(args.event)
+    main(args.event, args.incremental, args.quantized, args.encoder, args.png)
 
 # ### How to Run This Script
 
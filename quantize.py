@@ -0,0 +1,77 @@
+"""
+Post-training INT8 quantization of the trained model for CPU inference.
+
+Statically quantizes the ResNetEncoder (calibrated on a sample of training
+patch sequences) and dynamically quantizes the LSTM and heads, then compares
+the float and INT8 models on the validation samples train.py held out (its
+train_val_split.json) and saves the INT8 model for
+`python inference.py --event <name> --quantized`.
+
+Example usage from the terminal in the project's root directory:
+> python quantize.py --calibration-batches 20 --eval-batches 50
+"""
+import os
+import argparse
+import joblib
+import numpy as np
+import torch
+
+from src.config import globals as config
+from src.dataset.dataset import LocalSequenceDataset, SPLIT_FILENAME, load_split
+from src.dataset.loader import make_loader
+from src.inference.model_loader import MODEL_FILENAMES, load_model, optimize_for_inference
+from src.inference.quantization import (QUANTIZED_MODEL_FILENAME, quantize_model, export_quantized_model, evaluate,
+                                       comparison_report)
+
+REPORT_FILENAME = 'quantization_report.txt'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Quantize the trained model to INT8 for CPU inference.")
+    parser.add_argument('--calibration-batches', type=int, default=20,
+                        help='Training batches used to calibrate the encoder activations.')
+    parser.add_argument('--eval-batches', type=int, default=50,
+                        help='Held-out batches used for the float/INT8 comparison.')
+    args = parser.parse_args()
+
+    device = torch.device('cpu')
+    torch.manual_seed(0)
+    model_path = os.path.join(config.OUTPUT_MODEL_DIR, MODEL_FILENAMES['resnet'])
+    split_path = os.path.join(config.OUTPUT_MODEL_DIR, SPLIT_FILENAME)
+    for path in (model_path, split_path):
+        if not os.path.exists(path):
+            print(f"ERROR: {path} not found. Please run train.py first.")
+            raise SystemExit(1)
+
+    # --- 1. Preprocessing Objects and Data ---
+    # As in inference.py, IoT data is simulated until real readings are available
+    iot_data = {event: np.random.rand(config.N_STEPS_IN + config.N_STEPS_OUT, 3) for event in config.EVENT_METADATA}
+    scalers = {'iot': joblib.load(os.path.join(config.OUTPUT_MODEL_DIR, 'iot_scaler.gz'))}
+    encoders = {
+        'crop': joblib.load(os.path.join(config.OUTPUT_MODEL_DIR, 'crop_encoder.gz')),
+        'disease': joblib.load(os.path.join(config.OUTPUT_MODEL_DIR, 'disease_encoder.gz'))
+    }
+    full_dataset = LocalSequenceDataset(config.PATCH_STORE_DIR, config.EVENT_METADATA, iot_data, scalers, encoders)
+    # Calibrate on training samples and evaluate on the ones the model never trained on
+    calibration_dataset, heldout_dataset = load_split(split_path, full_dataset)
+    calibration_loader = make_loader(calibration_dataset, device, shuffle=True)
+    heldout_loader = make_loader(heldout_dataset, device, shuffle=False)
+    print(f"Calibrating on up to {args.calibration_batches} batches, evaluating on up to "
+          f"{args.eval_batches} held-out batches ({len(heldout_dataset)} sequences).")
+
+    # --- 2. Quantize ---
+    model = load_model(model_path, encoders, device)
+    quantized_model = quantize_model(model, calibration_loader, args.calibration_batches)
+    (X_img_b, X_tab_b), _ = next(iter(heldout_loader))
+    output_path = os.path.join(config.OUTPUT_MODEL_DIR, QUANTIZED_MODEL_FILENAME)
+    quantized_model = export_quantized_model(quantized_model, (X_img_b, X_tab_b), output_path)
+    print(f"INT8 model saved to: {output_path}")
+
+    # --- 3. Compare against the float model ---
+    float_model = optimize_for_inference(model)
+    float_results = evaluate(float_model, heldout_loader, args.eval_batches)
+    quantized_results = evaluate(quantized_model, heldout_loader, args.eval_batches)
+    report = comparison_report(float_results, quantized_results)
+    print("\n--- Float32 vs INT8 (held-out set, CPU) ---")
+    print("\n".join(report))
+    with open(os.path.join(config.OUTPUT_MODEL_DIR, REPORT_FILENAME), 'w') as f:
+        f.write("\n".join(report) + "\n")
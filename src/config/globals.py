@@ -5,12 +5,15 @@ This file contains all static configuration for the project, including
 file paths, hyperparameters, and metadata.
 """
 import os
+from src.data_preprocessing.config import SPECTRAL_INDICES # Index channels written by the preprocessing pipeline
 
 # --- Base Paths ---
 # Assumes 'src' and 'data' are in the same root folder (e.g., 'crop_health_project')
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
 INPUT_DATA_DIR = os.path.join(BASE_DIR, 'data', 'matlab_enhanced')
+PATCH_STORE_DIR = os.path.join(BASE_DIR, 'data', 'patch_store') # Packed stores built from INPUT_DATA_DIR
 OUTPUT_MODEL_DIR = os.path.join(BASE_DIR, 'saved_models')
+EMBEDDING_CACHE_DIR = os.path.join(BASE_DIR, 'data', 'embedding_cache') # Cached CNN features (train.py --cached-embeddings)
 
 # --- Model Hyperparameters ---
 BATCH_SIZE = 16
@@ -20,6 +23,39 @@ EPOCHS = 20
 LEARNING_RATE = 1e-5
 FEATURE_VECTOR_SIZE = 128 # Output size of the CNN feature extractor
 HEALTH_LOSS_WEIGHT = 0.5  # Weight for the health index prediction loss
+CNN_CHUNK_SIZE = None     # Max images per CNN call when encoding B*T images (None = all at once)
+EMBEDDING_BATCH_SIZE = 64 # Patches per CNN call when filling the embedding cache
+
+# --- Training Performance ---
+PRECISION = 'auto'        # 'auto' (fp16 on CUDA, bf16 on CPU), 'bf16', 'fp16' or 'fp32'
+CHANNELS_LAST = True      # NHWC memory format for the CNN encoder
+COMPILE_MODEL = False     # Wrap the model in torch.compile (slow first epoch, faster steps afterwards)
+
+# --- Distillation (train.py --distill) ---
+LIGHT_ENCODER_WIDTH = 32       # Channels of the light encoder's first stage (16x that at the last)
+DISTILL_TEMPERATURE = 2.0      # Softening of teacher and student class logits
+DISTILL_FEATURE_WEIGHT = 1.0   # Weight of matching the teacher's 128-d CNN features
+DISTILL_LOGIT_WEIGHT = 1.0     # Weight of matching the teacher's class distribution
+DISTILL_HEALTH_WEIGHT = 1.0    # Weight of matching the teacher's health prediction
+
+# --- Data Loading ---
+NUM_WORKERS = max(1, (os.cpu_count() or 2) // 2)  # DataLoader worker processes; see `python train.py --benchmark-loader`
+PREFETCH_FACTOR = 4        # Batches each worker prepares ahead
+PERSISTENT_WORKERS = True  # Keep workers (and their open memory maps) alive across epochs
+PIN_MEMORY = True          # Page-locked batches for faster host-to-GPU copies (CUDA only)
+
+# --- Patch Channels ---
+# Blue, Green, Red and NIR, followed by one channel per spectral index (NDVI and NDMI by default)
+NUM_BAND_CHANNELS = 4
+if 'ndvi' not in SPECTRAL_INDICES:
+    raise ValueError(f"SPECTRAL_INDICES must include 'ndvi', the source of the health target; got {SPECTRAL_INDICES}")
+NUM_IMAGE_CHANNELS = NUM_BAND_CHANNELS + len(SPECTRAL_INDICES)
+NDVI_CHANNEL = NUM_BAND_CHANNELS + SPECTRAL_INDICES.index('ndvi')
+NUM_TEXTURE_FEATURES = 4  # GLCM Contrast, Correlation, Energy, Homogeneity (one value per patch)
+# 'vector': texture features are appended to the tabular features of each timestep.
+# 'planes': texture features are expanded to constant image channels, for checkpoints
+#           trained on the original 10-channel patches.
+TEXTURE_MODE = 'vector'
 
 # --- Metadata (must match folder names in your matlab_enhanced data) ---
 EVENT_METADATA = {
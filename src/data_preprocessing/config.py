@@ -11,10 +11,31 @@ import os
 BASE_DIR = "/content/drive/MyDrive/AgriTechPro"
 RAW_DATA_DIR = os.path.join(BASE_DIR, 'data', 'organize', 'organized_date')
 PROCESSED_DATA_DIR = os.path.join("/content/cropHealthMonitor", 'data', 'processed')
+PATCH_STORE_DIR = os.path.join("/content/cropHealthMonitor", 'data', 'patch_store')
 
 # --- Processing Settings ---
 PATCH_SIZE = 256
 TARGET_RESOLUTION = 30  # meters
+BLOCK_ROWS = 1024  # Rows of the common grid processed at once by the out-of-core mosaic steps
+HISTOGRAM_BINS = 4096  # Bins of the streaming percentile estimator; error <= (max - min) / bins
+# Index channels appended after blue, green, red and NIR in every patch, in this order.
+# Available: ndvi, ndmi, evi, savi, ndre. NDVI is required (it is the health target); the
+# model's channel count and NDVI position are derived from this list (src/config/globals.py),
+# so checkpoints trained with another list cannot be loaded.
+# 'ndre' needs the Sentinel-2 red-edge band (B05); Landsat products are skipped when it is enabled.
+SPECTRAL_INDICES = ['ndvi', 'ndmi']
+
+# --- Cropland Mask ---
+# 'stac' queries the Planetary Computer catalog; a path to a local LULC GeoTIFF
+# (or a directory of them) replaces it on nodes without internet access.
+LULC_SOURCE = 'stac'
+LULC_CACHE_DIR = os.path.join(PROCESSED_DATA_DIR, 'lulc_cache')
+
+# --- Parallel Execution ---
+NUM_WORKERS = max(1, (os.cpu_count() or 1) - 1)  # Processes running date-level tasks
+MEMORY_BUDGET_GB = 16  # Upper bound on the combined working set of concurrently running tasks
+BYTES_PER_GRID_PIXEL = 16  # Estimated peak RAM of one date task per common-grid pixel
+TEXTURE_BATCH_SIZE = 64  # NIR patches per GLCM task in the texture stage
 
 # --- Metadata (must match folder names in your input data) ---
 EVENT_METADATA = {
@@ -0,0 +1,80 @@
+"""
+Dataset indexer.
+
+Writes dataset_index.csv at the root of the patch store directory: one row
+per (event, patch) with the patch's grid coordinates, how many dates (and
+which first/last date) its event store covers, the store file and the patch
+shape. Only each store's index.json and .npy header are read, so indexing is
+instant, and the dataset classes build their sample lists from this file
+instead of opening every store. Rerun it (run_pipeline.py does so
+automatically) whenever stores are rebuilt.
+
+Example usage from the terminal in the project's root directory:
+> python src/data_preprocessing/create_dataset_csv.py --store-dir data/patch_store
+"""
+import os
+import sys
+import csv
+import json
+import argparse
+
+# --- Make the project structure import-aware ---
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(SRC_DIR))
+
+import numpy as np
+
+from data_preprocessing.config import PATCH_STORE_DIR, EVENT_METADATA
+from dataset.patch_store import STORE_FILENAME, INDEX_FILENAME, DATASET_INDEX_FILENAME, DATASET_INDEX_COLUMNS
+
+def index_event_store(store_dir, event_name):
+    """Returns the dataset index rows of one event store, or [] if it has none."""
+    store_event_dir = os.path.join(store_dir, event_name)
+    store_path = os.path.join(store_event_dir, STORE_FILENAME)
+    if not os.path.isfile(store_path):
+        return []
+    with open(os.path.join(store_event_dir, INDEX_FILENAME)) as f:
+        index = json.load(f)
+    # Only the .npy header is read: memory-mapping does not touch the data
+    num_dates, num_patches, height, width, channels = np.load(store_path, mmap_mode='r').shape
+
+    dates = index.get('dates') or [''] * num_dates
+    # Stores converted from MATLAB output carry no patch grid coordinates
+    coords = index.get('coords') or [[-1, -1]] * num_patches
+    return [{
+        'event': event_name, 'patch_idx': patch_idx, 'y_idx': y_idx, 'x_idx': x_idx,
+        'num_dates': num_dates, 'first_date': dates[0], 'last_date': dates[-1],
+        'file': os.path.join(event_name, STORE_FILENAME), 'height': height, 'width': width, 'channels': channels,
+    } for patch_idx, (y_idx, x_idx) in enumerate(coords)]
+
+def write_dataset_index(store_dir, event_names):
+    """Indexes every listed event store in store_dir. Returns the number of rows written."""
+    rows = []
+    for event_name in event_names:
+        try:
+            event_rows = index_event_store(store_dir, event_name)
+        except Exception as e:
+            print(f"  Warning: Could not index {event_name}. Error: {e}")
+            continue
+        if event_rows:
+            print(f"  {event_name}: {event_rows[0]['num_dates']} dates x {len(event_rows)} patches.")
+        rows.extend(event_rows)
+
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, DATASET_INDEX_FILENAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=DATASET_INDEX_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+    return len(rows)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Index the patch stores for fast dataset construction.")
+    parser.add_argument('--store-dir', type=str, default=PATCH_STORE_DIR,
+                        help='Directory containing one patch store folder per event.')
+    args = parser.parse_args()
+
+    num_rows = write_dataset_index(args.store_dir, EVENT_METADATA.keys())
+    print(f"Dataset index with {num_rows} patches saved to: {os.path.join(os.path.abspath(args.store_dir), DATASET_INDEX_FILENAME)}")
@@ -4,6 +4,7 @@ the final 6-channel patch array, saving each valid patch as a separate .mat file
 This approach is highly memory-efficient for very large datasets.
 """
 import os
+import time
 import numpy as np
 import scipy.io
 from PIL import Image, ImageDraw
@@ -23,13 +24,14 @@ def create_and_save_individual_patches(temp_band_paths, date_str, patch_size, ou
 
     print(f"    Slicing {date_str} data into individual {patch_size}x{patch_size} patch files...")
     
+    start_time = time.perf_counter()
     try:
-        # Load the first band to get the dimensions of the full image
-        first_band = np.load(temp_band_paths[0])
-        height, width = first_band.shape
-        num_channels = len(temp_band_paths)
+        # Memory-map every band once; only the rows of the current patch strip are paged in
+        bands = [np.load(band_path, mmap_mode='r') for band_path in temp_band_paths]
+        height, width = bands[0].shape
+        num_channels = len(bands)
     except Exception as e:
-        print(f"      ERROR: Could not load temporary band file to get dimensions. {e}")
+        print(f"      ERROR: Could not load temporary band files. {e}")
         return
         
     patches_y = height // patch_size
@@ -39,40 +41,35 @@ def create_and_save_individual_patches(temp_band_paths, date_str, patch_size, ou
         print("      -> No full patches could be extracted. Skipping.")
         return
 
-    saved_patch_count = 0
-    # Load NIR band (index 3) once to efficiently check for valid patches
-    nir_band_data = np.load(temp_band_paths[3])
-    
-    # Loop through the grid of potential patch locations
-    for y_idx in range(patches_y):
-        for x_idx in range(patches_x):
-            start_y, start_x = y_idx * patch_size, x_idx * patch_size
-            
-            # Use the pre-loaded NIR band to check if this patch is valid cropland
-            nir_patch_slice = nir_band_data[start_y:start_y+patch_size, start_x:start_x+patch_size]
-            
-            # If the patch is more than 90% empty (non-cropland), we skip it
-            if np.count_nonzero(nir_patch_slice) / nir_patch_slice.size < 0.1:
-                continue
+    # Check every grid cell at once using a block view of the NIR band (index 3):
+    # (patches_y, patch_size, patches_x, patch_size) -> non-zero fraction per cell
+    nir_blocks = bands[3][:patches_y * patch_size, :patches_x * patch_size].reshape(patches_y, patch_size, patches_x, patch_size)
+    coverage = np.count_nonzero(nir_blocks, axis=(1, 3)) / (patch_size * patch_size)
+    # If the patch is more than 90% empty (non-cropland), we skip it
+    valid_cells = coverage >= 0.1
 
-            # --- If the patch is valid, we build the full 6-channel data for it ---
-            
-            # Pre-allocate memory for just one small 6-channel patch
-            full_patch = np.zeros((patch_size, patch_size, num_channels), dtype=np.float32)
-            
-            for c, band_path in enumerate(temp_band_paths):
-                # Load the full band from disk
-                band_data = np.load(band_path)
-                # Slice out just the small piece we need for this patch
-                full_patch[:, :, c] = band_data[start_y:start_y+patch_size, start_x:start_x+patch_size]
-            
-            # Save this single, complete patch to its own .mat file
+    saved_patch_count = 0
+    # Cut all valid patches of one strip of rows in a single pass over each band
+    for y_idx in np.flatnonzero(valid_cells.any(axis=1)):
+        x_indices = np.flatnonzero(valid_cells[y_idx])
+        start_y = y_idx * patch_size
+        
+        strip_patches = np.empty((len(x_indices), patch_size, patch_size, num_channels), dtype=np.float32)
+        for c, band in enumerate(bands):
+            strip = band[start_y:start_y+patch_size, :patches_x * patch_size].reshape(patch_size, patches_x, patch_size)
+            strip_patches[..., c] = strip[:, x_indices, :].transpose(1, 0, 2)
+        
+        # Save each single, complete patch to its own .mat file
+        for full_patch, x_idx in zip(strip_patches, x_indices):
             patch_filename = f"patch_{y_idx}_{x_idx}.mat"
             output_mat_path = os.path.join(output_dir_for_patches, patch_filename)
             scipy.io.savemat(output_mat_path, {'patch_data': full_patch})
             saved_patch_count += 1
+    del bands, nir_blocks
             
-    print(f"      -> Filtered and saved {saved_patch_count} valid cropland patches to '{date_str}' directory.")
+    elapsed = time.perf_counter() - start_time
+    print(f"      -> Filtered and saved {saved_patch_count} valid cropland patches to '{date_str}' directory "
+          f"({saved_patch_count / max(elapsed, 1e-9):.1f} patches/s).")
 
     # --- Create Grid Visualization (shows ALL potential patch locations) ---
     # We only create the visualization if at least one patch was saved to avoid errors
@@ -3,6 +3,10 @@
 % This script runs AFTER the Python preprocessing pipeline. It reads the
 % 6-channel .mat files, calculates four GLCM texture features from the
 % NIR band, and saves a new, 10-channel .mat file.
+%
+% NOTE: run_pipeline.py now computes the same features natively
+% (texture.py) and writes them straight into the patch stores; this script
+% is kept for reference and for reproducing older MATLAB-enhanced data.
 
 clear; clc; close all;
 addpath(pwd); % Ensure functions in the same folder are accessible
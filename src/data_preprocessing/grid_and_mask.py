@@ -1,6 +1,6 @@
 """
-Task 1: Scans all satellite products for an event, determines the total
-geographic extent to define a universal common grid, and fetches a single
+Task 1: Uses the product index of an event to determine the total
+geographic extent, defines a universal common grid, and fetches a single
 cropland mask for that entire grid.
 """
 import os
@@ -9,54 +9,27 @@ from rasterio.warp import transform_bounds
 from rasterio.crs import CRS
 import numpy as np
 from PIL import Image
-import pystac_client
-import planetary_computer
 from rasterio.enums import Resampling
 from rasterio.warp import reproject
+from rasterio.transform import array_bounds
+from .config import NUM_WORKERS
+from .lulc_mask import StacLulcSource, load_cached_mask, save_cached_mask
+from .product_index import scan_products, all_products
 
-def define_event_grid_and_mask(event_raw_dir, viz_dir, event_name, target_resolution):
-    """Finds the union of all product bounds and creates a single grid and mask."""
-    print("Step 1: Defining a universal grid for the entire event...")
-    
-    # --- Find all reference bands to determine total extent ---
-    all_ref_bands = []
-    date_folders = [d for d in os.listdir(event_raw_dir) if os.path.isdir(os.path.join(event_raw_dir, d))]
-    for date_folder in date_folders:
-        date_folder_path = os.path.join(event_raw_dir, date_folder)
-        product_folders = [os.path.join(date_folder_path, d) for d in os.listdir(date_folder_path) if os.path.isdir(os.path.join(date_folder_path, d))]
-        for product_path in product_folders:
-            ref_band_path = None
-            try:
-                if "S2" in os.path.basename(product_path):
-                    granule = [f for f in os.listdir(os.path.join(product_path, 'GRANULE')) if f.startswith('L2A')][0]
-                    parts = os.path.basename(product_path).split('_'); tile_id = parts[5]; date_time = parts[2]
-                    ref_band_path = os.path.join(product_path, 'GRANULE', granule, 'IMG_DATA', 'R10m', f'{tile_id}_{date_time}_B04_10m.jp2')
-                else: # Landsat
-                    all_files = os.listdir(product_path)
-                    ref_band_filename = [f for f in all_files if f.endswith('_SR_B4.TIF')][0]
-                    ref_band_path = os.path.join(product_path, ref_band_filename)
-                
-                if ref_band_path and os.path.exists(ref_band_path):
-                    all_ref_bands.append(ref_band_path)
-            except (IndexError, FileNotFoundError):
-                print(f"  - Warning: Could not find a reference band in {os.path.basename(product_path)}")
-                continue
-    
-    if not all_ref_bands:
+CROPLAND_CLASS = 5  # 'Crops' in the io-lulc-9-class legend
+
+def define_event_grid(products, target_resolution):
+    """Finds the union of all product bounds (from the product index) and creates a single grid."""
+    if not products:
         print("  ERROR: No valid satellite products with reference bands found. Cannot define grid.")
-        return None, None
+        return None
 
     # --- Calculate the union of all bounds ---
-    min_x, min_y, max_x, max_y = float('inf'), float('inf'), float('-inf'), float('-inf')
-    target_crs = None
-    for band_path in all_ref_bands:
-        with rasterio.open(band_path) as src:
-            min_x = min(min_x, src.bounds.left)
-            min_y = min(min_y, src.bounds.bottom)
-            max_x = max(max_x, src.bounds.right)
-            max_y = max(max_y, src.bounds.top)
-            if target_crs is None:
-                target_crs = src.crs
+    min_x = min(product['bounds'][0] for product in products)
+    min_y = min(product['bounds'][1] for product in products)
+    max_x = max(product['bounds'][2] for product in products)
+    max_y = max(product['bounds'][3] for product in products)
+    target_crs = CRS.from_wkt(products[0]['crs'])
 
     # --- Create the common grid based on the union ---
     target_transform = rasterio.transform.from_origin(min_x, max_y, target_resolution, target_resolution)
@@ -65,33 +38,58 @@ def define_event_grid_and_mask(event_raw_dir, viz_dir, event_name, target_resolu
     target_shape = (target_height, target_width)
     common_grid = (target_crs, target_transform, target_shape)
     print(f"  -> Universal grid created with shape: {target_shape}")
+    return common_grid
 
-    # --- Fetch Cropland Mask for the entire grid ---
-    print("Step 2: Fetching universal cropland mask...")
+def _read_cropland_mask(common_grid, mask_source):
+    """Reads and mosaics the LULC rasters over the grid; returns None if the source has none."""
+    target_crs, target_transform, target_shape = common_grid
+    min_x, min_y, max_x, max_y = array_bounds(target_shape[0], target_shape[1], target_transform)
     wgs84_bounds = transform_bounds(target_crs, CRS.from_epsg(4326), min_x, min_y, max_x, max_y)
-    
-    catalog = pystac_client.Client.open("https://planetarycomputer.microsoft.com/api/stac/v1", modifier=planetary_computer.sign_inplace)
-    search = catalog.search(collections=["io-lulc-9-class"], bbox=wgs84_bounds)
-    
-    # CRITICAL FIX: Use the .items() iterator to handle large queries page by page
-    items_iterator = search.items()
-    first_item = next(items_iterator, None) # Get the first result
+    lulc_hrefs = mask_source.hrefs(wgs84_bounds)
 
-    if not first_item:
-        print("  -> WARNING: No Land Use/Land Cover data found. Using a full mask.")
-        cropland_mask = np.ones(target_shape, dtype=bool)
-    else:
-        lulc_href = first_item.assets["data"].href
+    if not lulc_hrefs:
+        return None
+
+    # Mosaic every LULC raster overlapping the grid; 0 is the LULC no-data class
+    mask_reprojected = None
+    for lulc_href in lulc_hrefs:
         with rasterio.open(lulc_href) as lulc_src:
-            mask_reprojected = np.empty(target_shape, dtype=lulc_src.dtypes[0])
+            tile_reprojected = np.zeros(target_shape, dtype=lulc_src.dtypes[0])
             reproject(
-                source=rasterio.band(lulc_src, 1), destination=mask_reprojected,
+                source=rasterio.band(lulc_src, 1), destination=tile_reprojected,
                 src_transform=lulc_src.transform, src_crs=lulc_src.crs,
                 dst_transform=target_transform, dst_crs=target_crs,
-                resampling=Resampling.nearest
+                dst_nodata=0, resampling=Resampling.nearest
             )
-        cropland_mask = (mask_reprojected == 5)
-        print(f"  -> SUCCESS: Cropland mask fetched. {np.sum(cropland_mask) / cropland_mask.size:.2%} of the area is cropland.")
+        if mask_reprojected is None:
+            mask_reprojected = tile_reprojected
+        else:
+            np.copyto(mask_reprojected, tile_reprojected, where=tile_reprojected != 0)
+        del tile_reprojected
+    cropland_mask = (mask_reprojected == CROPLAND_CLASS)
+    del mask_reprojected
+    print(f"  -> SUCCESS: Cropland mask fetched from {len(lulc_hrefs)} LULC raster(s). {np.sum(cropland_mask) / cropland_mask.size:.2%} of the area is cropland.")
+    return cropland_mask
+
+def fetch_cropland_mask(common_grid, viz_dir, event_name, mask_source=None, cache_dir=None):
+    """
+    Fetches the LULC cropland mask reprojected onto the common grid.
+    Masks are served from cache_dir when present, otherwise read from
+    mask_source (the STAC catalog by default) and cached.
+    """
+    target_crs, target_transform, target_shape = common_grid
+    if mask_source is None:
+        mask_source = StacLulcSource()
+    cropland_mask = load_cached_mask(cache_dir, common_grid, mask_source.cache_id) if cache_dir else None
+    if cropland_mask is not None:
+        print(f"  -> Cropland mask loaded from cache. {np.count_nonzero(cropland_mask) / cropland_mask.size:.2%} of the area is cropland.")
+    else:
+        cropland_mask = _read_cropland_mask(common_grid, mask_source)
+        if cache_dir and cropland_mask is not None:
+            save_cached_mask(cache_dir, common_grid, mask_source.cache_id, cropland_mask)
+    if cropland_mask is None:
+        print("  -> WARNING: No Land Use/Land Cover data found. Using a full mask.")
+        cropland_mask = np.ones(target_shape, dtype=bool)
 
     # --- Visualization ---
     mask_viz_path = os.path.join(viz_dir, f"{event_name}_00_universal_cropland_mask.png")
@@ -100,5 +98,16 @@ def define_event_grid_and_mask(event_raw_dir, viz_dir, event_name, target_resolu
     img.save(mask_viz_path)
     print(f"  -> Mask visualization saved to: {os.path.basename(mask_viz_path)}")
     
-    return common_grid, cropland_mask
+    return cropland_mask
+
+def define_event_grid_and_mask(event_raw_dir, viz_dir, event_name, target_resolution, mask_source=None, cache_dir=None):
+    """Finds the union of all product bounds and creates a single grid and mask."""
+    print("Step 1: Defining a universal grid for the entire event...")
+    products = all_products(scan_products(event_raw_dir, NUM_WORKERS))
+    common_grid = define_event_grid(products, target_resolution)
+    if common_grid is None:
+        return None, None
+
+    print("Step 2: Fetching universal cropland mask...")
+    return common_grid, fetch_cropland_mask(common_grid, viz_dir, event_name, mask_source, cache_dir)
 
@@ -0,0 +1,99 @@
+"""
+Sources and on-disk cache for the LULC cropland mask.
+
+The mask is read from a pluggable source: the Planetary Computer STAC catalog
+('io-lulc-9-class'), or a local LULC GeoTIFF / directory of GeoTIFFs for
+air-gapped nodes. Once reprojected onto a common grid, the cropland mask is
+stored bit-packed in a content-addressed cache keyed by the source and the
+grid's (CRS, transform, shape), so later runs on the same grid never touch the
+source again.
+"""
+import os
+import glob
+import json
+import hashlib
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.warp import transform_bounds
+
+STAC_URL = "https://planetarycomputer.microsoft.com/api/stac/v1"
+LULC_COLLECTION = "io-lulc-9-class"
+
+class StacLulcSource:
+    """
+    LULC rasters found by a STAC search (the Planetary Computer catalog by default).
+
+    io-lulc-9-class has one item per tile and year; only the latest year of
+    each tile is used.
+    """
+    def __init__(self, url=STAC_URL, collection=LULC_COLLECTION):
+        self.url = url
+        self.collection = collection
+        self.cache_id = f"stac:{url}:{collection}"
+
+    def hrefs(self, wgs84_bounds):
+        # Imported here so nodes using a local source do not need the STAC client libraries
+        import pystac_client
+        import planetary_computer
+
+        catalog = pystac_client.Client.open(self.url, modifier=planetary_computer.sign_inplace)
+        search = catalog.search(collections=[self.collection], bbox=wgs84_bounds)
+        # Use the .items() iterator to handle large queries page by page
+        latest = {}
+        for item in search.items():
+            tile = item.properties.get('io:tile_id', item.id)
+            year = item.properties.get('start_datetime') or item.properties.get('datetime') or ''
+            if tile not in latest or year > latest[tile][0]:
+                latest[tile] = (year, item.assets["data"].href)
+        return [href for _, href in latest.values()]
+
+class LocalLulcSource:
+    """LULC rasters from a local GeoTIFF, or every GeoTIFF in a local directory."""
+    def __init__(self, path):
+        self.path = path
+        self.cache_id = f"local:{os.path.abspath(path)}"
+
+    def hrefs(self, wgs84_bounds):
+        if os.path.isfile(self.path):
+            candidates = [self.path]
+        else:
+            candidates = sorted(glob.glob(os.path.join(self.path, '*.tif')) + glob.glob(os.path.join(self.path, '*.tiff')))
+
+        west, south, east, north = wgs84_bounds
+        hrefs = []
+        for path in candidates:
+            with rasterio.open(path) as src:
+                left, bottom, right, top = transform_bounds(src.crs, CRS.from_epsg(4326), *src.bounds)
+            if left < east and right > west and bottom < north and top > south:
+                hrefs.append(path)
+        return hrefs
+
+def get_mask_source(spec):
+    """Returns the mask source for a config value: 'stac', or a path to a GeoTIFF or directory."""
+    if spec == 'stac':
+        return StacLulcSource()
+    return LocalLulcSource(spec)
+
+def grid_key(common_grid, source_id):
+    """Content address of a mask source's mask on a common grid."""
+    target_crs, target_transform, target_shape = common_grid
+    payload = json.dumps([source_id, target_crs.to_wkt(), list(target_transform)[:6], list(target_shape)])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def load_cached_mask(cache_dir, common_grid, source_id):
+    """Returns the cached cropland mask of a source for a grid, or None on a cache miss."""
+    path = os.path.join(cache_dir, f"{grid_key(common_grid, source_id)}.npy")
+    if not os.path.exists(path):
+        return None
+    target_shape = common_grid[2]
+    packed = np.load(path)
+    return np.unpackbits(packed, count=target_shape[0] * target_shape[1]).reshape(target_shape).astype(bool)
+
+def save_cached_mask(cache_dir, common_grid, source_id, cropland_mask):
+    """Stores a cropland mask bit-packed (1 bit per pixel) under its source and grid's key."""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{grid_key(common_grid, source_id)}.npy")
+    tmp_path = f"{path}.tmp{os.getpid()}.npy"
+    np.save(tmp_path, np.packbits(cropland_mask, axis=None))
+    os.replace(tmp_path, path)
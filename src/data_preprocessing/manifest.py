@@ -0,0 +1,95 @@
+"""
+Per-event manifest for incremental preprocessing.
+
+The manifest records what each date's outputs were built from: a fingerprint
+of the input product files (paths, sizes, mtimes), the common grid and the
+pipeline settings. On a rerun, dates whose entry still matches and whose
+patch files are still on disk are skipped, dates whose raw folder is gone are
+dropped, and the grid and cropland mask are reused while their inputs are unchanged.
+"""
+import os
+import json
+import hashlib
+from .config import PATCH_SIZE, TARGET_RESOLUTION, SPECTRAL_INDICES
+
+MANIFEST_FILENAME = 'manifest.json'
+
+def pipeline_config():
+    """Settings that change the content of a date's outputs."""
+    return {'patch_size': PATCH_SIZE, 'target_resolution': TARGET_RESOLUTION, 'spectral_indices': list(SPECTRAL_INDICES)}
+
+def fingerprint_files(file_paths):
+    """
+    Hash of the (path, size, mtime) of every file; changes if any file is added,
+    removed or rewritten. A missing file hashes as such, so it is a cache miss
+    rather than an error.
+    """
+    entries = []
+    for path in sorted(file_paths):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            entries.append([path, None, None])
+            continue
+        entries.append([path, st.st_size, st.st_mtime_ns])
+    return hashlib.sha1(json.dumps(entries).encode()).hexdigest()
+
+def grid_to_dict(common_grid):
+    target_crs, target_transform, target_shape = common_grid
+    return {'crs': target_crs.to_wkt(), 'transform': list(target_transform)[:6], 'shape': list(target_shape)}
+
+def grid_from_dict(grid):
+    # Imported here so the manifest bookkeeping itself does not need rasterio
+    from rasterio.crs import CRS
+    from rasterio.transform import Affine
+    return (CRS.from_wkt(grid['crs']), Affine(*grid['transform']), tuple(grid['shape']))
+
+def grid_hash(grid):
+    return hashlib.sha1(json.dumps(grid, sort_keys=True).encode()).hexdigest()
+
+def load_manifest(event_processed_dir):
+    """Loads an event's manifest, or returns an empty one if none exists yet."""
+    path = os.path.join(event_processed_dir, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return {'grid': None, 'grid_inputs': None, 'dates': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(event_processed_dir, manifest):
+    """Writes the manifest atomically so an interrupted run never leaves it half-written."""
+    path = os.path.join(event_processed_dir, MANIFEST_FILENAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def date_entry(products_fingerprint, grid):
+    """The manifest entry describing the inputs of one date's outputs."""
+    return {'products': products_fingerprint, 'grid': grid_hash(grid), 'config': pipeline_config()}
+
+def count_patch_files(output_dir):
+    """Number of patch_<y>_<x>.mat files in a date's output folder."""
+    if not os.path.isdir(output_dir):
+        return 0
+    return sum(1 for f in os.listdir(output_dir) if f.startswith('patch_') and f.endswith('.mat'))
+
+def outputs_exist(recorded, output_dir):
+    """Whether the patch files recorded for a date are all still on disk."""
+    if not recorded.get('has_patches'):
+        return True
+    found = count_patch_files(output_dir)
+    # Entries written before 'num_patches' was recorded only promise some patches
+    return found > 0 and found == recorded.get('num_patches', found)
+
+def is_date_current(manifest, date_str, entry, output_dir):
+    """Whether a date's recorded outputs were built from exactly these inputs and are still on disk."""
+    recorded = manifest['dates'].get(date_str)
+    return (recorded is not None and all(recorded.get(key) == value for key, value in entry.items())
+            and outputs_exist(recorded, output_dir))
+
+def prune_dates(manifest, date_strs):
+    """Drops the entries of dates no longer among date_strs (raw input removed). Returns the dropped dates."""
+    removed = sorted(set(manifest['dates']) - set(date_strs))
+    for date_str in removed:
+        del manifest['dates'][date_str]
+    return removed
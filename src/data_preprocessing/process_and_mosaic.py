@@ -2,114 +2,164 @@
 Task 2 (Local Version): Processes raw satellite data using a memory-efficient
 iterative mosaicking approach and saves the final bands as separate temporary files.
 This is the definitive "out-of-core" version to handle massive datasets.
+
+Each product is reprojected only into the window of the common grid that its
+footprint covers, and accumulated into memory-mapped canvases on disk, so peak
+RAM scales with the size of one S2 tile or Landsat scene, not the event extent.
 """
 import os
 import glob
+import math
 import rasterio
 import numpy as np
+from rasterio.crs import CRS
 from rasterio.enums import Resampling
-from rasterio.warp import reproject
+from rasterio.warp import reproject, transform_bounds
+from rasterio.windows import Window
+from rasterio.windows import transform as window_transform
 from PIL import Image
-from .utils import create_false_color_composite, print_raster_stats
+from .config import BLOCK_ROWS, SPECTRAL_INDICES
+from .spectral_indices import compute_spectral_indices, required_bands
+from .utils import create_false_color_composite, histogram_percentiles, iter_row_blocks, print_raster_stats
+
+PATCH_BANDS = ['blue', 'green', 'red', 'nir']
+# SWIR1 always feeds the visualizations; further bands only when a configured index needs them
+BASE_BANDS = PATCH_BANDS + ['swir1']
+MOSAIC_BANDS = BASE_BANDS + [b for b in required_bands(SPECTRAL_INDICES) if b not in BASE_BANDS]
+S2_BAND_CODES = {'blue': 'B02', 'green': 'B03', 'red': 'B04', 'nir': 'B08', 'swir1': 'B11', 'rededge': 'B05'}
+LANDSAT_BAND_CODES = {'blue': 'SR_B2', 'green': 'SR_B3', 'red': 'SR_B4', 'nir': 'SR_B5', 'swir1': 'SR_B6'}
+
+def find_band_files(product_path):
+    """Returns a {band_name: file_path} dict with the bands found in a product folder."""
+    band_files = {}
+    if "S2" in os.path.basename(product_path):
+        granule_path_list = glob.glob(os.path.join(product_path, 'GRANULE', 'L2A*'))
+        if not granule_path_list: return band_files
+        granule_path = granule_path_list[0]
+        for band_name, s2_band_code in S2_BAND_CODES.items():
+            res_folder = 'R20m' if s2_band_code in ['B11', 'B05'] else 'R10m'
+            matches = glob.glob(os.path.join(granule_path, 'IMG_DATA', res_folder, f'*_{s2_band_code}_*.jp2'))
+            if matches:
+                band_files[band_name] = matches[0]
+    else: # Landsat
+        all_files = os.listdir(product_path)
+        for band_name, l8_band_code in LANDSAT_BAND_CODES.items():
+            matches = [f for f in all_files if f.endswith(f'_{l8_band_code}.TIF')]
+            if matches:
+                band_files[band_name] = os.path.join(product_path, matches[0])
+    return band_files
 
-def process_and_mosaic_daily_data(product_paths, common_grid, cropland_mask, viz_dir, date_str, temp_dir):
-    """Processes all products for one day and saves 6 temp band files."""
+def footprint_window(src_crs, src_bounds, common_grid):
+    """
+    Returns the window of the common grid covered by a source footprint, padded by
+    one pixel for the bilinear kernel, or None if the footprints do not intersect.
+    """
     target_crs, target_transform, target_shape = common_grid
-    
-    mosaic_canvas_5_band = np.zeros(target_shape + (5,), dtype=np.float32)
-    count_canvas = np.zeros(target_shape, dtype=np.uint8)
-
-    for product_path in product_paths:
-        if "S2" in os.path.basename(product_path):
-            band_map = {'blue': 'B02', 'green': 'B03', 'red': 'B04', 'nir': 'B08', 'swir1': 'B11'}
-        else:
-            band_map = {'blue': 'SR_B2', 'green': 'SR_B3', 'red': 'SR_B4', 'nir': 'SR_B5', 'swir1': 'SR_B6'}
-        
-        reprojected_bands = {}
-        if "S2" in os.path.basename(product_path):
-            granule_path_list = glob.glob(os.path.join(product_path, 'GRANULE', 'L2A*'))
-            if not granule_path_list: continue
-            granule_path = granule_path_list[0]
-            for band_name, s2_band_code in band_map.items():
-                res_folder = 'R20m' if s2_band_code in ['B11'] else 'R10m'
-                search_pattern = os.path.join(granule_path, 'IMG_DATA', res_folder, f'*_{s2_band_code}_*.jp2')
-                try:
-                    file_path = glob.glob(search_pattern)[0]
-                    with rasterio.open(file_path) as src:
-                        destination = np.empty(target_shape, dtype=np.float32)
-                        reproject(source=rasterio.band(src, 1), destination=destination, src_transform=src.transform, src_crs=src.crs, dst_transform=target_transform, dst_crs=target_crs, resampling=Resampling.bilinear)
-                        reprojected_bands[band_name] = destination
-                except IndexError: continue
-        else: # Landsat
-            all_files = os.listdir(product_path)
-            for band_name, l8_band_code in band_map.items():
-                try:
-                    band_filename = [f for f in all_files if f.endswith(f'_{l8_band_code}.TIF')][0]
-                    file_path = os.path.join(product_path, band_filename)
-                    with rasterio.open(file_path) as src:
-                        destination = np.empty(target_shape, dtype=np.float32)
-                        reproject(source=rasterio.band(src, 1), destination=destination, src_transform=src.transform, src_crs=src.crs, dst_transform=target_transform, dst_crs=target_crs, resampling=Resampling.bilinear)
-                        reprojected_bands[band_name] = destination
-                except IndexError: continue
-        
-        if len(reprojected_bands) == 5:
-            current_product_5_band = np.stack(list(reprojected_bands.values()), axis=-1)
-            valid_data_mask = np.any(current_product_5_band != 0, axis=2)
-            mosaic_canvas_5_band[valid_data_mask] += current_product_5_band[valid_data_mask]
-            count_canvas[valid_data_mask] += 1
-    
-    if np.sum(count_canvas) == 0: return None
-
-    count_canvas_expanded = np.expand_dims(count_canvas, axis=2)
-    np.place(count_canvas_expanded, count_canvas_expanded == 0, 1)
-    np.divide(mosaic_canvas_5_band, count_canvas_expanded, out=mosaic_canvas_5_band)
-    final_mosaic_5_band = mosaic_canvas_5_band
-    del mosaic_canvas_5_band, count_canvas, count_canvas_expanded
-
-    red_before, nir_before, swir1_before = [final_mosaic_5_band[:,:,i] for i in [2, 3, 4]]
-    false_color_before = create_false_color_composite(red_before, nir_before, swir1_before)
+    left, bottom, right, top = transform_bounds(src_crs, target_crs, *src_bounds)
+    col_a, row_a = ~target_transform * (left, top)
+    col_b, row_b = ~target_transform * (right, bottom)
+
+    row_start = max(int(math.floor(min(row_a, row_b))) - 1, 0)
+    row_stop = min(int(math.ceil(max(row_a, row_b))) + 1, target_shape[0])
+    col_start = max(int(math.floor(min(col_a, col_b))) - 1, 0)
+    col_stop = min(int(math.ceil(max(col_a, col_b))) + 1, target_shape[1])
+    if row_stop <= row_start or col_stop <= col_start:
+        return None
+    return Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+def process_and_mosaic_daily_data(products, common_grid, cropland_mask, viz_dir, date_str, temp_dir, warp_cache=None):
+    """
+    Processes all products for one day and saves the patch band files
+    (blue, green, red, NIR, then one per configured spectral index).
+    Products are records from the event's product index (see product_index.py).
+    If a WarpIndexCache is given, bands are resampled from its cached warp
+    indices instead of calling rasterio.warp.reproject.
+    """
+    target_crs, target_transform, target_shape = common_grid
+    height = target_shape[0]
+
+    # Memory-mapped canvases: one running sum per band plus a per-pixel product count
+    canvas_paths = {name: os.path.join(temp_dir, f"{date_str}_{name}.npy") for name in MOSAIC_BANDS}
+    count_path = os.path.join(temp_dir, f"{date_str}_count.npy")
+    canvases = {name: np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=target_shape)
+                for name, path in canvas_paths.items()}
+    count_canvas = np.lib.format.open_memmap(count_path, mode='w+', dtype=np.uint8, shape=target_shape)
+
+    for product in products:
+        band_files = product['bands']
+        missing_bands = [band_name for band_name in MOSAIC_BANDS if band_name not in band_files]
+        if missing_bands:
+            print(f"      WARNING: Skipping {os.path.basename(product['path'])}: no {', '.join(missing_bands)} band "
+                  f"(needed by SPECTRAL_INDICES {SPECTRAL_INDICES}).")
+            continue
+        window = footprint_window(CRS.from_wkt(product['crs']), product['bounds'], common_grid)
+        if window is None: continue
+        dst_transform = window_transform(window, target_transform)
+        rows, cols = window.toslices()
+
+        # Only this product's footprint is held in memory
+        current_product = np.zeros((len(MOSAIC_BANDS), window.height, window.width), dtype=np.float32)
+        for i, band_name in enumerate(MOSAIC_BANDS):
+            with rasterio.open(band_files[band_name]) as src:
+                if warp_cache is not None:
+                    warp_cache.resample(src, current_product[i], dst_transform, target_crs)
+                else:
+                    reproject(source=rasterio.band(src, 1), destination=current_product[i], src_transform=src.transform, src_crs=src.crs, dst_transform=dst_transform, dst_crs=target_crs, resampling=Resampling.bilinear)
+
+        valid_data_mask = np.any(current_product != 0, axis=0)
+        for i, band_name in enumerate(MOSAIC_BANDS):
+            canvas_window = canvases[band_name][rows, cols]
+            np.add(canvas_window, current_product[i], out=canvas_window, where=valid_data_mask)
+        count_canvas[rows, cols] += valid_data_mask
+        del current_product, valid_data_mask
+
+    if not count_canvas.any():
+        del canvases, count_canvas
+        for path in list(canvas_paths.values()) + [count_path]:
+            os.remove(path)
+        return None
+
+    for block in iter_row_blocks(height, BLOCK_ROWS):
+        counts = count_canvas[block].astype(np.float32)
+        np.place(counts, counts == 0, 1)
+        for name in MOSAIC_BANDS:
+            canvases[name][block] /= counts
+    del count_canvas
+    os.remove(count_path)
+
+    blue, green, red, nir, swir1 = [canvases[name] for name in BASE_BANDS]
+    false_color_before = create_false_color_composite(red, nir, swir1)
     Image.fromarray(false_color_before).save(os.path.join(viz_dir, f"{date_str}_01_before_mask.png"))
-    
-    final_mosaic_5_band *= cropland_mask[..., np.newaxis]
-    
-    for i in range(5):
-        channel = final_mosaic_5_band[:, :, i]
-        non_zero_vals = channel[channel > 0]
-        if non_zero_vals.size > 0:
-            p2, p98 = np.percentile(non_zero_vals, (2, 98))
-            np.clip(channel, p2, p98, out=channel)
-            if p98 > p2:
-                mask = channel > 0
-                channel[mask] = (channel[mask] - p2) / (p98 - p2)
-    
-    blue, green, red, nir, swir1 = [final_mosaic_5_band[:,:,i] for i in range(5)]
-    del final_mosaic_5_band
-    np.seterr(divide='ignore', invalid='ignore')
-    
-    numerator_ndvi = nir - red; denominator_ndvi = nir + red
-    np.place(denominator_ndvi, denominator_ndvi == 0, 1)
-    ndvi = numerator_ndvi / denominator_ndvi
-    del numerator_ndvi, denominator_ndvi
-
-    numerator_ndmi = nir - swir1; denominator_ndmi = nir + swir1
-    np.place(denominator_ndmi, denominator_ndmi == 0, 1)
-    ndmi = numerator_ndmi / denominator_ndmi
-    del numerator_ndmi, denominator_ndmi
-
-    np.nan_to_num(ndvi, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
-    np.nan_to_num(ndmi, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
-    
+    del false_color_before
+
+    for block in iter_row_blocks(height, BLOCK_ROWS):
+        for name in MOSAIC_BANDS:
+            canvases[name][block] *= cropland_mask[block]
+
+    for channel in canvases.values():
+        percentiles = histogram_percentiles(channel, (2, 98))
+        if percentiles is not None:
+            p2, p98 = percentiles
+            for block in iter_row_blocks(height, BLOCK_ROWS):
+                channel_block = channel[block]
+                np.clip(channel_block, p2, p98, out=channel_block)
+                if p98 > p2:
+                    mask = channel_block > 0
+                    channel_block[mask] = (channel_block[mask] - p2) / (p98 - p2)
+
+    index_paths = [os.path.join(temp_dir, f"{date_str}_{name}.npy") for name in SPECTRAL_INDICES]
+    compute_spectral_indices(canvases, SPECTRAL_INDICES, index_paths, BLOCK_ROWS)
+
     false_color_after = create_false_color_composite(red, nir, swir1)
     Image.fromarray(false_color_after).save(os.path.join(viz_dir, f"{date_str}_02_after_mask.png"))
+    del false_color_after
 
-    band_names = ['blue', 'green', 'red', 'nir', 'ndvi', 'ndmi']
-    bands_to_save = [blue, green, red, nir, ndvi, ndmi]
-    temp_file_paths = []
-    
-    for name, band_data in zip(band_names, bands_to_save):
-        temp_path = os.path.join(temp_dir, f"{date_str}_{name}.npy")
-        np.save(temp_path, band_data)
-        temp_file_paths.append(temp_path)
-    
-    return temp_file_paths
+    # Bands that only feed the indices and visualizations are not patch channels
+    for band in canvases.values():
+        band.flush()
+    del canvases, blue, green, red, nir, swir1
+    for name in MOSAIC_BANDS:
+        if name not in PATCH_BANDS:
+            os.remove(canvas_paths[name])
 
+    return [canvas_paths[name] for name in PATCH_BANDS] + index_paths
@@ -0,0 +1,116 @@
+"""
+Persistent per-event index of the raw satellite products.
+
+Every stage used to walk the raw folders again and open reference bands just
+to read their bounds. The index records, for each product, its date, sensor,
+band file paths and the bounds, CRS, transform and shape of its reference
+(red) band. It is built once with a thread pool and stored next to the
+processed outputs; on later runs only date folders whose modification time
+changed, products whose band files were replaced or removed, and products
+that were incomplete last time, are described again.
+"""
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+import rasterio
+from .process_and_mosaic import find_band_files, BASE_BANDS, S2_BAND_CODES, LANDSAT_BAND_CODES
+from .manifest import fingerprint_files
+
+INDEX_FILENAME = 'product_index.json'
+
+def is_product_folder(name):
+    """Sentinel-2 .SAFE folders and Landsat Collection 2 (LC0x) scene folders."""
+    return 'SAFE' in name or 'LC0' in name
+
+def describe_product(date_str, product_path):
+    """Returns the index record of one product, or None if it lacks any base band."""
+    band_files = find_band_files(product_path)
+    if any(band_name not in band_files for band_name in BASE_BANDS):
+        return None
+    with rasterio.open(band_files['red']) as src:
+        return {
+            'date': date_str,
+            'path': product_path,
+            'sensor': 'S2' if "S2" in os.path.basename(product_path) else 'Landsat',
+            'bands': band_files,
+            'fingerprint': fingerprint_files(band_files.values()),
+            'bounds': list(src.bounds),
+            'crs': src.crs.to_wkt(),
+            'transform': list(src.transform)[:6],
+            'shape': list(src.shape),
+        }
+
+def load_product_index(event_processed_dir):
+    path = os.path.join(event_processed_dir, INDEX_FILENAME)
+    if not os.path.exists(path):
+        return {'dates': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_product_index(event_processed_dir, index):
+    path = os.path.join(event_processed_dir, INDEX_FILENAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, path)
+
+def scan_products(event_raw_dir, num_workers, previous=None):
+    """
+    Builds the product index of an event, reusing the entries of date folders
+    that are unchanged since the previous index.
+
+    Returns:
+        dict: {'band_codes': {...}, 'dates': {date_str: {'mtime': int,
+               'products': [record, ...], 'incomplete': [product_path, ...]}}}
+    """
+    # Records list the bands known when they were written; re-describe everything if that changed
+    band_codes = {'S2': S2_BAND_CODES, 'Landsat': LANDSAT_BAND_CODES}
+    previous_dates = previous['dates'] if previous and previous.get('band_codes') == band_codes else {}
+    index = {'band_codes': band_codes, 'dates': {}}
+    to_describe = []
+    for date_str in sorted(os.listdir(event_raw_dir)):
+        date_folder_path = os.path.join(event_raw_dir, date_str)
+        if not os.path.isdir(date_folder_path): continue
+        mtime = os.stat(date_folder_path).st_mtime_ns
+
+        cached = previous_dates.get(date_str)
+        if cached and cached['mtime'] == mtime:
+            # Band files live in product subfolders, whose changes the date folder's mtime does not show
+            products, product_paths = [], list(cached['incomplete'])
+            for record in cached['products']:
+                if record.get('fingerprint') == fingerprint_files(record['bands'].values()):
+                    products.append(record)
+                elif os.path.isdir(record['path']):
+                    product_paths.append(record['path'])
+            index['dates'][date_str] = {'mtime': mtime, 'products': products, 'incomplete': []}
+        else:
+            index['dates'][date_str] = {'mtime': mtime, 'products': [], 'incomplete': []}
+            product_paths = [os.path.join(date_folder_path, pf) for pf in sorted(os.listdir(date_folder_path)) if is_product_folder(pf)]
+        to_describe.extend((date_str, product_path) for product_path in product_paths)
+
+    # Describing a product is dominated by filesystem latency, so threads suffice
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        records = list(executor.map(lambda args: describe_product(*args), to_describe))
+
+    for (date_str, product_path), record in zip(to_describe, records):
+        if record is None:
+            print(f"  - Warning: Incomplete product {os.path.basename(product_path)} ({date_str}); it will be re-checked next run.")
+            index['dates'][date_str]['incomplete'].append(product_path)
+        else:
+            index['dates'][date_str]['products'].append(record)
+    for entry in index['dates'].values():
+        entry['products'].sort(key=lambda record: record['path'])
+
+    print(f"  -> Product index: {sum(len(e['products']) for e in index['dates'].values())} products over "
+          f"{len(index['dates'])} dates ({len(to_describe)} described this run).")
+    return index
+
+def build_product_index(event_raw_dir, event_processed_dir, num_workers):
+    """Updates and persists the product index of an event."""
+    index = scan_products(event_raw_dir, num_workers, load_product_index(event_processed_dir))
+    save_product_index(event_processed_dir, index)
+    return index
+
+def all_products(index):
+    """Flat list of the product records of every date."""
+    return [record for entry in index['dates'].values() for record in entry['products']]
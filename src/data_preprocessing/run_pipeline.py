@@ -1,23 +1,38 @@
 """
 Main Orchestrator for the Local Preprocessing Pipeline.
 This is the definitive "out-of-core" version that will not exceed RAM.
+Reruns are incremental: each event's manifest.json records what every date
+was built from, and only new or changed dates (or dates whose patch files
+have gone missing) are processed again. Dates whose raw folder was removed
+are dropped from the manifest and from the event's patch store.
 """
 import os
 import shutil
 import sys
-from collections import defaultdict
 
 # --- Make the project structure import-aware ---
 SRC_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.dirname(SRC_DIR))
 
-from data_preprocessing.config import RAW_DATA_DIR, PROCESSED_DATA_DIR, EVENT_METADATA, PATCH_SIZE, TARGET_RESOLUTION
-from data_preprocessing.grid_and_mask import define_event_grid_and_mask
-from data_preprocessing.process_and_mosaic import process_and_mosaic_daily_data
-from data_preprocessing.create_patches import create_and_save_individual_patches
+import numpy as np
+
+from data_preprocessing.config import (RAW_DATA_DIR, PROCESSED_DATA_DIR, PATCH_STORE_DIR, EVENT_METADATA, PATCH_SIZE,
+                                       TARGET_RESOLUTION, SPECTRAL_INDICES, LULC_SOURCE, LULC_CACHE_DIR, NUM_WORKERS,
+                                       MEMORY_BUDGET_GB, TEXTURE_BATCH_SIZE)
+from data_preprocessing.grid_and_mask import define_event_grid, fetch_cropland_mask
+from data_preprocessing.lulc_mask import get_mask_source
+from data_preprocessing.product_index import build_product_index, all_products
+from data_preprocessing.manifest import (load_manifest, save_manifest, fingerprint_files, grid_to_dict, grid_from_dict,
+                                         date_entry, is_date_current, prune_dates, count_patch_files)
+from data_preprocessing.process_and_mosaic import PATCH_BANDS, MOSAIC_BANDS, LANDSAT_BAND_CODES
+from data_preprocessing.scheduler import run_date_tasks
+from data_preprocessing.texture import TEXTURE_FEATURES, add_texture_features
+from data_preprocessing.create_dataset_csv import write_dataset_index
+from dataset.patch_store import STORE_FILENAME, TEXTURE_FILENAME, build_event_store_from_patches
 
 if __name__ == '__main__':
-    # A temporary directory for storing intermediate band files to save RAM
+    # A temporary directory for storing intermediate band files to save RAM;
+    # each worker process writes to its own subdirectory of it
     TEMP_DIR = os.path.join(PROCESSED_DATA_DIR, 'temp_bands')
     if os.path.exists(TEMP_DIR):
         shutil.rmtree(TEMP_DIR) # Clean up from any previous runs
@@ -25,6 +40,15 @@ if __name__ == '__main__':
     
     os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
     
+    unavailable = [band for band in MOSAIC_BANDS if band not in LANDSAT_BAND_CODES]
+    if unavailable:
+        print(f"WARNING: SPECTRAL_INDICES {SPECTRAL_INDICES} needs the {', '.join(unavailable)} band(s), which Landsat "
+              f"products do not have; every Landsat product will be skipped.")
+
+    mask_source = get_mask_source(LULC_SOURCE)
+    date_tasks = []
+    manifests = {}
+    pruned_events = set()
     for event_name in EVENT_METADATA.keys():
         print(f"\n{'='*20} Processing Event: {event_name} {'='*20}")
         event_raw_dir = os.path.join(RAW_DATA_DIR, event_name)
@@ -37,34 +61,114 @@ if __name__ == '__main__':
             print(f"  Raw data directory not found for {event_name}. Skipping.")
             continue
         
-        # --- Task 1: Define Universal Grid and Mask for the entire event ---
-        common_grid, cropland_mask = define_event_grid_and_mask(event_raw_dir, viz_dir, event_name, TARGET_RESOLUTION)
-        if common_grid is None:
-            print(f"  Could not define grid for {event_name}. Skipping event.")
+        manifest = load_manifest(event_processed_dir)
+        manifests[event_name] = manifest
+        mask_path = os.path.join(event_processed_dir, 'cropland_mask.npy')
+
+        # --- Index the raw products once; every later stage reads from the index ---
+        product_index = build_product_index(event_raw_dir, event_processed_dir, NUM_WORKERS)
+        products = all_products(product_index)
+
+        # --- Forget dates whose raw folder is gone, so they are not packed again ---
+        removed_dates = prune_dates(manifest, product_index['dates'])
+        if removed_dates:
+            for date_str in removed_dates:
+                shutil.rmtree(os.path.join(event_processed_dir, date_str), ignore_errors=True)
+            save_manifest(event_processed_dir, manifest)
+            pruned_events.add(event_name)
+            print(f"  -> Dropped {len(removed_dates)} dates with no raw data: {', '.join(removed_dates)}")
+
+        # --- Task 1: Define Universal Grid and Mask for the entire event (reused while inputs are unchanged) ---
+        print("Step 1: Defining a universal grid for the entire event...")
+        ref_bands = [product['bands']['red'] for product in products]
+        grid_inputs = {'files': fingerprint_files(ref_bands), 'target_resolution': TARGET_RESOLUTION,
+                       'lulc_source': mask_source.cache_id}
+        if manifest['grid'] and manifest['grid_inputs'] == grid_inputs and os.path.exists(mask_path):
+            common_grid = grid_from_dict(manifest['grid'])
+            print(f"  -> Reusing cached grid with shape: {common_grid[2]}")
+        else:
+            common_grid = define_event_grid(products, TARGET_RESOLUTION)
+            if common_grid is None:
+                print(f"  Could not define grid for {event_name}. Skipping event.")
+                continue
+            mask_source_changed = (manifest['grid_inputs'] or {}).get('lulc_source') != mask_source.cache_id
+            if grid_to_dict(common_grid) != manifest['grid'] or mask_source_changed or not os.path.exists(mask_path):
+                print("Step 2: Fetching universal cropland mask...")
+                # Workers memory-map the mask instead of each receiving a pickled copy
+                np.save(mask_path, fetch_cropland_mask(common_grid, viz_dir, event_name, mask_source, LULC_CACHE_DIR))
+            else:
+                print("  -> Grid unchanged, reusing cached cropland mask.")
+            manifest['grid'] = grid_to_dict(common_grid)
+            manifest['grid_inputs'] = grid_inputs
+            save_manifest(event_processed_dir, manifest)
+
+        # --- Queue one task (Task 2: Process, Mosaic, and Mask -> Task 3: Create Patches) per new or changed date ---
+        queued = 0
+        date_folders = sorted(product_index['dates'])
+        for date_str in date_folders:
+            date_products = product_index['dates'][date_str]['products']
+            band_files = [f for product in date_products for f in product['bands'].values()]
+            entry = date_entry(fingerprint_files(band_files), manifest['grid'])
+            output_dir = os.path.join(event_processed_dir, date_str)
+            if is_date_current(manifest, date_str, entry, output_dir):
+                continue
+
+            # Outputs built from other inputs, or partly deleted, are stale; drop them before rebuilding
+            manifest['dates'].pop(date_str, None)
+            if os.path.isdir(output_dir):
+                shutil.rmtree(output_dir)
+            date_tasks.append({
+                'event_name': event_name,
+                'date_str': date_str,
+                'products': date_products,
+                'common_grid': common_grid,
+                'mask_path': mask_path,
+                # Warp indices are reused across bands and dates of this event (kept between runs)
+                'warp_cache_dir': os.path.join(event_processed_dir, 'warp_cache'),
+                'viz_dir': viz_dir,
+                'output_dir': output_dir,
+                'patch_size': PATCH_SIZE,
+                'temp_root': TEMP_DIR,
+                'manifest_entry': entry,
+            })
+            queued += 1
+        save_manifest(event_processed_dir, manifest)
+        print(f"  -> Queued {queued} new or changed dates for {event_name} ({len(date_folders) - queued} up to date).")
+
+    def record_date(task, has_patches):
+        """Marks a finished date as current in its event's manifest."""
+        manifest = manifests[task['event_name']]
+        manifest['dates'][task['date_str']] = dict(task['manifest_entry'], has_patches=has_patches,
+                                                   num_patches=count_patch_files(task['output_dir']))
+        save_manifest(os.path.join(PROCESSED_DATA_DIR, task['event_name']), manifest)
+
+    # --- Run all date tasks in parallel ---
+    print(f"\n{'='*20} Processing {len(date_tasks)} Dates with {NUM_WORKERS} Workers {'='*20}")
+    run_date_tasks(date_tasks, NUM_WORKERS, MEMORY_BUDGET_GB, on_task_done=record_date)
+
+    # --- Task 4: Pack updated events into patch stores and add GLCM texture features ---
+    updated_events = {task['event_name'] for task in date_tasks} | pruned_events
+    channel_names = PATCH_BANDS + SPECTRAL_INDICES
+    for event_name, manifest in manifests.items():
+        store_event_dir = os.path.join(PATCH_STORE_DIR, event_name)
+        if event_name not in updated_events and os.path.exists(os.path.join(store_event_dir, STORE_FILENAME)):
+            continue
+        dates = sorted(d for d, entry in manifest['dates'].items() if entry.get('has_patches'))
+        if not dates:
+            if os.path.isdir(store_event_dir):
+                print(f"\n  {event_name} has no dates with patches left; removing its patch store.")
+                shutil.rmtree(store_event_dir)
             continue
+        print(f"\n  Packing {event_name} ({len(dates)} dates) into its patch store...")
+        build_event_store_from_patches(os.path.join(PROCESSED_DATA_DIR, event_name), dates, store_event_dir, channel_names,
+                                       extra_index={'grid': manifest['grid'], 'patch_size': PATCH_SIZE,
+                                                    'texture_features': TEXTURE_FEATURES})
+        add_texture_features(os.path.join(store_event_dir, STORE_FILENAME), os.path.join(store_event_dir, TEXTURE_FILENAME),
+                             NUM_WORKERS, TEXTURE_BATCH_SIZE)
 
-        # --- Group all products by date ---
-        products_by_date = defaultdict(list)
-        date_folders = sorted([d for d in os.listdir(event_raw_dir) if os.path.isdir(os.path.join(event_raw_dir, d))])
-        for date_folder in date_folders:
-            date_folder_path = os.path.join(event_raw_dir, date_folder)
-            product_folders = [os.path.join(date_folder_path, pf) for pf in os.listdir(date_folder_path)]
-            products_by_date[date_folder].extend(product_folders)
-            
-        # --- Loop through each date and process its data ---
-        for i, date_str in enumerate(date_folders):
-            print(f"\n  Processing timestep {i+1}/{len(date_folders)} (Date: {date_str})...")
-            product_paths = [p for p in products_by_date[date_str] if 'SAFE' in p or 'LC0' in p]
-            
-            # --- Task 2: Process, Mosaic, and Mask ---
-            # CRITICAL FIX: Pass the TEMP_DIR path to the function
-            temp_band_paths = process_and_mosaic_daily_data(product_paths, common_grid, cropland_mask, viz_dir, date_str, TEMP_DIR)
-            
-            # --- Task 3: Create Individual Patches ---
-            if temp_band_paths:
-                output_dir_for_patches = os.path.join(event_processed_dir, date_str)
-                os.makedirs(output_dir_for_patches, exist_ok=True)
-                create_and_save_individual_patches(temp_band_paths, date_str, PATCH_SIZE, output_dir_for_patches, viz_dir)
+    # --- Index the patch stores for the dataset classes ---
+    print("\nIndexing patch stores...")
+    write_dataset_index(PATCH_STORE_DIR, EVENT_METADATA.keys())
 
     # --- Final Cleanup ---
     print("\nCleaning up temporary files...")
@@ -72,5 +176,6 @@ if __name__ == '__main__':
         shutil.rmtree(TEMP_DIR)
     
     print(f"\n{'='*20} PREPROCESSING COMPLETE {'='*20}")
-    print(f"Final data saved as individual .mat patch files in: {os.path.abspath(PROCESSED_DATA_DIR)}")
+    print(f"Individual .mat patch files saved in: {os.path.abspath(PROCESSED_DATA_DIR)}")
+    print(f"Final {len(channel_names)}-channel patch stores (plus texture features) saved in: {os.path.abspath(PATCH_STORE_DIR)}")
 
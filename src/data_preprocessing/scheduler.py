@@ -0,0 +1,98 @@
+"""
+Parallel execution engine for the date-level pipeline tasks.
+
+Every date of every event is an independent mosaic -> patches task once the
+event grid and cropland mask exist. Tasks run in a process pool; a memory
+budget limits how many full-grid tasks are in flight at once, and each worker
+process writes its intermediate band files to its own directory under the
+shared temp directory.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from .config import BYTES_PER_GRID_PIXEL
+from .process_and_mosaic import process_and_mosaic_daily_data
+from .create_patches import create_and_save_individual_patches
+from .warp_cache import WarpIndexCache
+
+def estimate_task_memory(target_shape):
+    """Estimated peak RAM in bytes of one date task on a grid of the given shape."""
+    return target_shape[0] * target_shape[1] * BYTES_PER_GRID_PIXEL
+
+def process_date_task(task):
+    """
+    Runs mosaic -> patches for one date. Executed inside a worker process.
+
+    Args:
+        task (dict): Holds 'event_name', 'date_str', 'products',
+            'common_grid', 'mask_path', 'warp_cache_dir', 'viz_dir',
+            'output_dir', 'patch_size' and 'temp_root'.
+
+    Returns:
+        bool: Whether any patches were produced for the date.
+    """
+    temp_dir = os.path.join(task['temp_root'], f"worker_{os.getpid()}")
+    os.makedirs(temp_dir, exist_ok=True)
+    cropland_mask = np.load(task['mask_path'], mmap_mode='r')
+    warp_cache = WarpIndexCache(task['warp_cache_dir'])
+
+    temp_band_paths = process_and_mosaic_daily_data(task['products'], task['common_grid'], cropland_mask,
+                                                    task['viz_dir'], task['date_str'], temp_dir, warp_cache)
+    if not temp_band_paths:
+        return False
+
+    os.makedirs(task['output_dir'], exist_ok=True)
+    create_and_save_individual_patches(temp_band_paths, task['date_str'], task['patch_size'], task['output_dir'], task['viz_dir'])
+    # Free the worker's scratch space before its next task
+    for path in temp_band_paths:
+        os.remove(path)
+    return True
+
+def run_date_tasks(tasks, num_workers, memory_budget_gb, on_task_done=None):
+    """
+    Runs date tasks concurrently on a process pool.
+
+    A task is only submitted while the estimated memory of all running tasks
+    stays within memory_budget_gb, so large grids run with fewer tasks in
+    flight. One task is always allowed to run, even if it alone exceeds the budget.
+    If given, on_task_done(task, has_patches) is called in the main process
+    as each task succeeds.
+
+    Returns:
+        dict: Maps (event_name, date_str) to True/False for completed tasks,
+              or to the exception raised by a failed task.
+    """
+    budget = memory_budget_gb * 1024 ** 3
+    pending = list(tasks)
+    running = {}
+    results = {}
+    start_time = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        while pending or running:
+            in_flight = sum(mem for _, mem in running.values())
+            while pending and len(running) < num_workers:
+                task_memory = estimate_task_memory(pending[0]['common_grid'][2])
+                if running and in_flight + task_memory > budget:
+                    break
+                task = pending.pop(0)
+                future = executor.submit(process_date_task, task)
+                running[future] = (task, task_memory)
+                in_flight += task_memory
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                task, _ = running.pop(future)
+                key = (task['event_name'], task['date_str'])
+                try:
+                    results[key] = future.result()
+                    if on_task_done is not None:
+                        on_task_done(task, results[key])
+                    print(f"  [{len(results)}/{len(tasks)}] Finished {task['event_name']} {task['date_str']}.")
+                except Exception as e:
+                    results[key] = e
+                    print(f"  [{len(results)}/{len(tasks)}] ERROR in {task['event_name']} {task['date_str']}: {e}")
+
+    print(f"  -> {len(tasks)} date tasks finished in {time.perf_counter() - start_time:.1f}s using up to {num_workers} workers.")
+    return results
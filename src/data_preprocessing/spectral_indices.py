@@ -0,0 +1,87 @@
+"""
+Spectral-index stage of the mosaic step.
+
+Indices are computed row block by row block straight into preallocated,
+memory-mapped output files. Each formula is fused into in-place NumPy calls
+on the block and one reusable scratch buffer, so adding an index adds one
+output file but no full-scene temporaries.
+"""
+import numpy as np
+from .utils import iter_row_blocks
+
+def _normalized_difference(band_a, band_b):
+    """(a - b) / (a + b); where a + b == 0 the difference is kept, as before."""
+    def compute(bands, out, scratch):
+        a, b = bands[band_a], bands[band_b]
+        np.subtract(a, b, out=out)
+        np.add(a, b, out=scratch)
+        np.divide(out, scratch, out=out, where=scratch != 0)
+    return compute
+
+def _evi(bands, out, scratch):
+    """2.5 * (NIR - Red) / (NIR + 6 * Red - 7.5 * Blue + 1)"""
+    nir, red, blue = bands['nir'], bands['red'], bands['blue']
+    np.multiply(red, 6.0, out=scratch)
+    scratch += nir
+    np.multiply(blue, 7.5, out=out)
+    scratch -= out
+    scratch += 1.0
+    np.subtract(nir, red, out=out)
+    out *= 2.5
+    np.divide(out, scratch, out=out, where=scratch != 0)
+
+def _savi(bands, out, scratch, soil_factor=0.5):
+    """(1 + L) * (NIR - Red) / (NIR + Red + L)"""
+    nir, red = bands['nir'], bands['red']
+    np.add(nir, red, out=scratch)
+    scratch += soil_factor
+    np.subtract(nir, red, out=out)
+    out *= 1.0 + soil_factor
+    np.divide(out, scratch, out=out, where=scratch != 0)
+
+# name -> (bands the formula reads, fused block formula)
+INDEX_FORMULAS = {
+    'ndvi': (('nir', 'red'), _normalized_difference('nir', 'red')),
+    'ndmi': (('nir', 'swir1'), _normalized_difference('nir', 'swir1')),
+    'ndre': (('nir', 'rededge'), _normalized_difference('nir', 'rededge')),
+    'evi': (('nir', 'red', 'blue'), _evi),
+    'savi': (('nir', 'red'), _savi),
+}
+
+def required_bands(index_names):
+    """Bands needed by the given indices, in first-use order."""
+    bands = []
+    for name in index_names:
+        if name not in INDEX_FORMULAS:
+            raise ValueError(f"Unknown spectral index '{name}'. Available: {sorted(INDEX_FORMULAS)}")
+        bands.extend(b for b in INDEX_FORMULAS[name][0] if b not in bands)
+    return bands
+
+def compute_spectral_indices(bands, index_names, output_paths, block_rows):
+    """
+    Computes each index into a float32 .npy file at the matching output path.
+
+    Args:
+        bands (dict): Band name -> (H, W) array, typically memory-mapped.
+        index_names (list): Indices to compute, e.g. ['ndvi', 'ndmi'].
+        output_paths (list): One .npy path per index.
+        block_rows (int): Rows processed per block.
+    """
+    needed = required_bands(index_names)
+    height, width = bands[needed[0]].shape
+    outputs = [np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(height, width)) for path in output_paths]
+    scratch = np.empty((min(block_rows, height), width), dtype=np.float32)
+
+    # Division by zero is masked out explicitly; silence only NaN inputs, and only here
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for block in iter_row_blocks(height, block_rows):
+            band_blocks = {name: bands[name][block] for name in needed}
+            block_scratch = scratch[:block.stop - block.start]
+            for name, output in zip(index_names, outputs):
+                out = output[block]
+                INDEX_FORMULAS[name][1](band_blocks, out, block_scratch)
+                np.nan_to_num(out, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+
+    for output in outputs:
+        output.flush()
+    del outputs
@@ -0,0 +1,119 @@
+"""
+Task 4: GLCM texture features, replacing the MATLAB enhancement pass
+(enhanced_matlab.m).
+
+For every patch the NIR band is rescaled to uint8 like mat2gray, quantized to
+graycomatrix's default 8 grey levels, and the Contrast, Correlation, Energy
+and Homogeneity of the co-occurrence matrices for the offsets
+[0 1; -1 1; -1 0; -1 -1] are averaged, as graycoprops would compute them.
+Whole batches of patches are processed with vectorized NumPy, batches are
+spread over a process pool, and the results are written straight into the
+event's patch store as one small per-patch feature vector.
+"""
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+TEXTURE_FEATURES = ['contrast', 'correlation', 'energy', 'homogeneity']
+GLCM_OFFSETS = ((0, 1), (-1, 1), (-1, 0), (-1, -1)) # (row, col) offsets, as in enhanced_matlab.m
+NUM_LEVELS = 8 # graycomatrix default 'NumLevels'
+NIR_CHANNEL = 3
+
+def quantize_nir(nir_patches):
+    """
+    Maps each (H, W) patch to grey levels 0..NUM_LEVELS-1 the way
+    uint8(255 * mat2gray(nir)) followed by graycomatrix's default scaling
+    (GrayLimits [0 255], round(I * (NL - 1) / 255)) does. Constant patches
+    become all zeros.
+    """
+    x = nir_patches.astype(np.float64)
+    low = x.min(axis=(1, 2), keepdims=True)
+    value_range = x.max(axis=(1, 2), keepdims=True) - low
+    scaled = np.where(value_range > 0, (x - low) / np.where(value_range > 0, value_range, 1), 0)
+    # uint8() rounds half away from zero; values are non-negative here
+    nir_uint8 = np.floor(scaled * 255 + 0.5)
+    return np.floor(nir_uint8 * (NUM_LEVELS - 1) / 255 + 0.5).astype(np.int64)
+
+def glcm_counts(levels, row_offset, col_offset):
+    """Non-symmetric co-occurrence counts (B, L, L) for one offset over a batch of quantized patches."""
+    batch, height, width = levels.shape
+    r0, r1 = max(0, -row_offset), height - max(0, row_offset)
+    c0, c1 = max(0, -col_offset), width - max(0, col_offset)
+    reference = levels[:, r0:r1, c0:c1]
+    neighbour = levels[:, r0 + row_offset:r1 + row_offset, c0 + col_offset:c1 + col_offset]
+    # One bincount for the whole batch: each patch gets its own L*L block of codes
+    codes = reference * NUM_LEVELS + neighbour + (np.arange(batch) * NUM_LEVELS * NUM_LEVELS)[:, None, None]
+    return np.bincount(codes.ravel(), minlength=batch * NUM_LEVELS * NUM_LEVELS).reshape(batch, NUM_LEVELS, NUM_LEVELS)
+
+def glcm_properties(counts):
+    """graycoprops' Contrast, Correlation, Energy and Homogeneity for a batch of GLCMs, shape (B, 4)."""
+    p = counts / counts.sum(axis=(1, 2), keepdims=True)
+    i = np.arange(1, NUM_LEVELS + 1, dtype=np.float64)[:, None]
+    j = np.arange(1, NUM_LEVELS + 1, dtype=np.float64)[None, :]
+
+    contrast = (p * (i - j) ** 2).sum(axis=(1, 2))
+    mean_r = (p * i).sum(axis=(1, 2), keepdims=True)
+    mean_c = (p * j).sum(axis=(1, 2), keepdims=True)
+    std_r = np.sqrt((p * (i - mean_r) ** 2).sum(axis=(1, 2)))
+    std_c = np.sqrt((p * (j - mean_c) ** 2).sum(axis=(1, 2)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # NaN for constant patches, as in MATLAB
+        correlation = (p * (i - mean_r) * (j - mean_c)).sum(axis=(1, 2)) / (std_r * std_c)
+    energy = (p ** 2).sum(axis=(1, 2))
+    homogeneity = (p / (1 + np.abs(i - j))).sum(axis=(1, 2))
+    return np.stack([contrast, correlation, energy, homogeneity], axis=1)
+
+def glcm_features(nir_patches):
+    """
+    Direction-averaged texture features for a batch of NIR patches.
+
+    Args:
+        nir_patches (np.ndarray): (B, H, W) NIR values.
+
+    Returns:
+        np.ndarray: (B, 4) float32 Contrast, Correlation, Energy, Homogeneity;
+                    all zeros for all-zero (missing data) patches.
+    """
+    levels = quantize_nir(nir_patches)
+    stats = [glcm_properties(glcm_counts(levels, dr, dc)) for dr, dc in GLCM_OFFSETS]
+    features = np.mean(stats, axis=0).astype(np.float32)
+    features[~nir_patches.any(axis=(1, 2))] = 0
+    return features
+
+def add_texture_features(store_path, texture_path, num_workers, batch_size):
+    """
+    Computes texture features for every (date, patch) of an event's patch store
+    (the patches .npy file at store_path) and writes them as one
+    (dates, patches, 4) float32 array to texture_path, instead of the four
+    constant planes enhanced_matlab.m appended to every patch.
+    Undefined correlations (constant patches) are stored as 0 rather than
+    MATLAB's NaN so they cannot poison training.
+    """
+    patches = np.load(store_path, mmap_mode='r')
+    num_dates, num_patches = patches.shape[:2]
+    texture = np.zeros((num_dates, num_patches, len(TEXTURE_FEATURES)), dtype=np.float32)
+    start_time = time.perf_counter()
+
+    def write(job, features):
+        d, start = job
+        texture[d, start:start + len(features)] = np.nan_to_num(features, nan=0.0)
+
+    # Keep a bounded number of batches in flight so only a few are held in memory
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        in_flight = deque()
+        for d in range(num_dates):
+            for start in range(0, num_patches, batch_size):
+                nir_batch = np.array(patches[d, start:start + batch_size, :, :, NIR_CHANNEL])
+                in_flight.append(((d, start), executor.submit(glcm_features, nir_batch)))
+                if len(in_flight) >= 2 * num_workers:
+                    job, future = in_flight.popleft()
+                    write(job, future.result())
+        while in_flight:
+            job, future = in_flight.popleft()
+            write(job, future.result())
+
+    del patches
+    np.save(texture_path, texture)
+    total = num_dates * num_patches
+    print(f"      -> Texture features for {total} patches ({total / max(time.perf_counter() - start_time, 1e-9):.1f} patches/s).")
@@ -1,9 +1,17 @@
 """
 Utility functions shared across the preprocessing pipeline.
-This version uses memory-efficient, NaN-ignoring functions for statistics.
+This version uses memory-efficient, NaN-ignoring functions for statistics
+and streaming, histogram-based percentiles for normalization.
 """
 import numpy as np
 import os
+from .config import BLOCK_ROWS, HISTOGRAM_BINS
+
+def iter_row_blocks(height, block_rows):
+    """Yields row slices that cover [0, height) in blocks of at most block_rows rows."""
+    for start in range(0, height, block_rows):
+        yield slice(start, min(start + block_rows, height))
+
 
 def print_raster_stats(data_array, name=""):
     """
@@ -44,24 +52,60 @@ def print_raster_stats(data_array, name=""):
         print(f"    - Overall: Mean={mean_val:.4f}, Max={max_val:.4f}, Min={min_val:.4f}, Std={std_val:.4f}")
 
 
-def create_false_color_composite(red, nir, swir1):
-    """Creates a visually intuitive false-color image (vegetation is red)."""
-    def normalize(band):
-        """A memory-efficient normalization function for visualization."""
-        band = np.nan_to_num(band) # nan_to_num is fine here as it's called on a single band
-        non_zero_vals = band[band > 0]
-        if non_zero_vals.size == 0:
-            return np.zeros_like(band, dtype=np.uint8)
-        
-        p2, p98 = np.percentile(non_zero_vals, (2, 98))
-        p2, p98 = np.float32(p2), np.float32(p98)
-        band_32 = band.astype(np.float32)
-        clipped = np.clip(band_32, p2, p98)
-        
-        if p98 > p2:
-            normalized = (clipped - p2) / (p98 - p2)
-            return (normalized * 255).astype(np.uint8)
-        return np.zeros_like(band, dtype=np.uint8)
+def histogram_percentiles(band, percentiles, bins=HISTOGRAM_BINS, block_rows=BLOCK_ROWS):
+    """
+    Estimates percentiles of the positive values of a (possibly memory-mapped)
+    band without sorting or copying it. Two passes over row blocks find the
+    value range and accumulate a fixed-bin histogram; each percentile is then
+    interpolated linearly inside its bin, so the absolute error is at most one
+    bin width, (max - min) / bins.
 
-    return np.stack([normalize(swir1), normalize(nir), normalize(red)], axis=-1)
+    Returns:
+        list: One float per requested percentile, or None if the band has no positive values.
+    """
+    height = band.shape[0]
+    low, high = np.inf, -np.inf
+    for block in iter_row_blocks(height, block_rows):
+        values = band[block]
+        values = values[values > 0]
+        if values.size:
+            low = min(low, float(values.min()))
+            high = max(high, float(values.max()))
+    if low > high:
+        return None
+    if low == high:
+        return [low for _ in percentiles]
+
+    hist = np.zeros(bins, dtype=np.int64)
+    for block in iter_row_blocks(height, block_rows):
+        values = band[block]
+        hist += np.histogram(values[values > 0], bins=bins, range=(low, high))[0]
+
+    cdf = np.cumsum(hist)
+    bin_width = (high - low) / bins
+    results = []
+    for q in percentiles:
+        rank = q / 100 * cdf[-1]
+        idx = min(int(np.searchsorted(cdf, rank, side='left')), bins - 1)
+        below = cdf[idx - 1] if idx > 0 else 0
+        fraction = (rank - below) / hist[idx] if hist[idx] else 0.0
+        results.append(float(low + (idx + fraction) * bin_width))
+    return results
 
+
+def create_false_color_composite(red, nir, swir1):
+    """Creates a visually intuitive false-color image (vegetation is red)."""
+    composite = np.zeros(red.shape + (3,), dtype=np.uint8)
+    for c, band in enumerate((swir1, nir, red)):
+        # Percentiles come from a streaming histogram; the band is then scaled block by block
+        percentiles = histogram_percentiles(band, (2, 98))
+        if percentiles is None:
+            continue
+        p2, p98 = np.float32(percentiles[0]), np.float32(percentiles[1])
+        if not p98 > p2:
+            continue
+        for block in iter_row_blocks(band.shape[0], BLOCK_ROWS):
+            band_32 = np.nan_to_num(band[block].astype(np.float32)) # nan_to_num is fine here as it's called on one block
+            np.clip(band_32, p2, p98, out=band_32)
+            composite[block, :, c] = ((band_32 - p2) / (p98 - p2) * 255).astype(np.uint8)
+    return composite
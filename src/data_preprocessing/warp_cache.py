@@ -0,0 +1,131 @@
+"""
+Per-event cache of bilinear warp indices onto the common grid.
+
+The same Sentinel-2 tiles and Landsat path/rows appear on many dates, and all
+bands of a product at the same resolution share one geometry. Instead of
+recomputing the coordinate transform inside rasterio.warp.reproject for every
+band of every date, the source pixel position of every destination pixel is
+computed once per (source CRS, transform, shape) -> destination window and
+kept on disk. Later bands and dates are then resampled with a vectorized gather.
+"""
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from rasterio.warp import transform as warp_transform
+from .config import BLOCK_ROWS
+from .utils import iter_row_blocks
+
+INDEX_ARRAYS = ('row0', 'col0', 'frac_y', 'frac_x')
+
+def warp_key(src_crs, src_transform, src_shape, dst_crs, dst_transform, dst_shape):
+    """Content hash identifying one source geometry -> destination window mapping."""
+    payload = json.dumps([
+        src_crs.to_wkt(), list(src_transform)[:6], list(src_shape),
+        dst_crs.to_wkt(), list(dst_transform)[:6], list(dst_shape),
+    ])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+class WarpIndexCache:
+    """
+    Stores, for every destination pixel, the top-left source pixel of its
+    bilinear neighbourhood (row0, col0) and the fractional offsets (frac_y,
+    frac_x). Destination pixels outside the source footprint have row0 = -1.
+    """
+    def __init__(self, cache_dir, block_rows=BLOCK_ROWS):
+        self.cache_dir = cache_dir
+        self.block_rows = block_rows
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _load(self, entry_dir):
+        return {name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode='r') for name in INDEX_ARRAYS}
+
+    def _build(self, entry_dir, src_crs, src_transform, src_shape, dst_crs, dst_transform, dst_shape):
+        src_height, src_width = src_shape
+        tmp_dir = f"{entry_dir}.tmp{os.getpid()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        arrays = {
+            name: np.lib.format.open_memmap(os.path.join(tmp_dir, f"{name}.npy"), mode='w+',
+                                            dtype=np.int32 if name in ('row0', 'col0') else np.float32,
+                                            shape=dst_shape)
+            for name in INDEX_ARRAYS
+        }
+
+        cols = np.arange(dst_shape[1]) + 0.5
+        for block in iter_row_blocks(dst_shape[0], self.block_rows):
+            # Destination pixel centres -> destination CRS -> source CRS -> source pixel space
+            grid_cols, grid_rows = np.meshgrid(cols, np.arange(block.start, block.stop) + 0.5)
+            xs, ys = dst_transform * (grid_cols, grid_rows)
+            if src_crs != dst_crs:
+                xs, ys = warp_transform(dst_crs, src_crs, xs.ravel(), ys.ravel())
+                xs = np.asarray(xs).reshape(grid_cols.shape)
+                ys = np.asarray(ys).reshape(grid_cols.shape)
+            u, v = ~src_transform * (xs, ys)
+            # Bilinear sampling works between pixel centres
+            u, v = u - 0.5, v - 0.5
+
+            inside = (u >= -0.5) & (u < src_width - 0.5) & (v >= -0.5) & (v < src_height - 0.5)
+            u = np.clip(u, 0, src_width - 1)
+            v = np.clip(v, 0, src_height - 1)
+            col0 = np.minimum(np.floor(u), max(src_width - 2, 0)).astype(np.int32)
+            row0 = np.minimum(np.floor(v), max(src_height - 2, 0)).astype(np.int32)
+            row0[~inside] = -1
+
+            arrays['row0'][block] = row0
+            arrays['col0'][block] = col0
+            arrays['frac_y'][block] = v - row0
+            arrays['frac_x'][block] = u - col0
+
+        for array in arrays.values():
+            array.flush()
+        del arrays
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another worker finished the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def get(self, src_crs, src_transform, src_shape, dst_crs, dst_transform, dst_shape):
+        """Returns the warp index arrays for a mapping, building them on first use."""
+        key = warp_key(src_crs, src_transform, src_shape, dst_crs, dst_transform, dst_shape)
+        entry_dir = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry_dir):
+            self._build(entry_dir, src_crs, src_transform, src_shape, dst_crs, dst_transform, dst_shape)
+        return self._load(entry_dir)
+
+    def resample(self, src, destination, dst_transform, dst_crs):
+        """
+        Bilinearly resamples band 1 of an open rasterio dataset into destination.
+        Source nodata pixels are excluded from the kernel and the remaining
+        weights renormalised; pixels with no valid neighbour are set to 0.
+        """
+        index = self.get(src.crs, src.transform, src.shape, dst_crs, dst_transform, destination.shape)
+        data = src.read(1)
+        nodata = src.nodata
+
+        for block in iter_row_blocks(destination.shape[0], self.block_rows):
+            row0 = np.asarray(index['row0'][block])
+            col0 = np.asarray(index['col0'][block])
+            fy = np.asarray(index['frac_y'][block])
+            fx = np.asarray(index['frac_x'][block])
+            inside = row0 >= 0
+            row0 = np.where(inside, row0, 0)
+
+            result = np.zeros(row0.shape, dtype=np.float32)
+            weight_sum = np.zeros(row0.shape, dtype=np.float32)
+            # In a source one pixel tall or wide the second neighbour is the first one again
+            row1 = np.minimum(row0 + 1, data.shape[0] - 1)
+            col1 = np.minimum(col0 + 1, data.shape[1] - 1)
+            for rows, wy in ((row0, 1 - fy), (row1, fy)):
+                for cols, wx in ((col0, 1 - fx), (col1, fx)):
+                    values = data[rows, cols].astype(np.float32)
+                    weight = wy * wx
+                    if nodata is not None:
+                        weight = np.where(values == nodata, 0, weight)
+                    result += weight * values
+                    weight_sum += weight
+
+            np.divide(result, weight_sum, out=result, where=weight_sum > 0)
+            result[~inside | (weight_sum == 0)] = 0
+            destination[block] = result
@@ -1,38 +1,159 @@
 """
 PyTorch Dataset classes for loading and preparing the preprocessed
-MATLAB-enhanced .mat files.
+MATLAB-enhanced patches from the packed, memory-mapped patch stores
+(see src/dataset/patch_store.py).
+
+Texture statistics are stored once per (date, patch). By default they are fed
+through the tabular path; with config.TEXTURE_MODE == 'planes' they are
+expanded back into constant image channels for 10-channel checkpoints.
+
+The IoT, crop and disease features depend only on the event, so they are
+scaled and one-hot encoded once per event when a dataset is built and every
+sample of that event shares the same float32 tensor.
+
+Sample lists come from the store directory's dataset index
+(src/data_preprocessing/create_dataset_csv.py); events missing from it, or
+indexed before their store was rebuilt, are read from the store itself.
+
+Stores are memory-mapped lazily and the maps are dropped when a dataset is
+pickled, so every DataLoader worker opens its own maps instead of receiving
+a copy of the data.
 """
 import os
+import json
 import numpy as np
-import scipy.io
-from torch.utils.data import Dataset
+import torch
+from torch.utils.data import Dataset, Subset
 from src.config import globals as config
+from src.dataset.patch_store import STORE_FILENAME, open_event_store, open_event_texture, load_dataset_index
+
+SPLIT_FILENAME = 'train_val_split.json' # In config.OUTPUT_MODEL_DIR, written by train.py
+
+def save_split(path, dataset, train_indices, val_indices):
+    """
+    Records the training and validation samples of a dataset by (event,
+    patch_idx), so quantization and benchmarks can evaluate on held-out data.
+    """
+    def sample_keys(indices):
+        return [[dataset.samples[i]['event'], int(dataset.samples[i]['patch_idx'])] for i in indices]
+    with open(path, 'w') as f:
+        json.dump({'train': sample_keys(train_indices), 'val': sample_keys(val_indices)}, f)
+
+def load_split(path, dataset):
+    """
+    The (train, val) Subsets of a dataset recorded by save_split. Samples the
+    split does not mention (e.g. from events added since) are in neither.
+    """
+    with open(path) as f:
+        split = json.load(f)
+    positions = {(sample['event'], int(sample['patch_idx'])): i for i, sample in enumerate(dataset.samples)}
+    return tuple(Subset(dataset, [positions[tuple(key)] for key in split[name] if tuple(key) in positions])
+                 for name in ('train', 'val'))
+
+def check_image_channels(patches):
+    """Rejects a store whose image channels do not match config.SPECTRAL_INDICES."""
+    if patches.shape[-1] != config.NUM_IMAGE_CHANNELS:
+        raise ValueError(f"the store has {patches.shape[-1]} image channels, but SPECTRAL_INDICES "
+                         f"{config.SPECTRAL_INDICES} needs {config.NUM_IMAGE_CHANNELS}")
+
+def load_event_texture(event_store_dir, patches):
+    """The event's (dates, patches, 4) texture features, or zeros if the store has none."""
+    texture = open_event_texture(event_store_dir)
+    if texture is None:
+        print(f"Warning: No texture features in {event_store_dir}; using zeros.")
+        texture = np.zeros(patches.shape[:2] + (config.NUM_TEXTURE_FEATURES,), dtype=np.float32)
+    return texture
+
+def build_tabular_sequence(event_name, iot_data, scalers, encoders, n_steps, start=0):
+    """
+    Scales the event's IoT readings and appends its one-hot crop and disease
+    encodings to every timestep. Readings are one per store date; the window
+    covers dates start .. start + n_steps - 1, like the image sequence.
+
+    Returns:
+        torch.Tensor: (n_steps, F) float32 tabular features of the event.
+    """
+    meta = config.EVENT_METADATA[event_name]
+    readings = iot_data[event_name][start:start + n_steps]
+    if len(readings) < n_steps:
+        raise ValueError(f"{event_name} has {len(iot_data[event_name])} IoT readings; dates {start} to "
+                         f"{start + n_steps - 1} need one each.")
+    iot_normalized = scalers['iot'].transform(readings)
+    crop_encoded = encoders['crop'].transform([[meta['crop_type']]])
+    disease_encoded = encoders['disease'].transform([[meta['disease']]])
+    features = np.concatenate([iot_normalized,
+                               np.repeat(crop_encoded, len(iot_normalized), axis=0),
+                               np.repeat(disease_encoded, len(iot_normalized), axis=0)], axis=1)
+    return torch.from_numpy(features.astype(np.float32))
+
+def add_texture_planes(images, texture):
+    """Appends (N, 4) texture features to (N, H, W, C) images as constant channels."""
+    planes = np.broadcast_to(texture[:, None, None, :], images.shape[:3] + texture.shape[-1:])
+    return np.concatenate([images, planes], axis=-1).astype(np.float32, copy=False)
+
+def combine_texture(img_sequence, tabular_sequence, texture_sequence):
+    """
+    Attaches a (T, 4) texture sequence to a (T, H, W, C) image sequence and the
+    event's shared (T, F) tabular tensor according to config.TEXTURE_MODE.
+
+    Returns:
+        tuple: X_img (T, C, H, W) and X_tabular (T, F') float32 tensors.
+    """
+    texture_sequence = np.asarray(texture_sequence, dtype=np.float32)
+    if config.TEXTURE_MODE == 'planes':
+        img_input = add_texture_planes(img_sequence, texture_sequence)
+        return torch.from_numpy(img_input).permute(0, 3, 1, 2), tabular_sequence
+    X_img = torch.from_numpy(np.array(img_sequence, dtype=np.float32)).permute(0, 3, 1, 2)
+    return X_img, torch.cat([tabular_sequence, torch.from_numpy(texture_sequence)], dim=1)
 
 class LocalSequenceDataset(Dataset):
     """Dataset for training and validation."""
-    def __init__(self, data_dir, event_metadata, iot_data, scalers, encoders):
-        self.iot_data = iot_data
-        self.scalers = scalers
-        self.encoders = encoders
+    def __init__(self, store_dir, event_metadata, iot_data, scalers, encoders):
         self.n_steps_in = config.N_STEPS_IN
         self.total_timesteps = config.N_STEPS_IN + config.N_STEPS_OUT
-        self.samples = self._create_samples(data_dir, event_metadata)
+        self.event_store_dirs = {}
+        self.tabular = {}
+        self._open_stores = {}
+        self.samples = self._create_samples(store_dir, event_metadata)
+        for event_name in self.event_store_dirs:
+            self.tabular[event_name] = build_tabular_sequence(event_name, iot_data, scalers, encoders, self.n_steps_in)
+
+    def __getstate__(self):
+        # Memory maps are reopened in each worker process rather than pickled
+        state = self.__dict__.copy()
+        state['_open_stores'] = {}
+        return state
 
-    def _create_samples(self, data_dir, event_metadata):
+    def _event_arrays(self, event_name):
+        """The (patches, texture) memory maps of an event, opened on first use in this process."""
+        if event_name not in self._open_stores:
+            event_store_dir = self.event_store_dirs[event_name]
+            patches, _ = open_event_store(event_store_dir)
+            self._open_stores[event_name] = (patches, load_event_texture(event_store_dir, patches))
+        return self._open_stores[event_name]
+
+    def _create_samples(self, store_dir, event_metadata):
+        dataset_index = load_dataset_index(store_dir) or {}
         samples = []
         for event_name in event_metadata.keys():
-            event_path = os.path.join(data_dir, event_name)
-            if not os.path.isdir(event_path): continue
-            
-            mat_files = sorted([os.path.join(event_path, f) for f in os.listdir(event_path) if f.endswith('.mat')])
-            if len(mat_files) < self.total_timesteps: continue
-            
+            event_store_dir = os.path.join(store_dir, event_name)
+            rows = dataset_index.get(event_name)
+            if rows is not None and rows[0]['num_dates'] < self.total_timesteps: continue
+            if rows is None and not os.path.isfile(os.path.join(event_store_dir, STORE_FILENAME)): continue
+
             try:
-                first_mat = scipy.io.loadmat(mat_files[0])
-                num_patches = first_mat['patches'].shape[0]
-                for patch_idx in range(num_patches):
-                    samples.append({'event': event_name, 'patch_idx': patch_idx, 'mat_files': mat_files})
+                # Always the image store: subclasses' _event_arrays may return other per-patch arrays
+                check_image_channels(open_event_store(event_store_dir)[0])
+                self.event_store_dirs[event_name] = event_store_dir
+                num_dates, num_patches = self._event_arrays(event_name)[0].shape[:2]
+                if num_dates < self.total_timesteps:
+                    del self.event_store_dirs[event_name], self._open_stores[event_name]
+                    continue
+                patch_indices = [row['patch_idx'] for row in rows] if rows is not None else range(num_patches)
+                samples.extend({'event': event_name, 'patch_idx': patch_idx} for patch_idx in patch_indices)
             except Exception as e:
+                self.event_store_dirs.pop(event_name, None)
+                self._open_stores.pop(event_name, None)
                 print(f"Warning: Could not process {event_name}. Error: {e}")
         return samples
 
@@ -43,27 +164,18 @@ class LocalSequenceDataset(Dataset):
         sample_info = self.samples[idx]
         event_name = sample_info['event']
         patch_idx = sample_info['patch_idx']
-        mat_files = sample_info['mat_files']
-
-        img_sequence_list = [scipy.io.loadmat(f)['patches'][patch_idx] for f in mat_files[:self.total_timesteps]]
-        img_sequence = np.array(img_sequence_list, dtype=np.float32)
-
-        # NDVI is the 5th channel (index 4) in the 10-channel data
-        future_ndvi_mean = img_sequence[self.n_steps_in:, :, :, 4].mean()
-
-        meta = config.EVENT_METADATA[event_name]
-        iot_values = self.iot_data[event_name][:self.total_timesteps]
-        iot_normalized = self.scalers['iot'].transform(iot_values)
-        crop_encoded = self.encoders['crop'].transform([[meta['crop_type']]])[0]
-        disease_encoded = self.encoders['disease'].transform([[meta['disease']]])[0]
-        
-        tabular_features = [np.concatenate([iot_normalized[i], crop_encoded, disease_encoded]) for i in range(self.n_steps_in)]
-        
-        X_img = torch.from_numpy(img_sequence[:self.n_steps_in]).permute(0, 3, 1, 2)
-        X_tabular = torch.from_numpy(np.array(tabular_features, dtype=np.float32))
-        y_class = meta['label']
+
+        # A view into the memory-mapped store; only these pages are read from disk
+        patches, texture = self._event_arrays(event_name)
+        img_sequence = patches[:self.total_timesteps, patch_idx]
+
+        future_ndvi_mean = img_sequence[self.n_steps_in:, :, :, config.NDVI_CHANNEL].mean()
+
+        X_img, X_tabular = combine_texture(img_sequence[:self.n_steps_in], self.tabular[event_name],
+                                           texture[:self.n_steps_in, patch_idx])
+        y_class = config.EVENT_METADATA[event_name]['label']
         y_health = np.float32(future_ndvi_mean)
-        
+
         return (X_img, X_tabular), (y_class, y_health)
 
 class InferenceDataset(Dataset):
@@ -71,42 +183,40 @@ class InferenceDataset(Dataset):
     Dataset for inference. Loads all patches for a single specified event
     and provides only the input data (X).
     """
-    def __init__(self, data_dir, event_name, iot_data, scalers, encoders):
-        self.iot_data = iot_data
-        self.scalers = scalers
-        self.encoders = encoders
+    def __init__(self, store_dir, event_name, iot_data, scalers, encoders):
         self.n_steps_in = config.N_STEPS_IN
         self.event_name = event_name
 
-        event_path = os.path.join(data_dir, event_name)
-        self.mat_files = sorted([os.path.join(event_path, f) for f in os.listdir(event_path) if f.endswith('.mat')])
-        
+        self.event_store_dir = os.path.join(store_dir, event_name)
+        rows = (load_dataset_index(store_dir) or {}).get(event_name)
+        self._open_store = None
+        self.tabular = None
         self.num_patches = 0
-        if self.mat_files:
+        if rows is not None or os.path.isfile(os.path.join(self.event_store_dir, STORE_FILENAME)):
             try:
-                first_mat = scipy.io.loadmat(self.mat_files[0])
-                self.num_patches = first_mat['patches'].shape[0]
+                patches, _ = self._event_arrays()
+                check_image_channels(patches)
+                self.tabular = build_tabular_sequence(event_name, iot_data, scalers, encoders, self.n_steps_in)
+                self.num_patches = len(rows) if rows is not None else patches.shape[1]
             except Exception as e:
-                print(f"Error loading {self.mat_files[0]} to determine patch count: {e}")
+                print(f"Error opening patch store in {self.event_store_dir}: {e}")
+
+    def __getstate__(self):
+        # Memory maps are reopened in each worker process rather than pickled
+        state = self.__dict__.copy()
+        state['_open_store'] = None
+        return state
+
+    def _event_arrays(self):
+        """The (patches, texture) memory maps of the event, opened on first use in this process."""
+        if self._open_store is None:
+            patches, _ = open_event_store(self.event_store_dir)
+            self._open_store = (patches, load_event_texture(self.event_store_dir, patches))
+        return self._open_store
 
     def __len__(self):
         return self.num_patches
 
     def __getitem__(self, patch_idx):
-        img_sequence_list = [scipy.io.loadmat(f)['patches'][patch_idx] for f in self.mat_files[:self.n_steps_in]]
-        img_sequence = np.array(img_sequence_list, dtype=np.float32)
-        
-        meta = config.EVENT_METADATA[self.event_name]
-        iot_values = self.iot_data[self.event_name][:self.n_steps_in]
-        iot_normalized = self.scalers['iot'].transform(iot_values)
-        crop_encoded = self.encoders['crop'].transform([[meta['crop_type']]])[0]
-        disease_encoded = self.encoders['disease'].transform([[meta['disease']]])[0]
-        
-        tabular_features = [np.concatenate([iot_normalized[i], crop_encoded, disease_encoded]) for i in range(self.n_steps_in)]
-        
-        X_img = torch.from_numpy(img_sequence).permute(0, 3, 1, 2)
-        X_tabular = torch.from_numpy(np.array(tabular_features, dtype=np.float32))
-        
-        return (X_img, X_tabular)
-
-
+        patches, texture = self._event_arrays()
+        return combine_texture(patches[:self.n_steps_in, patch_idx], self.tabular, texture[:self.n_steps_in, patch_idx])
@@ -0,0 +1,173 @@
+"""
+Memory-mapped cache of ResNetEncoder embeddings.
+
+Every patch appears in many sequences and epochs, but with a frozen CNN its
+embedding never changes. This module encodes each (date, patch) of an event
+store once into a (dates, patches, F) float32 .npy file, together with the
+per-date NDVI mean of each patch used for the health target, so the sequence
+model can be trained on the cached vectors alone (EmbeddingSequenceDataset).
+
+Caches live under <cache_dir>/<encoder hash>/<event>/: different encoder
+weights never share a cache, and an event is re-encoded when its patch store
+changes. The encoder's weights are saved next to its cache (encoder.pth), so
+a later run can load exactly that encoder and reuse the cache.
+"""
+import os
+import json
+import glob
+import hashlib
+import numpy as np
+import torch
+from src.config import globals as config
+from src.dataset.patch_store import STORE_FILENAME, TEXTURE_FILENAME, open_event_store
+from src.dataset.dataset import LocalSequenceDataset, load_event_texture, add_texture_planes
+
+EMBEDDINGS_FILENAME = 'embeddings.npy'
+NDVI_MEANS_FILENAME = 'ndvi_means.npy'
+CACHE_META_FILENAME = 'meta.json'
+ENCODER_FILENAME = 'encoder.pth'
+
+def encoder_hash(cnn):
+    """Content hash of an encoder's weights and buffers."""
+    digest = hashlib.sha1()
+    for name, tensor in sorted(cnn.state_dict().items()):
+        digest.update(name.encode())
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+def store_fingerprint(store_event_dir):
+    """(size, mtime) of the store files an event's embeddings were computed from."""
+    fingerprint = {}
+    for filename in (STORE_FILENAME, TEXTURE_FILENAME):
+        path = os.path.join(store_event_dir, filename)
+        if os.path.exists(path):
+            st = os.stat(path)
+            fingerprint[filename] = [st.st_size, st.st_mtime_ns]
+    return fingerprint
+
+def is_event_cached(cache_event_dir, fingerprint):
+    meta_path = os.path.join(cache_event_dir, CACHE_META_FILENAME)
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return meta.get('store') == fingerprint and meta.get('texture_mode') == config.TEXTURE_MODE
+
+def encode_store_date(cnn, patches, texture, d, device, batch_size):
+    """
+    Encodes every patch of one date of an event store.
+
+    Returns:
+        tuple: (N, F) float32 embeddings and (N,) NDVI means of the date's patches.
+    """
+    num_patches = patches.shape[1]
+    embeddings = np.empty((num_patches, cnn.fc.out_features), dtype=np.float32)
+    ndvi_means = np.empty(num_patches, dtype=np.float32)
+    cnn.eval()
+    with torch.inference_mode():
+        for start in range(0, num_patches, batch_size):
+            images = np.array(patches[d, start:start + batch_size], dtype=np.float32)
+            ndvi_means[start:start + len(images)] = images[..., config.NDVI_CHANNEL].mean(axis=(1, 2))
+            if config.TEXTURE_MODE == 'planes':
+                images = add_texture_planes(images, texture[d, start:start + len(images)])
+            x = torch.from_numpy(images).permute(0, 3, 1, 2).to(device)
+            embeddings[start:start + len(images)] = cnn(x).float().cpu().numpy()
+    return embeddings, ndvi_means
+
+def build_event_embeddings(cnn, store_event_dir, cache_event_dir, device, batch_size):
+    """Encodes every (date, patch) of one event store into cache_event_dir."""
+    patches, _ = open_event_store(store_event_dir)
+    texture = load_event_texture(store_event_dir, patches)
+    num_dates, num_patches = patches.shape[:2]
+
+    os.makedirs(cache_event_dir, exist_ok=True)
+    embeddings_path = os.path.join(cache_event_dir, EMBEDDINGS_FILENAME)
+    tmp_path = embeddings_path + '.tmp.npy'
+    embeddings = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32,
+                                           shape=(num_dates, num_patches, cnn.fc.out_features))
+    ndvi_means = np.zeros((num_dates, num_patches), dtype=np.float32)
+
+    for d in range(num_dates):
+        embeddings[d], ndvi_means[d] = encode_store_date(cnn, patches, texture, d, device, batch_size)
+    embeddings.flush()
+    del embeddings
+    os.replace(tmp_path, embeddings_path)
+    np.save(os.path.join(cache_event_dir, NDVI_MEANS_FILENAME), ndvi_means)
+    with open(os.path.join(cache_event_dir, CACHE_META_FILENAME), 'w') as f:
+        json.dump({'store': store_fingerprint(store_event_dir), 'texture_mode': config.TEXTURE_MODE}, f, indent=2)
+
+def build_embedding_cache(cnn, store_dir, event_names, cache_dir, device, batch_size):
+    """
+    Makes sure every listed event store has up-to-date embeddings for this encoder.
+
+    Returns:
+        str: The cache directory of this encoder, one sub-folder per event.
+    """
+    encoder_cache_dir = os.path.join(cache_dir, encoder_hash(cnn))
+    os.makedirs(encoder_cache_dir, exist_ok=True)
+    encoder_path = os.path.join(encoder_cache_dir, ENCODER_FILENAME)
+    if os.path.exists(encoder_path):
+        os.utime(encoder_path) # Marks this cache as the most recently used (latest_cache_encoder)
+    else:
+        torch.save(cnn.state_dict(), encoder_path)
+    for event_name in event_names:
+        store_event_dir = os.path.join(store_dir, event_name)
+        if not os.path.isfile(os.path.join(store_event_dir, STORE_FILENAME)): continue
+        cache_event_dir = os.path.join(encoder_cache_dir, event_name)
+        if is_event_cached(cache_event_dir, store_fingerprint(store_event_dir)):
+            print(f"  {event_name}: embeddings up to date.")
+            continue
+        print(f"  {event_name}: encoding patches...")
+        build_event_embeddings(cnn, store_event_dir, cache_event_dir, device, batch_size)
+    return encoder_cache_dir
+
+def latest_cache_encoder(cache_dir):
+    """Path of the saved encoder of the most recently used cache in cache_dir, or None."""
+    encoder_paths = glob.glob(os.path.join(cache_dir, '*', ENCODER_FILENAME))
+    return max(encoder_paths, key=os.path.getmtime) if encoder_paths else None
+
+def open_event_embeddings(cache_event_dir):
+    """
+    Opens an event's cached embeddings read-only.
+
+    Returns:
+        tuple: (embeddings, ndvi_means) memory maps of shape (dates, patches, F)
+               and (dates, patches).
+    """
+    embeddings = np.load(os.path.join(cache_event_dir, EMBEDDINGS_FILENAME), mmap_mode='r')
+    ndvi_means = np.load(os.path.join(cache_event_dir, NDVI_MEANS_FILENAME), mmap_mode='r')
+    return embeddings, ndvi_means
+
+class EmbeddingSequenceDataset(LocalSequenceDataset):
+    """
+    Training dataset over cached embeddings. Yields the same samples and
+    targets as LocalSequenceDataset, with (T, F) embedding sequences in place
+    of image sequences.
+    """
+    def __init__(self, store_dir, encoder_cache_dir, event_metadata, iot_data, scalers, encoders):
+        self.encoder_cache_dir = encoder_cache_dir
+        super().__init__(store_dir, event_metadata, iot_data, scalers, encoders)
+
+    def _event_arrays(self, event_name):
+        """The (embeddings, ndvi_means, texture) memory maps of an event, opened on first use in this process."""
+        if event_name not in self._open_stores:
+            embeddings, ndvi_means = open_event_embeddings(os.path.join(self.encoder_cache_dir, event_name))
+            texture = load_event_texture(self.event_store_dirs[event_name], embeddings)
+            self._open_stores[event_name] = (embeddings, ndvi_means, texture)
+        return self._open_stores[event_name]
+
+    def __getitem__(self, idx):
+        sample_info = self.samples[idx]
+        event_name = sample_info['event']
+        patch_idx = sample_info['patch_idx']
+        embeddings, ndvi_means, texture = self._event_arrays(event_name)
+
+        X_emb = torch.from_numpy(np.array(embeddings[:self.n_steps_in, patch_idx]))
+        X_tabular = self.tabular[event_name]
+        if config.TEXTURE_MODE != 'planes':
+            X_tabular = torch.cat([X_tabular, torch.from_numpy(np.array(texture[:self.n_steps_in, patch_idx], dtype=np.float32))], dim=1)
+        y_class = config.EVENT_METADATA[event_name]['label']
+        # Every date's NDVI mean covers the same number of pixels, so their mean is the sequence mean
+        y_health = np.float32(ndvi_means[self.n_steps_in:self.total_timesteps, patch_idx].mean())
+
+        return (X_emb, X_tabular), (y_class, y_health)
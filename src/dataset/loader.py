@@ -0,0 +1,66 @@
+"""
+DataLoader construction and throughput measurement.
+
+Batches are decoded, stacked and permuted in worker processes so the main
+process only runs the model. Each worker memory-maps the patch stores itself
+(see the datasets' __getstate__), keeps them open across epochs when
+config.PERSISTENT_WORKERS is set, and prepares config.PREFETCH_FACTOR batches
+ahead.
+"""
+import time
+from torch.utils.data import DataLoader
+from src.config import globals as config
+
+def make_loader(dataset, device, shuffle=False, batch_size=None, num_workers=None):
+    """
+    Builds a DataLoader using the data-loading settings in config.
+
+    Args:
+        dataset (Dataset): The dataset (or Subset) to load.
+        device (torch.device): Device the batches are moved to; memory is
+                               pinned only for CUDA.
+        shuffle (bool): Whether to reshuffle every epoch.
+        batch_size (int): Defaults to config.BATCH_SIZE.
+        num_workers (int): Defaults to config.NUM_WORKERS; 0 loads in the main process.
+    """
+    batch_size = config.BATCH_SIZE if batch_size is None else batch_size
+    num_workers = config.NUM_WORKERS if num_workers is None else num_workers
+    kwargs = {}
+    if num_workers > 0:
+        kwargs = {'persistent_workers': config.PERSISTENT_WORKERS, 'prefetch_factor': config.PREFETCH_FACTOR}
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=num_workers,
+                      pin_memory=config.PIN_MEMORY and device.type == 'cuda', **kwargs)
+
+def _batch_size(batch):
+    """Number of samples in a batch of (X_img, X_tabular) or ((X_img, X_tabular), targets)."""
+    while isinstance(batch, (tuple, list)):
+        batch = batch[0]
+    return len(batch)
+
+def measure_throughput(loader, max_batches=50):
+    """
+    Iterates over up to max_batches batches of a loader without running a model.
+
+    Returns:
+        float: Samples per second, excluding worker start-up (the first batch).
+    """
+    num_samples, start_time = 0, None
+    for i, batch in enumerate(loader):
+        if i == 0:
+            start_time = time.perf_counter()
+            continue
+        num_samples += _batch_size(batch)
+        if i >= max_batches:
+            break
+    if num_samples == 0:
+        return 0.0
+    return num_samples / (time.perf_counter() - start_time)
+
+def benchmark_loader(dataset, device, worker_counts, max_batches=50):
+    """Prints loader throughput for each worker count, to size config.NUM_WORKERS per node."""
+    print(f"--- Loader throughput ({max_batches} batches of {config.BATCH_SIZE}) ---")
+    for num_workers in worker_counts:
+        loader = make_loader(dataset, device, shuffle=True, num_workers=num_workers)
+        samples_per_sec = measure_throughput(loader, max_batches)
+        print(f"  num_workers={num_workers:2d}: {samples_per_sec:8.1f} samples/s")
+        del loader
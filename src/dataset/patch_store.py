@@ -0,0 +1,263 @@
+"""
+Packed, memory-mapped patch sequence store.
+
+The MATLAB enhancement step leaves one .mat file per date, each holding a
+(num_patches, H, W, C) 'patches' array, so reading a single patch means
+decoding the whole file. This module converts each event once into a
+contiguous float32 .npy file indexed (date, patch, H, W, C) that the dataset
+classes memory-map and slice without decoding anything. The Python
+preprocessing pipeline (run_pipeline.py) writes its output straight into
+such stores with build_event_store_from_patches.
+
+GLCM texture statistics are one scalar per (date, patch) and feature, so they
+are kept out of the image channels in a small (date, patch, 4) texture.npy
+next to the store rather than as constant 256x256 planes.
+
+A dataset index (dataset_index.csv, written by
+src/data_preprocessing/create_dataset_csv.py) lists every (event, patch) with
+its grid coordinates, date coverage and shape, so the dataset classes can
+build their sample lists without touching the stores.
+
+Example usage from the terminal in the project's root directory:
+> python -m src.dataset.patch_store --input data/matlab_enhanced --output data/patch_store
+"""
+import os
+import csv
+import json
+import argparse
+import numpy as np
+
+STORE_FILENAME = 'patches.npy'
+TEXTURE_FILENAME = 'texture.npy'
+INDEX_FILENAME = 'index.json'
+NUM_TEXTURE_FEATURES = 4 # Contrast, Correlation, Energy, Homogeneity
+DATASET_INDEX_FILENAME = 'dataset_index.csv'
+DATASET_INDEX_COLUMNS = ['event', 'patch_idx', 'y_idx', 'x_idx', 'num_dates', 'first_date', 'last_date',
+                         'file', 'height', 'width', 'channels']
+DATASET_INDEX_INT_COLUMNS = ['patch_idx', 'y_idx', 'x_idx', 'num_dates', 'height', 'width', 'channels']
+
+
+def load_mat_patches(mat_path, key='patches'):
+    """
+    Loads the patch array from a .mat file.
+
+    MATLAB's -v7.3 files are HDF5 containers that scipy cannot read, so those
+    fall back to h5py. HDF5 stores MATLAB arrays with reversed dimensions,
+    which the transpose undoes.
+    """
+    import scipy.io
+    try:
+        return scipy.io.loadmat(mat_path)[key]
+    except NotImplementedError:
+        import h5py
+        with h5py.File(mat_path, 'r') as f:
+            return f[key][()].transpose()
+
+
+def build_event_store(event_dir, store_event_dir):
+    """
+    Packs all per-date .mat files of one event into a single memory-mapped store.
+
+    The last NUM_TEXTURE_FEATURES channels of the MATLAB output are constant
+    texture planes; one value of each is kept in texture.npy and the planes
+    are dropped from the image store.
+
+    Dates are written one at a time, so peak memory is one date's patches.
+    The store is written to a temporary file and renamed when complete, so an
+    interrupted conversion never leaves a truncated store behind.
+
+    Returns:
+        tuple: The store shape (dates, patches, H, W, C).
+    """
+    mat_files = sorted(f for f in os.listdir(event_dir) if f.endswith('.mat'))
+    if not mat_files:
+        raise FileNotFoundError(f"No .mat files found in {event_dir}")
+
+    os.makedirs(store_event_dir, exist_ok=True)
+    store_path = os.path.join(store_event_dir, STORE_FILENAME)
+    tmp_path = store_path + '.tmp.npy'
+    texture_path = os.path.join(store_event_dir, TEXTURE_FILENAME)
+
+    first = load_mat_patches(os.path.join(event_dir, mat_files[0]))
+    num_patches, height, width, num_channels = first.shape
+    image_channels = num_channels - NUM_TEXTURE_FEATURES
+    shape = (len(mat_files), num_patches, height, width, image_channels)
+    texture = np.zeros((len(mat_files), num_patches, NUM_TEXTURE_FEATURES), dtype=np.float32)
+    try:
+        store = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=shape)
+        for d, mat_file in enumerate(mat_files):
+            patches = first if d == 0 else load_mat_patches(os.path.join(event_dir, mat_file))
+            if patches.shape != first.shape:
+                raise ValueError(f"{mat_file} has patch shape {patches.shape}, expected {first.shape}")
+            store[d] = patches[..., :image_channels]
+            # MATLAB's correlation is NaN for constant patches; stored as 0, as in texture.py
+            texture[d] = np.nan_to_num(patches[:, 0, 0, image_channels:], nan=0.0)
+        store.flush()
+        del store
+        os.replace(tmp_path, store_path)
+    finally:
+        # Only left behind if the conversion failed
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    np.save(texture_path, texture)
+
+    index = {
+        'dates': [os.path.splitext(f)[0] for f in mat_files],
+        'files': mat_files,
+        'shape': list(shape),
+        'dtype': 'float32',
+    }
+    with open(os.path.join(store_event_dir, INDEX_FILENAME), 'w') as f:
+        json.dump(index, f, indent=2)
+    return shape
+
+
+def build_event_store_from_patches(event_processed_dir, dates, store_event_dir, channel_names, extra_index=None):
+    """
+    Packs the per-patch output of the Python pipeline (one 'patch_<y>_<x>.mat'
+    file per valid patch in each date folder) into a single memory-mapped store.
+
+    Patches are indexed by the union of their (y_idx, x_idx) grid coordinates
+    over all dates; a patch missing on a date (too little cropland that day)
+    stays zero-filled. Texture features are added afterwards by the pipeline's
+    texture stage (texture.npy).
+
+    Returns:
+        tuple: The store shape (dates, patches, H, W, C).
+    """
+    import scipy.io
+
+    files_by_date = {}
+    coords = set()
+    for date_str in dates:
+        date_files = {}
+        for f in os.listdir(os.path.join(event_processed_dir, date_str)):
+            if f.startswith('patch_') and f.endswith('.mat'):
+                y_idx, x_idx = (int(v) for v in f[len('patch_'):-len('.mat')].split('_'))
+                date_files[(y_idx, x_idx)] = f
+        files_by_date[date_str] = date_files
+        coords.update(date_files)
+    if not coords:
+        raise FileNotFoundError(f"No patch files found for {len(dates)} dates in {event_processed_dir}")
+
+    coords = sorted(coords)
+    coord_index = {coord: n for n, coord in enumerate(coords)}
+    first_date = next(d for d in dates if files_by_date[d])
+    first_file = next(iter(files_by_date[first_date].values()))
+    patch_shape = scipy.io.loadmat(os.path.join(event_processed_dir, first_date, first_file))['patch_data'].shape
+
+    os.makedirs(store_event_dir, exist_ok=True)
+    store_path = os.path.join(store_event_dir, STORE_FILENAME)
+    tmp_path = store_path + '.tmp.npy'
+    shape = (len(dates), len(coords)) + patch_shape
+    try:
+        store = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=shape)
+        for d, date_str in enumerate(dates):
+            for coord, f in files_by_date[date_str].items():
+                store[d, coord_index[coord]] = scipy.io.loadmat(os.path.join(event_processed_dir, date_str, f))['patch_data']
+        store.flush()
+        del store
+        os.replace(tmp_path, store_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    index = {
+        'dates': list(dates),
+        'files': list(dates),
+        'shape': list(shape),
+        'dtype': 'float32',
+        'channels': list(channel_names),
+        'coords': [list(coord) for coord in coords],
+    }
+    index.update(extra_index or {})
+    with open(os.path.join(store_event_dir, INDEX_FILENAME), 'w') as f:
+        json.dump(index, f, indent=2)
+    return shape
+
+
+def open_event_store(store_event_dir):
+    """
+    Opens an event store read-only.
+
+    Returns:
+        tuple: (patches, index) where patches is a (dates, patches, H, W, C)
+               memory map and index is the metadata written at conversion.
+    """
+    patches = np.load(os.path.join(store_event_dir, STORE_FILENAME), mmap_mode='r')
+    with open(os.path.join(store_event_dir, INDEX_FILENAME)) as f:
+        index = json.load(f)
+    return patches, index
+
+
+def open_event_texture(store_event_dir):
+    """
+    Opens an event's per-patch texture statistics read-only.
+
+    Returns:
+        np.ndarray or None: A (dates, patches, NUM_TEXTURE_FEATURES) memory map,
+                            or None if the store has no texture file.
+    """
+    texture_path = os.path.join(store_event_dir, TEXTURE_FILENAME)
+    if not os.path.exists(texture_path):
+        return None
+    return np.load(texture_path, mmap_mode='r')
+
+
+def load_dataset_index(store_dir):
+    """
+    Reads the dataset index of a patch store directory.
+
+    An event whose store index.json is newer than the dataset index was
+    rebuilt since indexing; its rows are dropped so callers fall back to
+    opening that store directly.
+
+    Returns:
+        dict or None: Event name -> list of row dicts (integer columns
+                      converted), or None if no dataset index exists.
+    """
+    index_path = os.path.join(store_dir, DATASET_INDEX_FILENAME)
+    if not os.path.exists(index_path):
+        return None
+    indexed_at = os.stat(index_path).st_mtime_ns
+
+    rows_by_event = {}
+    with open(index_path, newline='') as f:
+        for row in csv.DictReader(f):
+            for column in DATASET_INDEX_INT_COLUMNS:
+                row[column] = int(row[column])
+            rows_by_event.setdefault(row['event'], []).append(row)
+
+    for event_name in list(rows_by_event):
+        store_index_path = os.path.join(store_dir, event_name, INDEX_FILENAME)
+        if not os.path.exists(store_index_path) or os.stat(store_index_path).st_mtime_ns > indexed_at:
+            print(f"Warning: Dataset index is stale for {event_name}; re-run create_dataset_csv.py.")
+            del rows_by_event[event_name]
+    return rows_by_event
+
+
+def build_store(input_dir, output_dir, event_names):
+    """Converts every listed event found in input_dir into a patch store."""
+    for event_name in event_names:
+        event_dir = os.path.join(input_dir, event_name)
+        if not os.path.isdir(event_dir):
+            print(f"  {event_name}: input directory not found. Skipping.")
+            continue
+        try:
+            shape = build_event_store(event_dir, os.path.join(output_dir, event_name))
+            print(f"  {event_name}: packed {shape[0]} dates x {shape[1]} patches.")
+        except Exception as e:
+            print(f"Warning: Could not convert {event_name}. Error: {e}")
+
+
+if __name__ == '__main__':
+    from src.config import globals as config
+
+    parser = argparse.ArgumentParser(description="Pack per-date .mat patch files into memory-mapped patch stores.")
+    parser.add_argument('--input', type=str, default=config.INPUT_DATA_DIR,
+                        help='Directory containing one folder of per-date .mat files per event.')
+    parser.add_argument('--output', type=str, default=config.PATCH_STORE_DIR,
+                        help='Directory to write the patch stores to.')
+    args = parser.parse_args()
+
+    build_store(args.input, args.output, config.EVENT_METADATA.keys())
@@ -0,0 +1,143 @@
+"""
+CPU latency benchmark of the inference-optimized model.
+
+Compares, on random inputs of the real shape, the trained model as it used to
+run (eager, no_grad) with each optimization step: inference_mode, BatchNorm
+folded into the convolutions, and the traced, frozen TorchScript graph. The
+largest output difference to the baseline is printed next to each latency.
+
+With --tradeoff, the ResNet-34 model and the distilled light encoder model
+(train.py --distill) are instead evaluated on the validation samples train.py
+held out (its train_val_split.json), and their
+accuracy, health error and latency are reported side by side.
+
+Example usage from the terminal in the project's root directory:
+> python -m src.inference.benchmark --batch-size 4
+> python -m src.inference.benchmark --tradeoff --eval-batches 50
+"""
+import os
+import time
+import copy
+import argparse
+import joblib
+import numpy as np
+import torch
+from src.config import globals as config
+from src.dataset.dataset import LocalSequenceDataset, SPLIT_FILENAME, load_split
+from src.dataset.loader import make_loader
+from src.inference.model_loader import MODEL_FILENAMES, load_model, optimize_for_inference, model_dimensions
+from src.inference.quantization import evaluate
+
+TRADEOFF_REPORT_FILENAME = 'encoder_tradeoff_report.txt'
+
+def measure_latency(model, inputs, runs, warmup=2, grad_mode=torch.inference_mode):
+    """
+    Runs a model repeatedly on the same inputs.
+
+    Returns:
+        tuple: (seconds per call, outputs of the last call).
+    """
+    with grad_mode():
+        for _ in range(warmup):
+            outputs = model(*inputs)
+        start_time = time.perf_counter()
+        for _ in range(runs):
+            outputs = model(*inputs)
+    return (time.perf_counter() - start_time) / runs, outputs
+
+def run_benchmark(model_path, encoders, batch_size, patch_size, runs, device):
+    """Prints the latency per patch sequence of each inference configuration."""
+    torch.manual_seed(0)
+    in_channels, num_tabular_features, _ = model_dimensions(encoders)
+    X_img = torch.randn(batch_size, config.N_STEPS_IN, in_channels, patch_size, patch_size)
+    X_tab = torch.randn(batch_size, config.N_STEPS_IN, num_tabular_features, device=device)
+    inputs = (X_img, X_tab)
+
+    baseline = load_model(model_path, encoders, device)
+    fused = optimize_for_inference(copy.deepcopy(baseline))
+    frozen = optimize_for_inference(copy.deepcopy(baseline), inputs)
+    configurations = [
+        ('eager, no_grad (previous)', baseline, torch.no_grad),
+        ('eager, inference_mode', baseline, torch.inference_mode),
+        ('fused Conv+BN', fused, torch.inference_mode),
+        ('fused + traced + frozen', frozen, torch.inference_mode),
+    ]
+
+    print(f"--- Inference latency on {device} ({batch_size} sequences of {config.N_STEPS_IN} x "
+          f"{in_channels}x{patch_size}x{patch_size}, {runs} runs, {torch.get_num_threads()} threads) ---")
+    reference, baseline_latency = None, None
+    for name, model, grad_mode in configurations:
+        latency, (class_out, health_out) = measure_latency(model, inputs, runs, grad_mode=grad_mode)
+        if reference is None:
+            reference, baseline_latency = (class_out, health_out), latency
+        max_diff = max((class_out - reference[0]).abs().max().item(), (health_out - reference[1]).abs().max().item())
+        print(f"  {name:28s}: {1000 * latency / batch_size:8.2f} ms/sequence "
+              f"({baseline_latency / latency:4.2f}x, max |diff| {max_diff:.2e})")
+
+def tradeoff_report(results):
+    """
+    Speed/accuracy table of the encoders, as text lines.
+
+    Args:
+        results (dict): Encoder name -> (CNN parameter count, evaluate() results);
+                        the first entry is the reference for speedup and agreement.
+    """
+    lines = [f"{'Encoder':8s} | {'CNN params':>10s} | {'Accuracy':>8s} | {'Health MAE':>10s} | "
+             f"{'ms/sequence':>11s} | {'Speedup':>7s} | {'Agreement':>9s}"]
+    reference = None
+    for name, (num_params, result) in results.items():
+        reference = reference or result
+        accuracy = 100 * (result['class_preds'] == result['labels']).float().mean().item()
+        mae = (result['health_preds'] - result['targets']).abs().mean().item()
+        agreement = 100 * (result['class_preds'] == reference['class_preds']).float().mean().item()
+        lines.append(f"{name:8s} | {num_params:10,d} | {accuracy:7.2f}% | {mae:10.4f} | "
+                     f"{1000 * result['latency']:11.2f} | {reference['latency'] / max(result['latency'], 1e-12):6.2f}x | "
+                     f"{agreement:8.2f}%")
+    return lines
+
+def run_tradeoff(scalers, encoders, eval_batches, device):
+    """Evaluates every trained encoder model on the same held-out split and writes the trade-off table."""
+    # As in quantize.py: simulated IoT data and the validation samples of train.py's split
+    torch.manual_seed(0)
+    iot_data = {event: np.random.rand(config.N_STEPS_IN + config.N_STEPS_OUT, 3) for event in config.EVENT_METADATA}
+    full_dataset = LocalSequenceDataset(config.PATCH_STORE_DIR, config.EVENT_METADATA, iot_data, scalers, encoders)
+    _, heldout_dataset = load_split(os.path.join(config.OUTPUT_MODEL_DIR, SPLIT_FILENAME), full_dataset)
+    heldout_loader = make_loader(heldout_dataset, device, shuffle=False)
+
+    results = {}
+    for encoder, filename in MODEL_FILENAMES.items():
+        model_path = os.path.join(config.OUTPUT_MODEL_DIR, filename)
+        if not os.path.exists(model_path):
+            print(f"WARNING: No {encoder} model at {model_path}; skipping it.")
+            continue
+        model = load_model(model_path, encoders, device, encoder)
+        num_params = sum(p.numel() for p in model.cnn.parameters())
+        results[encoder] = (num_params, evaluate(optimize_for_inference(model), heldout_loader, eval_batches))
+
+    report = tradeoff_report(results)
+    print(f"\n--- Encoder speed/accuracy trade-off (held-out set, {device}) ---")
+    print("\n".join(report))
+    with open(os.path.join(config.OUTPUT_MODEL_DIR, TRADEOFF_REPORT_FILENAME), 'w') as f:
+        f.write("\n".join(report) + "\n")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark inference latency of the optimized model on CPU.")
+    parser.add_argument('--model', type=str, default=os.path.join(config.OUTPUT_MODEL_DIR, MODEL_FILENAMES['resnet']),
+                        help='Trained model checkpoint.')
+    parser.add_argument('--batch-size', type=int, default=config.BATCH_SIZE)
+    parser.add_argument('--patch-size', type=int, default=256)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--tradeoff', action='store_true',
+                        help='Compare the resnet and light encoder models on held-out data instead.')
+    parser.add_argument('--eval-batches', type=int, default=50, help='Held-out batches used by --tradeoff.')
+    args = parser.parse_args()
+
+    encoders = {
+        'crop': joblib.load(os.path.join(config.OUTPUT_MODEL_DIR, 'crop_encoder.gz')),
+        'disease': joblib.load(os.path.join(config.OUTPUT_MODEL_DIR, 'disease_encoder.gz'))
+    }
+    if args.tradeoff:
+        scalers = {'iot': joblib.load(os.path.join(config.OUTPUT_MODEL_DIR, 'iot_scaler.gz'))}
+        run_tradeoff(scalers, encoders, args.eval_batches, torch.device('cpu'))
+    else:
+        run_benchmark(args.model, encoders, args.batch_size, args.patch_size, args.runs, torch.device('cpu'))
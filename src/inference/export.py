@@ -0,0 +1,86 @@
+"""
+Exports the trained model as a self-contained TorchScript file.
+
+The frozen, BatchNorm-fused graph (see model_loader.py) is saved together with
+every preprocessing constant needed to build its inputs: the IoT scaler
+statistics, the one-hot layouts of crop type and disease, the event metadata
+and the disease name of each class label, the sequence length and the texture
+mode. They travel in the file's
+'preprocessing.json' extra file, so src/inference/runner.py can run batch
+predictions with only torch and numpy, without torchvision, sklearn or the
+training code.
+
+Example usage from the terminal in the project's root directory:
+> python -m src.inference.export --output saved_models/crop_model_export.pt
+"""
+import os
+import json
+import argparse
+import joblib
+import torch
+from src.config import globals as config
+from src.inference.model_loader import MODEL_FILENAMES, load_model, optimize_for_inference, model_dimensions
+from src.inference.quantization import QUANTIZED_MODEL_FILENAME
+from src.inference.runner import PREPROCESSING_EXTRA_FILE, class_names
+
+EXPORT_FILENAME = 'crop_model_export.pt'
+
+def preprocessing_constants(scalers, encoders):
+    """Everything the runner needs to turn raw event data into model inputs, as plain JSON types."""
+    in_channels, num_tabular_features, num_classes = model_dimensions(encoders)
+    return {
+        'iot_mean': scalers['iot'].mean_.tolist(),
+        'iot_scale': scalers['iot'].scale_.tolist(),
+        'crop_categories': [str(c) for c in encoders['crop'].categories_[0]],
+        'disease_categories': [str(c) for c in encoders['disease'].categories_[0]],
+        'event_metadata': config.EVENT_METADATA,
+        'class_names': class_names(config.EVENT_METADATA),
+        'n_steps_in': config.N_STEPS_IN,
+        'texture_mode': config.TEXTURE_MODE,
+        'num_image_channels': config.NUM_IMAGE_CHANNELS,
+        'num_texture_features': config.NUM_TEXTURE_FEATURES,
+        'in_channels': in_channels,
+        'num_tabular_features': num_tabular_features,
+        'num_classes': num_classes,
+    }
+
+def export_model(model_path, scalers, encoders, output_path, patch_size=256, quantized=False):
+    """
+    Writes the TorchScript model plus its preprocessing constants to output_path.
+
+    Args:
+        model_path (str): Float checkpoint (.pth), or with quantized=True the
+                          INT8 TorchScript file written by quantize.py.
+        scalers (dict), encoders (dict): The fitted preprocessing objects.
+        output_path (str): Destination .pt file.
+        patch_size (int): Patch height/width of the example input used for tracing.
+        quantized (bool): Re-export the INT8 model instead of tracing the float one.
+    """
+    constants = preprocessing_constants(scalers, encoders)
+    device = torch.device('cpu')
+    if quantized:
+        module = torch.jit.load(model_path, map_location=device)
+    else:
+        example_inputs = (torch.zeros(1, constants['n_steps_in'], constants['in_channels'], patch_size, patch_size),
+                          torch.zeros(1, constants['n_steps_in'], constants['num_tabular_features']))
+        module = optimize_for_inference(load_model(model_path, encoders, device), example_inputs)
+        if not isinstance(module, torch.jit.ScriptModule):
+            raise ValueError("The model could not be traced; unset CNN_CHUNK_SIZE to export it.")
+    torch.jit.save(module, output_path, _extra_files={PREPROCESSING_EXTRA_FILE: json.dumps(constants)})
+    return output_path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the trained model and its preprocessing constants as TorchScript.")
+    parser.add_argument('--output', type=str, default=os.path.join(config.OUTPUT_MODEL_DIR, EXPORT_FILENAME))
+    parser.add_argument('--quantized', action='store_true', help='Export the INT8 model written by quantize.py.')
+    parser.add_argument('--patch-size', type=int, default=256)
+    args = parser.parse_args()
+
+    scalers = {'iot': joblib.load(os.path.join(config.OUTPUT_MODEL_DIR, 'iot_scaler.gz'))}
+    encoders = {
+        'crop': joblib.load(os.path.join(config.OUTPUT_MODEL_DIR, 'crop_encoder.gz')),
+        'disease': joblib.load(os.path.join(config.OUTPUT_MODEL_DIR, 'disease_encoder.gz'))
+    }
+    model_path = os.path.join(config.OUTPUT_MODEL_DIR, QUANTIZED_MODEL_FILENAME if args.quantized else MODEL_FILENAMES['resnet'])
+    export_model(model_path, scalers, encoders, args.output, args.patch_size, args.quantized)
+    print(f"Exported model saved to: {args.output}")
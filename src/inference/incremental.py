@@ -0,0 +1,130 @@
+"""
+Rolling-window incremental inference.
+
+When a new satellite date is packed into an event's patch store, only that
+date has to go through the CNN: the embeddings of every earlier date are kept
+in a per-date embedding store and reused. The sequence model then runs on the
+latest N_STEPS_IN dates (the shifted window) from cached embeddings, so a
+daily update costs about one CNN pass over one date.
+
+This mode therefore forecasts from the newest dates, whereas full inference
+(InferenceDataset) uses the first N_STEPS_IN dates of the store, like
+training; the two agree only when the store holds exactly N_STEPS_IN dates.
+The IoT readings are taken from the same window as the images.
+
+The embedding store lives under
+<EMBEDDING_CACHE_DIR>/<encoder hash>/<event>/dates/<date>.npy, next to the
+training cache of src/dataset/embedding_cache.py. A date's patches are assumed
+not to change once packed; its embeddings are recomputed only if the store's
+patch layout (its grid coordinates) or config.TEXTURE_MODE changed. Delete the
+folder to force a full re-encode.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import torch
+from tqdm import tqdm
+from src.config import globals as config
+from src.dataset.patch_store import open_event_store
+from src.dataset.dataset import load_event_texture, build_tabular_sequence
+from src.dataset.embedding_cache import encoder_hash, encode_store_date
+
+DATE_EMBEDDINGS_DIRNAME = 'dates'
+
+def patch_layout_key(index, num_patches):
+    """Identifies the patch order of a store; embeddings of another layout cannot be reused."""
+    payload = json.dumps([index.get('coords'), num_patches, config.TEXTURE_MODE])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def update_date_embeddings(cnn, store_event_dir, date_cache_dir, date_indices, device, batch_size):
+    """
+    Makes sure the given dates of an event store have cached embeddings,
+    encoding only the dates that are missing.
+
+    Returns:
+        np.ndarray: (len(date_indices), N, F) float32 embeddings of those dates.
+    """
+    patches, index = open_event_store(store_event_dir)
+    texture = load_event_texture(store_event_dir, patches)
+    dates = index.get('dates') or [str(d) for d in range(patches.shape[0])]
+    layout_key = patch_layout_key(index, patches.shape[1])
+    os.makedirs(date_cache_dir, exist_ok=True)
+
+    window = []
+    for d in date_indices:
+        path = os.path.join(date_cache_dir, f"{dates[d]}.npy")
+        meta_path = os.path.join(date_cache_dir, f"{dates[d]}.json")
+        cached = False
+        if os.path.exists(path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                cached = json.load(f).get('layout') == layout_key
+        if cached:
+            window.append(np.load(path))
+            continue
+        print(f"  Encoding date {dates[d]} ({patches.shape[1]} patches)...")
+        embeddings, _ = encode_store_date(cnn, patches, texture, d, device, batch_size)
+        np.save(path, embeddings)
+        with open(meta_path, 'w') as f:
+            json.dump({'layout': layout_key}, f)
+        window.append(embeddings)
+    return np.stack(window)
+
+def run_incremental_predictions(model, store_dir, event_name, iot_data, scalers, encoders, device, cache_dir, batch_size):
+    """
+    Predicts every patch of an event from its latest N_STEPS_IN dates, reusing
+    cached per-date embeddings.
+
+    Args:
+        model (torch.nn.Module): The trained model.
+        store_dir (str): Patch store directory.
+        event_name (str): Event to predict.
+        iot_data (dict): Event -> IoT readings, one per store date.
+        scalers (dict), encoders (dict): The fitted preprocessing objects.
+        device (torch.device): The device to run inference on.
+        cache_dir (str): Root of the embedding caches (config.EMBEDDING_CACHE_DIR).
+        batch_size (int): Patches per CNN and sequence-model call.
+
+    Returns:
+        tuple: A tuple containing two lists:
+               - all_class_preds (list): Predicted class labels.
+               - all_health_preds (list): Predicted health index values.
+    """
+    store_event_dir = os.path.join(store_dir, event_name)
+    patches, index = open_event_store(store_event_dir)
+    num_dates = patches.shape[0]
+    if num_dates < config.N_STEPS_IN:
+        print(f"Event '{event_name}' has only {num_dates} dates; {config.N_STEPS_IN} are needed.")
+        return [], []
+    window_indices = list(range(num_dates - config.N_STEPS_IN, num_dates))
+    if index.get('dates'):
+        print(f"Rolling window: {index['dates'][window_indices[0]]} to {index['dates'][window_indices[-1]]}")
+
+    # The tabular features cover the same dates as the images
+    tabular_sequence = build_tabular_sequence(event_name, iot_data, scalers, encoders, config.N_STEPS_IN,
+                                              start=window_indices[0])
+
+    model.eval()
+    date_cache_dir = os.path.join(cache_dir, encoder_hash(model.cnn), event_name, DATE_EMBEDDINGS_DIRNAME)
+    window = update_date_embeddings(model.cnn, store_event_dir, date_cache_dir, window_indices, device, batch_size)
+    texture = load_event_texture(store_event_dir, patches)
+
+    all_class_preds = []
+    all_health_preds = []
+    tabular_sequence = tabular_sequence.to(device)
+    with torch.inference_mode():
+        for start in tqdm(range(0, window.shape[1], batch_size), desc="Generating Predictions"):
+            # (T, B, F) -> (B, T, F) cached CNN features
+            X_emb = torch.from_numpy(np.ascontiguousarray(window[:, start:start + batch_size].transpose(1, 0, 2)))
+            X_tab_b = tabular_sequence.expand(len(X_emb), -1, -1)
+            if config.TEXTURE_MODE != 'planes':
+                texture_b = np.array(texture[window_indices[0]:window_indices[-1] + 1, start:start + len(X_emb)], dtype=np.float32)
+                X_tab_b = torch.cat([X_tab_b, torch.from_numpy(texture_b.transpose(1, 0, 2)).to(device)], dim=2)
+
+            y_class_pred, y_health_pred = model(X_emb, X_tab_b)
+            _, predicted_class = torch.max(y_class_pred, 1)
+
+            all_class_preds.extend(predicted_class.cpu().numpy())
+            all_health_preds.extend(y_health_pred.cpu().numpy())
+
+    return all_class_preds, all_health_preds
@@ -1,55 +1,80 @@
 """
-Contains the logic for generating and saving the final health map visualizations.
+Contains the logic for generating and saving the final health maps.
+
+Each prediction belongs to one patch of the event's patch store, whose
+index.json records the patch's (y_idx, x_idx) cell on the event's common
+grid, the grid's CRS and transform, and the patch size. The maps are written
+as geo-referenced, tiled GeoTIFFs on that grid (disease class and predicted
+NDVI), one patch-sized window at a time: the tiles match the patches, so
+only one tile is held in memory, and cells without a patch stay nodata.
+The files open directly in GIS tools; a PNG preview is optional.
 """
 import os
+import json
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
+from src.data_preprocessing.manifest import grid_from_dict
+
+CLASS_NODATA = 255
 
-def generate_maps(class_preds, health_preds, disease_encoder, event_name, output_dir):
+def write_patch_geotiff(output_path, values, coords, grid, patch_size, dtype, nodata, tags=None):
     """
-    Generates and saves the Disease Risk and Crop Stress maps.
+    Writes one value per patch into a tiled GeoTIFF on the event's common grid.
+
+    Args:
+        output_path (str): Destination .tif file.
+        values (sequence): One value per patch, in store order.
+        coords (list): (y_idx, x_idx) grid cell of each patch, in store order.
+        grid (dict): The store's common grid (crs, transform, shape).
+        patch_size (int): Patch height/width in grid pixels; also the tile size.
+        dtype (str): Raster data type.
+        nodata: Value of the pixels no patch covers.
+        tags (dict, optional): Dataset metadata tags.
     """
-    print("\n--- Reconstructing and Generating Health Maps ---")
-    
-    # --- Reconstruct the Map Grid ---
-    total_patches = len(class_preds)
-    if total_patches == 0:
-        print("No predictions to map. Exiting.")
-        return
-        
-    patches_per_row = int(np.sqrt(total_patches))
-    if patches_per_row * patches_per_row != total_patches:
-        print(f"Warning: The number of patches ({total_patches}) does not form a perfect square.")
-        patches_per_row = int(np.floor(np.sqrt(total_patches)))
-        while patches_per_row > 0 and total_patches % patches_per_row != 0:
-            patches_per_row -= 1
-    
-    if patches_per_row == 0:
-        print("Could not determine map dimensions.")
-        return
+    import rasterio
+    from rasterio.windows import Window
 
-    num_rows = total_patches // patches_per_row
-    
-    class_map = np.array(class_preds).reshape(num_rows, patches_per_row)
-    health_map = np.array(health_preds).reshape(num_rows, patches_per_row)
+    crs, transform, (height, width) = grid_from_dict(grid)
+    profile = {
+        'driver': 'GTiff', 'height': height, 'width': width, 'count': 1, 'dtype': dtype,
+        'crs': crs, 'transform': transform, 'nodata': nodata,
+        'tiled': True, 'blockxsize': patch_size, 'blockysize': patch_size,
+        'compress': 'deflate', 'sparse_ok': True, # Tiles without a patch are never written
+    }
+    with rasterio.open(output_path, 'w', **profile) as dst:
+        tile = np.empty((patch_size, patch_size), dtype=dtype)
+        for value, (y_idx, x_idx) in zip(values, coords):
+            tile.fill(value)
+            window = Window(x_idx * patch_size, y_idx * patch_size, patch_size, patch_size)
+            dst.write(tile, 1, window=window)
+        if tags:
+            dst.update_tags(**tags)
+    return output_path
+
+def legend_labels(class_map, class_names):
+    """The class labels present in a class map, in order, and their disease names."""
+    labels = sorted(int(label) for label in np.unique(class_map[~np.isnan(class_map)]))
+    return labels, [class_names[label] for label in labels]
+
+def save_png_preview(class_map, health_map, class_names, event_name, output_path):
+    """Saves a matplotlib figure of the (patch row, patch column) class and health maps."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.colors as mcolors
 
-    # --- Visualize the Maps ---
     fig, axes = plt.subplots(1, 2, figsize=(20, 9))
     fig.suptitle(f"Analysis for Event: {event_name}", fontsize=16)
-    
+
     # 1. Disease Risk Map
-    unique_labels = sorted(list(set(class_preds)))
-    cmap_risk = plt.get_cmap('viridis', len(unique_labels))
+    unique_labels, label_names = legend_labels(class_map, class_names)
+    cmap_risk = plt.get_cmap('viridis', max(len(unique_labels), 1))
     im1 = axes[0].imshow(class_map, cmap=cmap_risk)
     axes[0].set_title('Predicted Disease Risk Map')
     axes[0].set_xlabel('Patch Column')
     axes[0].set_ylabel('Patch Row')
-    
+
     cbar1 = fig.colorbar(im1, ax=axes[0], ticks=unique_labels)
-    disease_names = disease_encoder.categories_[0]
-    tick_labels = [disease_names[label] for label in unique_labels]
-    cbar1.set_ticklabels(tick_labels)
+    cbar1.set_ticklabels(label_names)
 
     # 2. Crop Stress Map (Predicted NDVI)
     cmap_stress = mcolors.LinearSegmentedColormap.from_list("", ["red", "yellow", "green"])
@@ -57,12 +82,81 @@ def generate_maps(class_preds, health_preds, disease_encoder, event_name, output
     axes[1].set_title('Predicted Future Crop Stress Map (NDVI)')
     axes[1].set_xlabel('Patch Column')
     axes[1].set_ylabel('Patch Row')
-    
+
     cbar2 = fig.colorbar(im2, ax=axes[1])
     cbar2.set_label('Predicted Mean NDVI (Higher is Healthier)')
 
     plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-    output_path = os.path.join(output_dir, f'health_maps_{event_name}.png')
     plt.savefig(output_path)
-    print(f"\nHealth maps saved successfully to: {output_path}")
-    plt.show()
+    plt.close(fig)
+    return output_path
+
+def patch_grid_maps(class_preds, health_preds, coords):
+    """(patch row, patch column) class and health arrays, NaN where no patch was predicted."""
+    coords = np.asarray(coords)
+    shape = tuple(coords.max(axis=0) + 1)
+    class_map, health_map = np.full(shape, np.nan), np.full(shape, np.nan)
+    class_map[coords[:, 0], coords[:, 1]] = class_preds
+    health_map[coords[:, 0], coords[:, 1]] = health_preds
+    return class_map, health_map
+
+def square_layout_maps(class_preds, health_preds):
+    """
+    Best-effort layout for stores that record no patch coordinates (MATLAB
+    conversions): patches are assumed to fill a near-square grid in order.
+    """
+    total_patches = len(class_preds)
+    patches_per_row = int(np.floor(np.sqrt(total_patches)))
+    while patches_per_row > 0 and total_patches % patches_per_row != 0:
+        patches_per_row -= 1
+    num_rows = total_patches // patches_per_row
+    return (np.array(class_preds, dtype=float).reshape(num_rows, patches_per_row),
+            np.array(health_preds, dtype=float).reshape(num_rows, patches_per_row))
+
+def generate_maps(class_preds, health_preds, class_names, event_name, output_dir, store_index=None, save_png=False):
+    """
+    Generates and saves the Disease Risk and Crop Stress maps.
+
+    Args:
+        class_preds, health_preds (list): One prediction per patch, in store order.
+        class_names (list): Disease name of each class label (runner.class_names).
+        event_name (str): Used in the output file names.
+        output_dir (str): Directory the maps are written to.
+        store_index (dict, optional): The event store's index.json. With its
+                                      'coords' and 'grid', GeoTIFFs are written.
+        save_png (bool): Also save a PNG preview.
+
+    Returns:
+        list: Paths of the files written.
+    """
+    print("\n--- Generating Health Maps ---")
+    if len(class_preds) == 0:
+        print("No predictions to map. Exiting.")
+        return []
+
+    store_index = store_index or {}
+    coords = store_index.get('coords')
+    written = []
+
+    if coords is not None and store_index.get('grid') and store_index.get('patch_size'):
+        if len(coords) != len(class_preds):
+            raise ValueError(f"{len(class_preds)} predictions for a store of {len(coords)} patches.")
+        tags = {'event': event_name, 'classes': json.dumps(list(class_names))}
+        written.append(write_patch_geotiff(os.path.join(output_dir, f'disease_class_{event_name}.tif'), class_preds, coords,
+                                           store_index['grid'], store_index['patch_size'], 'uint8', CLASS_NODATA, tags))
+        written.append(write_patch_geotiff(os.path.join(output_dir, f'predicted_ndvi_{event_name}.tif'), health_preds, coords,
+                                           store_index['grid'], store_index['patch_size'], 'float32', np.nan,
+                                           {'event': event_name}))
+        class_map, health_map = patch_grid_maps(class_preds, health_preds, coords)
+    else:
+        print("WARNING: The patch store records no patch coordinates or grid; no GeoTIFFs are written and the "
+              "PNG layout assumes patches fill a square grid in order.")
+        class_map, health_map = square_layout_maps(class_preds, health_preds)
+        save_png = True
+
+    if save_png:
+        written.append(save_png_preview(class_map, health_map, class_names, event_name,
+                                        os.path.join(output_dir, f'health_maps_{event_name}.png')))
+    for path in written:
+        print(f"Map saved to: {path}")
+    return written
@@ -0,0 +1,115 @@
+"""
+Builds inference-optimized models from a trained checkpoint.
+
+Training keeps gradient checkpointing and separate BatchNorm layers; neither
+helps at inference time. optimize_for_inference folds every ResNet BatchNorm
+into the preceding convolution's weights and, given example inputs, traces
+and freezes the whole model into a TorchScript graph. ResNetEncoder already
+skips checkpointing outside training, and predictions run under
+torch.inference_mode (see predictor.py).
+
+load_model starts fast and works offline: the architecture is built on the
+meta device without pretrained ImageNet weights (so nothing is downloaded or
+allocated), and the checkpoint is memory-mapped and assigned directly as the
+model's parameters instead of being copied into freshly initialised ones.
+"""
+import time
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+from src.config import globals as config
+from src.models.cnn_encoder import ResNetEncoder
+from src.models.light_encoder import LightEncoder
+from src.models.seq2seq_model import MultiModalSeq2Seq
+
+def model_dimensions(encoders):
+    """
+    Input sizes of the model for the current texture mode.
+
+    Returns:
+        tuple: (in_channels, num_tabular_features, num_classes).
+    """
+    num_tabular_features = 3 + len(encoders['crop'].categories_[0]) + len(encoders['disease'].categories_[0])
+    in_channels = config.NUM_IMAGE_CHANNELS
+    if config.TEXTURE_MODE == 'planes':
+        in_channels += config.NUM_TEXTURE_FEATURES
+    else:
+        num_tabular_features += config.NUM_TEXTURE_FEATURES
+    num_classes = len(set(meta['label'] for meta in config.EVENT_METADATA.values()))
+    return in_channels, num_tabular_features, num_classes
+
+# Encoder name -> checkpoint file in config.OUTPUT_MODEL_DIR
+MODEL_FILENAMES = {'resnet': 'best_crop_model.pth', 'light': 'best_crop_model_light.pth'}
+
+def build_model(encoders, pretrained=True, encoder='resnet'):
+    """Builds an untrained model for the current configuration with a 'resnet' or 'light' CNN encoder."""
+    in_channels, num_tabular_features, num_classes = model_dimensions(encoders)
+    if encoder == 'light':
+        cnn = LightEncoder(feature_vector_size=config.FEATURE_VECTOR_SIZE, in_channels=in_channels, width=config.LIGHT_ENCODER_WIDTH)
+    else:
+        cnn = ResNetEncoder(feature_vector_size=config.FEATURE_VECTOR_SIZE, in_channels=in_channels, pretrained=pretrained)
+    return MultiModalSeq2Seq(cnn, num_tabular_features, num_classes, cnn_chunk_size=config.CNN_CHUNK_SIZE)
+
+def load_model(model_path, encoders, device, encoder='resnet'):
+    """Builds the model and loads a trained checkpoint into it, in eval mode."""
+    start_time = time.perf_counter()
+    # Parameters on the meta device have a shape but no storage, and skip initialisation
+    with torch.device('meta'):
+        model = build_model(encoders, pretrained=False, encoder=encoder)
+    state_dict = torch.load(model_path, map_location='cpu', mmap=True, weights_only=True)
+    model.load_state_dict(state_dict, assign=True)
+    model = model.to(device).eval()
+    print(f"Model loaded in {time.perf_counter() - start_time:.2f}s.")
+    return model
+
+def fuse_resnet_batchnorm(cnn):
+    """Folds each BatchNorm of a ResNetEncoder into the convolution before it, in place."""
+    cnn.conv1 = fuse_conv_bn_eval(cnn.conv1, cnn.bn1)
+    cnn.bn1 = nn.Identity()
+    for layer in (cnn.layer1, cnn.layer2, cnn.layer3, cnn.layer4):
+        for block in layer:
+            block.conv1 = fuse_conv_bn_eval(block.conv1, block.bn1)
+            block.bn1 = nn.Identity()
+            block.conv2 = fuse_conv_bn_eval(block.conv2, block.bn2)
+            block.bn2 = nn.Identity()
+            if block.downsample is not None:
+                block.downsample = nn.Sequential(fuse_conv_bn_eval(block.downsample[0], block.downsample[1]))
+    return cnn
+
+def fuse_sequential_batchnorm(cnn):
+    """Folds every Conv2d -> BatchNorm2d pair inside nn.Sequential containers into the convolution, in place."""
+    for module in list(cnn.modules()):
+        if not isinstance(module, nn.Sequential):
+            continue
+        for i in range(len(module) - 1):
+            if isinstance(module[i], nn.Conv2d) and isinstance(module[i + 1], nn.BatchNorm2d):
+                module[i] = fuse_conv_bn_eval(module[i], module[i + 1])
+                module[i + 1] = nn.Identity()
+    return cnn
+
+def optimize_for_inference(model, example_inputs=None):
+    """
+    Returns an inference-only version of a trained model.
+
+    Args:
+        model (MultiModalSeq2Seq): Trained model; its CNN is modified in place.
+        example_inputs (tuple): Optional (X_img, X_tabular) batch. If given, the
+                                model is traced and frozen into TorchScript for
+                                inputs of this kind (images, not embeddings).
+                                Not done with config.CNN_CHUNK_SIZE set, since
+                                the chunk loop would be unrolled for this batch size.
+
+    Returns:
+        torch.nn.Module: The fused model, or the frozen TorchScript module.
+    """
+    model.eval()
+    if isinstance(model.cnn, ResNetEncoder):
+        fuse_resnet_batchnorm(model.cnn)
+    else:
+        fuse_sequential_batchnorm(model.cnn)
+    if example_inputs is None or model.cnn_chunk_size:
+        return model
+    # Tracing under inference_mode would bake inference tensors into the graph
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example_inputs, check_trace=False)
+    return torch.jit.freeze(traced)
@@ -24,7 +24,7 @@ def run_predictions(model, data_loader, device):
     all_class_preds = []
     all_health_preds = []
 
-    with torch.no_grad():
+    with torch.inference_mode():
         for (X_img_b, X_tab_b) in tqdm(data_loader, desc="Generating Predictions"):
             X_tab_b = X_tab_b.to(device)
             
@@ -0,0 +1,114 @@
+"""
+Post-training INT8 quantization for CPU inference.
+
+The ResNetEncoder, which dominates the cost, is statically quantized with FX
+graph mode: Conv+BN+ReLU are fused, observers are calibrated on a sample of
+real patch sequences, and the convolutions run as INT8 kernels. The LSTM and
+the Linear layers of the heads are dynamically quantized (INT8 weights,
+activations quantized on the fly), which needs no calibration.
+cnn_feature_bn stays in float.
+
+The quantized model is traced and saved as TorchScript, so inference loads
+it with torch.jit.load and no quantization code.
+"""
+import copy
+import time
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping, default_dynamic_qconfig, quantize_dynamic
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+QUANTIZED_ENGINE = 'x86'
+QUANTIZED_MODEL_FILENAME = 'best_crop_model_int8.pt' # In config.OUTPUT_MODEL_DIR
+
+def _batch_images(X_img_b):
+    """(B, T, C, H, W) sequence batch -> (B*T, C, H, W) images, as the CNN sees them."""
+    return X_img_b.reshape(-1, *X_img_b.shape[2:])
+
+def quantize_encoder(cnn, calibration_loader, num_batches):
+    """
+    Statically quantizes a float ResNetEncoder.
+
+    Args:
+        cnn (ResNetEncoder): Trained encoder (not modified).
+        calibration_loader (DataLoader): Yields ((X_img, X_tabular), targets) batches.
+        num_batches (int): Batches used to calibrate the activation observers.
+
+    Returns:
+        torch.fx.GraphModule: The INT8 encoder; takes and returns float tensors.
+    """
+    torch.backends.quantized.engine = QUANTIZED_ENGINE
+    cnn = copy.deepcopy(cnn).cpu().eval()
+    (X_img_b, _), _ = next(iter(calibration_loader))
+    example_inputs = (_batch_images(X_img_b)[:1],)
+    prepared = prepare_fx(cnn, get_default_qconfig_mapping(QUANTIZED_ENGINE), example_inputs)
+
+    with torch.inference_mode():
+        for i, ((X_img_b, _), _) in enumerate(calibration_loader):
+            if i >= num_batches:
+                break
+            prepared(_batch_images(X_img_b))
+    return convert_fx(prepared)
+
+def quantize_model(model, calibration_loader, num_batches):
+    """
+    Returns an INT8 copy of a trained MultiModalSeq2Seq for CPU inference:
+    static quantization for the CNN, dynamic quantization for the LSTM and heads.
+    """
+    model = copy.deepcopy(model).cpu().eval()
+    model.channels_last = False
+    quantized_cnn = quantize_encoder(model.cnn, calibration_loader, num_batches)
+    model.cnn = nn.Identity()
+    model = quantize_dynamic(model, {'encoder_rnn': default_dynamic_qconfig,
+                                     'fc_classify': default_dynamic_qconfig,
+                                     'fc_health': default_dynamic_qconfig})
+    model.cnn = quantized_cnn
+    return model
+
+def export_quantized_model(quantized_model, example_inputs, output_path):
+    """Traces the quantized model and saves it as TorchScript."""
+    with torch.no_grad():
+        traced = torch.jit.trace(quantized_model, example_inputs, check_trace=False)
+    torch.jit.save(traced, output_path)
+    return traced
+
+def evaluate(model, data_loader, max_batches=None):
+    """
+    Runs a model over labelled batches on CPU.
+
+    Returns:
+        dict: class predictions, health predictions, labels, health targets
+              (all tensors) and the mean latency per patch sequence in seconds.
+    """
+    class_preds, health_preds, labels, targets = [], [], [], []
+    elapsed, num_sequences = 0.0, 0
+    with torch.inference_mode():
+        for i, ((X_img_b, X_tab_b), (y_class_b, y_health_b)) in enumerate(data_loader):
+            if max_batches is not None and i >= max_batches:
+                break
+            start_time = time.perf_counter()
+            y_class_pred, y_health_pred = model(X_img_b, X_tab_b)
+            elapsed += time.perf_counter() - start_time
+            num_sequences += len(X_img_b)
+            class_preds.append(y_class_pred.argmax(dim=1))
+            health_preds.append(y_health_pred.float())
+            labels.append(y_class_b)
+            targets.append(y_health_b)
+    return {
+        'class_preds': torch.cat(class_preds), 'health_preds': torch.cat(health_preds),
+        'labels': torch.cat(labels), 'targets': torch.cat(targets),
+        'latency': elapsed / max(num_sequences, 1),
+    }
+
+def comparison_report(float_results, quantized_results):
+    """Accuracy and latency of the quantized model next to the float model, as text lines."""
+    lines = [f"{'Model':10s} | {'Accuracy':>8s} | {'Health MAE':>10s} | {'ms/sequence':>11s}"]
+    for name, results in (('float32', float_results), ('int8', quantized_results)):
+        accuracy = 100 * (results['class_preds'] == results['labels']).float().mean().item()
+        mae = (results['health_preds'] - results['targets']).abs().mean().item()
+        lines.append(f"{name:10s} | {accuracy:7.2f}% | {mae:10.4f} | {1000 * results['latency']:11.2f}")
+    agreement = 100 * (float_results['class_preds'] == quantized_results['class_preds']).float().mean().item()
+    health_diff = (float_results['health_preds'] - quantized_results['health_preds']).abs().max().item()
+    lines.append(f"Class agreement with float32: {agreement:.2f}% | max |health diff|: {health_diff:.4f} | "
+                 f"speedup: {float_results['latency'] / max(quantized_results['latency'], 1e-12):.2f}x")
+    return lines
@@ -0,0 +1,128 @@
+"""
+Minimal batch-prediction runner for an exported model (see export.py).
+
+Needs only torch, numpy and the patch store reader: the model graph and all
+preprocessing constants come from the exported file, so no torchvision,
+sklearn or training code is imported. Workers start in well under a second
+and can be scaled out, one event (or store directory) each.
+
+Predictions are saved as an .npz file with one entry per patch of the store:
+'class' (predicted label index), 'disease' (its name), 'health' (predicted
+future NDVI) and the patch grid 'coords' when the store records them.
+
+Example usage from the terminal in the project's root directory:
+> python -m src.inference.runner --model saved_models/crop_model_export.pt --event Bathinda-PinkBollworm
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+import torch
+from src.dataset.patch_store import open_event_store, open_event_texture
+
+PREPROCESSING_EXTRA_FILE = 'preprocessing.json' # Written by export.py
+
+def class_names(event_metadata):
+    """
+    Disease name of each class label, indexed by label. Labels are assigned in
+    EVENT_METADATA, independently of the disease encoder's sorted categories.
+    """
+    names = {meta['label']: meta['disease'] for meta in event_metadata.values()}
+    return [names[label] for label in range(len(names))]
+
+def load_exported_model(model_path):
+    """
+    Loads an exported model on the CPU.
+
+    Returns:
+        tuple: (TorchScript module, preprocessing constants dict).
+    """
+    extra_files = {PREPROCESSING_EXTRA_FILE: ''}
+    module = torch.jit.load(model_path, map_location='cpu', _extra_files=extra_files)
+    return module.eval(), json.loads(extra_files[PREPROCESSING_EXTRA_FILE])
+
+def tabular_sequence(constants, event_name, iot_values):
+    """(n_steps_in, F) tabular features: scaled IoT readings plus one-hot crop type and disease."""
+    meta = constants['event_metadata'][event_name]
+    iot_normalized = (np.asarray(iot_values, dtype=np.float64) - constants['iot_mean']) / constants['iot_scale']
+    one_hot = []
+    for categories, value in ((constants['crop_categories'], meta['crop_type']), (constants['disease_categories'], meta['disease'])):
+        encoded = np.zeros(len(categories))
+        if value in categories:
+            encoded[categories.index(value)] = 1.0
+        one_hot.append(encoded)
+    n_steps = len(iot_normalized)
+    return np.concatenate([iot_normalized] + [np.repeat(e[None], n_steps, axis=0) for e in one_hot], axis=1).astype(np.float32)
+
+def predict_event(module, constants, store_event_dir, event_name, iot_values, batch_size):
+    """
+    Predicts every patch of an event store from its first n_steps_in dates.
+
+    Returns:
+        tuple: (class predictions, health predictions) as numpy arrays.
+    """
+    n_steps = constants['n_steps_in']
+    patches, _ = open_event_store(store_event_dir)
+    texture = open_event_texture(store_event_dir)
+    if texture is None:
+        texture = np.zeros(patches.shape[:2] + (constants['num_texture_features'],), dtype=np.float32)
+    tabular = torch.from_numpy(tabular_sequence(constants, event_name, iot_values))
+
+    class_preds, health_preds = [], []
+    with torch.inference_mode():
+        for start in range(0, patches.shape[1], batch_size):
+            # Stores are laid out (T, B, H, W, C) and (T, B, 4)
+            images = np.array(patches[:n_steps, start:start + batch_size], dtype=np.float32)
+            texture_b = np.array(texture[:n_steps, start:start + batch_size], dtype=np.float32)
+            X_tab = tabular.expand(images.shape[1], -1, -1)
+            if constants['texture_mode'] == 'planes':
+                planes = np.broadcast_to(texture_b[:, :, None, None, :], images.shape[:4] + texture_b.shape[-1:])
+                images = np.concatenate([images, planes], axis=-1)
+            else:
+                X_tab = torch.cat([X_tab, torch.from_numpy(np.ascontiguousarray(texture_b.transpose(1, 0, 2)))], dim=2)
+            # -> (B, T, C, H, W)
+            X_img = torch.from_numpy(images).permute(1, 0, 4, 2, 3)
+
+            y_class_pred, y_health_pred = module(X_img, X_tab)
+            class_preds.append(y_class_pred.argmax(dim=1).numpy())
+            health_preds.append(y_health_pred.float().numpy())
+    return np.concatenate(class_preds), np.concatenate(health_preds)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run an exported crop health model over one event's patch store.")
+    parser.add_argument('--model', type=str, required=True, help='Exported model file (export.py).')
+    parser.add_argument('--store-dir', type=str, default='data/patch_store', help='Patch store directory.')
+    parser.add_argument('--event', type=str, required=True, help='Event to predict.')
+    parser.add_argument('--iot', type=str, default=None,
+                        help='.npy file of (n_steps_in, 3) IoT readings; defaults to the training mean.')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--output', type=str, default=None, help='Output .npz (default: predictions_<event>.npz).')
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    module, constants = load_exported_model(args.model)
+    print(f"Model loaded in {time.perf_counter() - start_time:.2f}s.")
+
+    if args.iot:
+        iot_values = np.load(args.iot)[:constants['n_steps_in']]
+    else:
+        print("No IoT readings given; using the training mean.")
+        iot_values = np.tile(constants['iot_mean'], (constants['n_steps_in'], 1))
+
+    store_event_dir = os.path.join(args.store_dir, args.event)
+    start_time = time.perf_counter()
+    class_preds, health_preds = predict_event(module, constants, store_event_dir, args.event, iot_values, args.batch_size)
+    elapsed = time.perf_counter() - start_time
+    print(f"Predicted {len(class_preds)} patches in {elapsed:.1f}s ({len(class_preds) / max(elapsed, 1e-9):.1f} patches/s).")
+
+    _, index = open_event_store(store_event_dir)
+    output_path = args.output or f"predictions_{args.event}.npz"
+    np.savez(output_path, **{
+        'class': class_preds,
+        # Exports written before 'class_names' was added carry the event metadata it comes from
+        'disease': np.array(constants.get('class_names') or class_names(constants['event_metadata']))[class_preds],
+        'health': health_preds,
+        'coords': np.array(index.get('coords') or [], dtype=np.int64),
+    })
+    print(f"Predictions saved to: {output_path}")
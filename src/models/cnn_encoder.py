@@ -1,6 +1,9 @@
 """
 CNN Feature Extractor using a pre-trained ResNet-34 model, adapted for
-10-channel satellite and texture data.
+multi-channel satellite data (6 image channels, or 10 with texture planes).
+
+With pretrained=False only the architecture is built (no ImageNet weight
+download or lookup), for when a trained checkpoint is loaded right after.
 """
 import torch
 import torch.nn as nn
@@ -8,20 +11,21 @@ from torchvision import models
 import torch.utils.checkpoint as checkpoint
 
 class ResNetEncoder(nn.Module):
-    def __init__(self, feature_vector_size=128):
+    def __init__(self, feature_vector_size=128, in_channels=10, pretrained=True):
         super(ResNetEncoder, self).__init__()
-        resnet = models.resnet34(weights=models.ResNet34_Weights.DEFAULT)
+        resnet = models.resnet34(weights=models.ResNet34_Weights.DEFAULT if pretrained else None)
         original_conv1 = resnet.conv1
         
-        # Adapt the first layer for 10-channel input
-        new_conv1 = nn.Conv2d(10, 64, kernel_size=7, stride=2, padding=3, bias=False)
-        with torch.no_grad():
-            # Copy original weights for the first 3 (RGB) channels
-            new_conv1.weight[:, :3, :, :] = original_conv1.weight.clone()
-            # Initialize other channels by averaging the RGB weights
-            new_conv1.weight[:, 3:, :, :] = torch.mean(
-                original_conv1.weight, dim=1, keepdim=True
-            ).repeat(1, 7, 1, 1)
+        # Adapt the first layer for multi-channel input
+        new_conv1 = nn.Conv2d(in_channels, 64, kernel_size=7, stride=2, padding=3, bias=False)
+        if pretrained:
+            with torch.no_grad():
+                # Copy original weights for the first 3 (RGB) channels
+                new_conv1.weight[:, :3, :, :] = original_conv1.weight.clone()
+                # Initialize other channels by averaging the RGB weights
+                new_conv1.weight[:, 3:, :, :] = torch.mean(
+                    original_conv1.weight, dim=1, keepdim=True
+                ).repeat(1, in_channels - 3, 1, 1)
         
         self.conv1 = new_conv1
         self.bn1 = resnet.bn1
@@ -42,11 +46,15 @@ class ResNetEncoder(nn.Module):
         x = self.relu(x)
         x = self.maxpool(x)
 
-        # Use gradient checkpointing to save memory
-        x = checkpoint.checkpoint(self.layer1, x, use_reentrant=False)
-        x = checkpoint.checkpoint(self.layer2, x, use_reentrant=False)
-        x = checkpoint.checkpoint(self.layer3, x, use_reentrant=False)
-        x = checkpoint.checkpoint(self.layer4, x, use_reentrant=False)
+        if self.training and torch.is_grad_enabled():
+            # Use gradient checkpointing to save memory
+            x = checkpoint.checkpoint(self.layer1, x, use_reentrant=False)
+            x = checkpoint.checkpoint(self.layer2, x, use_reentrant=False)
+            x = checkpoint.checkpoint(self.layer3, x, use_reentrant=False)
+            x = checkpoint.checkpoint(self.layer4, x, use_reentrant=False)
+        else:
+            # Nothing to save memory for without a backward pass
+            x = self.layer4(self.layer3(self.layer2(self.layer1(x))))
 
         x = self.avgpool(x)
         x = torch.flatten(x, 1)
@@ -0,0 +1,47 @@
+"""
+Lightweight CNN feature extractor for high-throughput map generation.
+
+A MobileNet-style stack of depthwise-separable convolutions with the same
+interface as ResNetEncoder (in_channels in, feature_vector_size out, an `fc`
+output layer), at a small fraction of ResNet-34's compute. It is trained by
+distillation from a trained ResNetEncoder model (train.py --distill).
+"""
+import torch
+import torch.nn as nn
+
+def conv_bn_relu(in_channels, out_channels, stride, kernel_size=3, groups=1):
+    return nn.Sequential(
+        nn.Conv2d(in_channels, out_channels, kernel_size, stride=stride, padding=kernel_size // 2, groups=groups, bias=False),
+        nn.BatchNorm2d(out_channels),
+        nn.ReLU(inplace=True),
+    )
+
+def depthwise_separable(in_channels, out_channels, stride):
+    """A per-channel 3x3 convolution followed by a 1x1 convolution mixing channels."""
+    return nn.Sequential(
+        conv_bn_relu(in_channels, in_channels, stride, groups=in_channels),
+        conv_bn_relu(in_channels, out_channels, 1, kernel_size=1),
+    )
+
+class LightEncoder(nn.Module):
+    def __init__(self, feature_vector_size=128, in_channels=10, width=32):
+        super(LightEncoder, self).__init__()
+        self.features = nn.Sequential(
+            conv_bn_relu(in_channels, width, 2),
+            depthwise_separable(width, 2 * width, 2),
+            depthwise_separable(2 * width, 2 * width, 1),
+            depthwise_separable(2 * width, 4 * width, 2),
+            depthwise_separable(4 * width, 4 * width, 1),
+            depthwise_separable(4 * width, 8 * width, 2),
+            depthwise_separable(8 * width, 8 * width, 1),
+            depthwise_separable(8 * width, 16 * width, 2),
+        )
+        self.avgpool = nn.AdaptiveAvgPool2d((1, 1))
+        self.fc = nn.Linear(16 * width, feature_vector_size)
+
+    def forward(self, x):
+        x = self.features(x)
+        x = self.avgpool(x)
+        x = torch.flatten(x, 1)
+        x = self.fc(x)
+        return x
@@ -1,14 +1,25 @@
 """
 The main multi-modal sequence model. Fuses image features with tabular data
 and performs multi-task learning for classification and health prediction.
+
+The CNN encodes all timesteps of a batch together: (B, T, C, H, W) is folded
+into (B*T, C, H, W), optionally in chunks of cnn_chunk_size images to cap
+activation memory. In eval mode this matches encoding one timestep at a time
+exactly; in train mode the ResNet's BatchNorm layers see batch statistics over
+B*T (or chunk-sized) batches instead of B.
+
+forward also accepts precomputed (B, T, F) CNN embeddings in place of images
+(see src/dataset/embedding_cache.py), in which case the CNN is skipped.
 """
 import torch
 import torch.nn as nn
 
 class MultiModalSeq2Seq(nn.Module):
-    def __init__(self, cnn, num_tabular_features, num_classes, rnn_hidden_size=256, num_rnn_layers=2):
+    def __init__(self, cnn, num_tabular_features, num_classes, rnn_hidden_size=256, num_rnn_layers=2, cnn_chunk_size=None):
         super(MultiModalSeq2Seq, self).__init__()
         self.cnn = cnn
+        self.cnn_chunk_size = cnn_chunk_size
+        self.channels_last = False
         cnn_feature_size = self.cnn.fc.out_features
         
         self.cnn_feature_bn = nn.BatchNorm1d(cnn_feature_size)
@@ -34,19 +45,38 @@ class MultiModalSeq2Seq(nn.Module):
             nn.Linear(rnn_hidden_size // 4, 1)
         )
 
+    def to_channels_last(self):
+        """Stores the CNN's weights, and feeds it images, in channels_last (NHWC) memory format."""
+        self.cnn.to(memory_format=torch.channels_last)
+        self.channels_last = True
+        return self
+
+    def encode_images(self, image_seq):
+        """
+        Runs the CNN over every image of a (B, T, C, H, W) sequence batch.
+
+        Returns:
+            torch.Tensor: (B*T, F) features, batch-major like image_seq.
+        """
+        batch_size, timesteps, C, H, W = image_seq.shape
+        images = image_seq.reshape(batch_size * timesteps, C, H, W)
+        if self.channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+        chunk_size = self.cnn_chunk_size or len(images)
+        if chunk_size >= len(images):
+            return self.cnn(images)
+        return torch.cat([self.cnn(images[i:i + chunk_size]) for i in range(0, len(images), chunk_size)])
+
     def forward(self, image_seq, tabular_seq):
         device = tabular_seq.device
-        batch_size, timesteps, C, H, W = image_seq.shape
-        
-        cnn_features_list = []
-        for t in range(timesteps):
-            image_timestep = image_seq[:, t, :, :, :].to(device)
-            cnn_out = self.cnn(image_timestep)
-            cnn_features_list.append(cnn_out)
-        
-        cnn_features = torch.stack(cnn_features_list, dim=1)
+        batch_size, timesteps = image_seq.shape[:2]
         
-        cnn_features_flat = cnn_features.view(-1, self.cnn.fc.out_features)
+        if image_seq.dim() == 3:
+            # Cached (B, T, F) embeddings
+            cnn_features_flat = image_seq.to(device, non_blocking=True).reshape(batch_size * timesteps, -1)
+        else:
+            # One host-to-device copy for the whole sequence batch
+            cnn_features_flat = self.encode_images(image_seq.to(device, non_blocking=True))
         cnn_features_bn = self.cnn_feature_bn(cnn_features_flat)
         cnn_features = cnn_features_bn.view(batch_size, timesteps, -1)
 
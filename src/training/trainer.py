@@ -1,64 +1,144 @@
 """
 Contains the main training and validation loop logic.
+
+Mixed precision follows the device: float16 autocast with a GradScaler on
+CUDA, bfloat16 autocast (no scaler needed) on CPU, or full float32 when
+config.PRECISION is 'fp32'. Losses and accuracy counts are accumulated on the
+device and read back once per epoch.
+
+With a teacher model, the student is trained by distillation: besides the
+usual label losses it matches the teacher's CNN features, its softened class
+distribution and its health prediction (weights in config.DISTILL_*).
 """
-import torch
 import os
+import time
+import torch
+import torch.nn.functional as F
 from torch.amp import GradScaler, autocast
 from src.config import globals as config
 
-def train_model(model, train_loader, val_loader, optimizer, class_criterion, health_criterion, device):
-    scaler = GradScaler()
+def autocast_dtype(device, precision):
+    """
+    The autocast dtype for a device and precision setting ('auto', 'bf16',
+    'fp16' or 'fp32'), or None to train in float32.
+    """
+    if precision == 'auto':
+        precision = 'fp16' if device.type == 'cuda' else 'bf16'
+    return {'bf16': torch.bfloat16, 'fp16': torch.float16, 'fp32': None}[precision]
+
+def distillation_loss(student, teacher, X_img_b, X_tab_b, y_class_b, y_health_b, class_criterion, health_criterion):
+    """
+    Label losses of the student plus the distillation terms.
+
+    Returns:
+        tuple: (loss, student class logits, student health predictions).
+    """
+    images = X_img_b.to(X_tab_b.device, non_blocking=True)
+    batch_size, timesteps = images.shape[:2]
+    with torch.no_grad():
+        teacher_features = teacher.encode_images(images)
+        teacher_class, teacher_health = teacher(teacher_features.view(batch_size, timesteps, -1), X_tab_b)
+    student_features = student.encode_images(images)
+    # Precomputed features skip the CNN in forward, so the student is encoded once
+    student_class, student_health = student(student_features.view(batch_size, timesteps, -1), X_tab_b)
+
+    temperature = config.DISTILL_TEMPERATURE
+    loss = class_criterion(student_class, y_class_b) + config.HEALTH_LOSS_WEIGHT * health_criterion(student_health.float(), y_health_b)
+    loss = loss + config.DISTILL_FEATURE_WEIGHT * F.mse_loss(student_features.float(), teacher_features.float())
+    loss = loss + config.DISTILL_LOGIT_WEIGHT * temperature ** 2 * F.kl_div(
+        F.log_softmax(student_class.float() / temperature, dim=1), F.softmax(teacher_class.float() / temperature, dim=1),
+        reduction='batchmean')
+    loss = loss + config.DISTILL_HEALTH_WEIGHT * F.mse_loss(student_health.float(), teacher_health.float())
+    return loss, student_class, student_health
+
+def train_model(model, train_loader, val_loader, optimizer, class_criterion, health_criterion, device,
+                teacher=None, checkpoint_name='best_crop_model.pth'):
+    amp_dtype = autocast_dtype(device, config.PRECISION)
+    # Loss scaling is only needed for float16 gradients
+    scaler = GradScaler(device.type, enabled=amp_dtype == torch.float16)
+    if config.CHANNELS_LAST:
+        model.to_channels_last()
+        if teacher is not None:
+            teacher.to_channels_last()
+    if teacher is not None:
+        teacher.eval()
+    # The compiled wrapper shares its parameters with model, which is what gets saved
+    step_model = torch.compile(model) if config.COMPILE_MODEL else model
+    run_config = (f"precision={amp_dtype or torch.float32}, channels_last={config.CHANNELS_LAST}, "
+                  f"compiled={config.COMPILE_MODEL}, distilled={teacher is not None}")
+    print(f"Training with {run_config}")
     best_val_accuracy = 0.0
 
     for epoch in range(1, config.EPOCHS + 1):
         model.train()
-        train_loss = 0.0
-        
+        train_loss = torch.zeros((), device=device)
+        skipped_steps = torch.zeros((), dtype=torch.long, device=device)
+        num_samples = 0
+        epoch_start = time.perf_counter()
+
         for (X_img_b, X_tab_b), (y_class_b, y_health_b) in train_loader:
-            X_tab_b = X_tab_b.to(device)
-            y_class_b = y_class_b.to(device)
-            y_health_b = y_health_b.to(device)
+            X_tab_b = X_tab_b.to(device, non_blocking=True)
+            y_class_b = y_class_b.to(device, non_blocking=True)
+            y_health_b = y_health_b.to(device, non_blocking=True)
             optimizer.zero_grad(set_to_none=True)
 
-            with autocast(device_type="cuda"):
-                y_class_pred, y_health_pred = model(X_img_b, X_tab_b)
-                loss_class = class_criterion(y_class_pred, y_class_b)
-                loss_health = health_criterion(y_health_pred, y_health_b)
-                loss = loss_class + (config.HEALTH_LOSS_WEIGHT * loss_health)
-            
-            if not torch.isfinite(loss):
+            with autocast(device_type=device.type, dtype=amp_dtype, enabled=amp_dtype is not None):
+                if teacher is not None:
+                    loss, y_class_pred, y_health_pred = distillation_loss(step_model, teacher, X_img_b, X_tab_b, y_class_b,
+                                                                          y_health_b, class_criterion, health_criterion)
+                else:
+                    y_class_pred, y_health_pred = step_model(X_img_b, X_tab_b)
+                    loss_class = class_criterion(y_class_pred, y_class_b)
+                    loss_health = health_criterion(y_health_pred.float(), y_health_b)
+                    loss = loss_class + (config.HEALTH_LOSS_WEIGHT * loss_health)
+
+            finite = torch.isfinite(loss)
+            if not scaler.is_enabled() and not finite:
+                # Without a scaler the check needs the loss value; on CPU that is not a device sync
                 print(f"WARNING: Skipping update at epoch {epoch} due to non-finite loss.")
                 continue
-            
+
+            # With a scaler, steps with non-finite gradients are skipped by scaler.step
             scaler.scale(loss).backward()
             scaler.unscale_(optimizer)
             torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
             scaler.step(optimizer)
             scaler.update()
-            
-            train_loss += loss.item()
-        
+
+            train_loss += torch.where(finite, loss.detach().float(), 0.0)
+            skipped_steps += ~finite
+            num_samples += len(y_class_b)
+        train_time = time.perf_counter() - epoch_start
+
         # --- Validation Loop ---
         model.eval()
-        val_loss, correct, total = 0.0, 0, 0
+        val_loss = torch.zeros((), device=device)
+        correct = torch.zeros((), dtype=torch.long, device=device)
+        total = 0
         with torch.no_grad():
             for (X_img_b, X_tab_b), (y_class_b, y_health_b) in val_loader:
-                X_tab_b, y_class_b, y_health_b = X_tab_b.to(device), y_class_b.to(device), y_health_b.to(device)
-                with autocast(device_type="cuda"):
-                    y_class_pred, y_health_pred = model(X_img_b, X_tab_b)
+                X_tab_b = X_tab_b.to(device, non_blocking=True)
+                y_class_b = y_class_b.to(device, non_blocking=True)
+                y_health_b = y_health_b.to(device, non_blocking=True)
+                with autocast(device_type=device.type, dtype=amp_dtype, enabled=amp_dtype is not None):
+                    y_class_pred, y_health_pred = step_model(X_img_b, X_tab_b)
                     loss_class = class_criterion(y_class_pred, y_class_b)
-                    loss_health = health_criterion(y_health_pred, y_health_b)
+                    loss_health = health_criterion(y_health_pred.float(), y_health_b)
                     loss = loss_class + (config.HEALTH_LOSS_WEIGHT * loss_health)
-                
-                val_loss += loss.item()
-                _, predicted = torch.max(y_class_pred.data, 1)
+
+                val_loss += loss.float()
+                _, predicted = torch.max(y_class_pred, 1)
                 total += y_class_b.size(0)
-                correct += (predicted == y_class_b).sum().item()
+                correct += (predicted == y_class_b).sum()
 
-        val_accuracy = 100 * correct / total
-        print(f'Epoch [{epoch:02d}/{config.EPOCHS}] | Train Loss: {train_loss/len(train_loader):.4f} | Val Loss: {val_loss/len(val_loader):.4f} | Val Accuracy: {val_accuracy:.2f}%')
+        # The only host syncs of the epoch
+        train_loss, val_loss = train_loss.item(), val_loss.item()
+        val_accuracy = 100 * correct.item() / total
+        if skipped_steps.item():
+            print(f"WARNING: {skipped_steps.item()} updates at epoch {epoch} were skipped due to non-finite loss.")
+        print(f'Epoch [{epoch:02d}/{config.EPOCHS}] | Train Loss: {train_loss/len(train_loader):.4f} | Val Loss: {val_loss/len(val_loader):.4f} | Val Accuracy: {val_accuracy:.2f}% | {num_samples / train_time:.1f} samples/s ({run_config})')
 
         if val_accuracy > best_val_accuracy:
             best_val_accuracy = val_accuracy
-            torch.save(model.state_dict(), os.path.join(config.OUTPUT_MODEL_DIR, 'best_crop_model.pth'))
+            torch.save(model.state_dict(), os.path.join(config.OUTPUT_MODEL_DIR, checkpoint_name))
             print(f"  -> New best model saved with accuracy: {best_val_accuracy:.2f}%")
@@ -0,0 +1,61 @@
+import os
+import sys
+import json
+import numpy as np
+import pytest
+
+# Tests import the project as `src.…`, like the scripts in the root directory
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+@pytest.fixture
+def randomize_batchnorm():
+    """Gives every BatchNorm layer of a module non-trivial running statistics and affine parameters."""
+    torch = pytest.importorskip('torch')
+
+    def randomize(module, seed=0):
+        generator = torch.Generator().manual_seed(seed)
+        with torch.no_grad():
+            for layer in module.modules():
+                if isinstance(layer, torch.nn.modules.batchnorm._BatchNorm):
+                    size = layer.num_features
+                    layer.running_mean.copy_(torch.randn(size, generator=generator) * 0.1)
+                    layer.running_var.copy_(torch.rand(size, generator=generator) + 0.5)
+                    layer.weight.copy_(torch.rand(size, generator=generator) + 0.5)
+                    layer.bias.copy_(torch.randn(size, generator=generator) * 0.1)
+        return module
+    return randomize
+
+@pytest.fixture
+def make_event_store(tmp_path):
+    """Writes a small random patch store (patches, texture, index.json) for an event; returns the store directory."""
+    from src.dataset.patch_store import STORE_FILENAME, TEXTURE_FILENAME, INDEX_FILENAME, NUM_TEXTURE_FEATURES
+    store_dir = tmp_path / 'store'
+
+    def make(event_name, num_dates, num_patches, num_channels, size=8, seed=0):
+        rng = np.random.default_rng(seed)
+        store_event_dir = store_dir / event_name
+        store_event_dir.mkdir(parents=True)
+        shape = (num_dates, num_patches, size, size, num_channels)
+        np.save(store_event_dir / STORE_FILENAME, rng.random(shape, dtype=np.float32))
+        np.save(store_event_dir / TEXTURE_FILENAME, rng.random((num_dates, num_patches, NUM_TEXTURE_FEATURES), dtype=np.float32))
+        with open(store_event_dir / INDEX_FILENAME, 'w') as f:
+            json.dump({'dates': [f'2023-01-{d + 1:02d}' for d in range(num_dates)], 'shape': list(shape),
+                       'dtype': 'float32'}, f)
+        return str(store_dir)
+    return make
+
+@pytest.fixture
+def preprocessing():
+    """(iot_data, scalers, encoders) for every configured event, fitted like in train.py."""
+    sklearn_preprocessing = pytest.importorskip('sklearn.preprocessing')
+    from src.config import globals as config
+
+    rng = np.random.default_rng(0)
+    iot_data = {event: rng.random((config.N_STEPS_IN + config.N_STEPS_OUT, 3)) for event in config.EVENT_METADATA}
+    scalers = {'iot': sklearn_preprocessing.StandardScaler().fit(rng.random((100, 3)))}
+    encoders = {
+        name: sklearn_preprocessing.OneHotEncoder(handle_unknown='ignore', sparse_output=False).fit(
+            [[meta[key]] for meta in config.EVENT_METADATA.values()])
+        for name, key in (('crop', 'crop_type'), ('disease', 'disease'))
+    }
+    return iot_data, scalers, encoders
@@ -0,0 +1,64 @@
+"""
+The block-wise patch selection and strip cutting of create_patches against
+the original per-patch loop.
+"""
+import os
+import numpy as np
+import pytest
+
+scipy_io = pytest.importorskip('scipy.io')
+pytest.importorskip('PIL')
+
+from src.data_preprocessing.create_patches import create_and_save_individual_patches
+
+PATCH_SIZE, NUM_BANDS = 10, 6
+# Not a multiple of the patch size: the last rows and columns belong to no patch
+HEIGHT, WIDTH = 43, 57
+
+def make_bands(tmp_path):
+    rng = np.random.default_rng(0)
+    bands = rng.random((NUM_BANDS, HEIGHT, WIDTH), dtype=np.float32) + 0.5
+    # Non-zero NIR pixels per cell, around the 10% threshold (10 of 100 is valid, 9 is not)
+    counts = rng.choice([0, 9, 10, 11, 50, 100], size=(HEIGHT // PATCH_SIZE, WIDTH // PATCH_SIZE))
+    nir = np.zeros((HEIGHT, WIDTH), dtype=np.float32)
+    for (y_idx, x_idx), count in np.ndenumerate(counts):
+        cell = np.zeros(PATCH_SIZE * PATCH_SIZE, dtype=np.float32)
+        cell[rng.permutation(cell.size)[:count]] = rng.random(count, dtype=np.float32) + 0.5
+        nir[y_idx * PATCH_SIZE:(y_idx + 1) * PATCH_SIZE, x_idx * PATCH_SIZE:(x_idx + 1) * PATCH_SIZE] = cell.reshape(PATCH_SIZE, PATCH_SIZE)
+    nir[HEIGHT // PATCH_SIZE * PATCH_SIZE:] = 1 # Outside every patch
+    bands[3] = nir
+
+    paths = []
+    for c, band in enumerate(bands):
+        paths.append(str(tmp_path / f'band_{c}.npy'))
+        np.save(paths[-1], band)
+    return bands, paths
+
+def naive_patches(bands):
+    """The original loop: check each grid cell's NIR coverage and cut it band by band."""
+    patches = {}
+    for y_idx in range(HEIGHT // PATCH_SIZE):
+        for x_idx in range(WIDTH // PATCH_SIZE):
+            start_y, start_x = y_idx * PATCH_SIZE, x_idx * PATCH_SIZE
+            nir_patch_slice = bands[3][start_y:start_y+PATCH_SIZE, start_x:start_x+PATCH_SIZE]
+            if np.count_nonzero(nir_patch_slice) / nir_patch_slice.size < 0.1:
+                continue
+            full_patch = np.zeros((PATCH_SIZE, PATCH_SIZE, NUM_BANDS), dtype=np.float32)
+            for c, band_data in enumerate(bands):
+                full_patch[:, :, c] = band_data[start_y:start_y+PATCH_SIZE, start_x:start_x+PATCH_SIZE]
+            patches[f"patch_{y_idx}_{x_idx}.mat"] = full_patch
+    return patches
+
+def test_selects_and_cuts_the_same_patches_as_the_per_patch_loop(tmp_path):
+    bands, paths = make_bands(tmp_path)
+    output_dir, viz_dir = tmp_path / 'patches', tmp_path / 'viz'
+    output_dir.mkdir()
+    viz_dir.mkdir()
+
+    create_and_save_individual_patches(paths, '2023-01-01', PATCH_SIZE, str(output_dir), str(viz_dir))
+
+    expected = naive_patches(bands)
+    assert 0 < len(expected) < (HEIGHT // PATCH_SIZE) * (WIDTH // PATCH_SIZE)
+    assert sorted(os.listdir(output_dir)) == sorted(expected)
+    for filename, patch in expected.items():
+        np.testing.assert_array_equal(scipy_io.loadmat(str(output_dir / filename))['patch_data'], patch)
@@ -0,0 +1,57 @@
+"""
+Sample lists of the training datasets built over small patch stores, and
+the train/validation split train.py records for them.
+"""
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from src.config import globals as config
+from src.dataset.dataset import LocalSequenceDataset, save_split, load_split
+from src.dataset.embedding_cache import EmbeddingSequenceDataset, EMBEDDINGS_FILENAME, NDVI_MEANS_FILENAME
+
+EVENTS = list(config.EVENT_METADATA)[:2]
+NUM_DATES = config.N_STEPS_IN + config.N_STEPS_OUT
+
+def event_metadata(event_names):
+    return {event_name: config.EVENT_METADATA[event_name] for event_name in event_names}
+
+def test_store_with_other_image_channels_is_skipped(make_event_store, preprocessing):
+    make_event_store(EVENTS[0], NUM_DATES, 3, config.NUM_IMAGE_CHANNELS)
+    store_dir = make_event_store(EVENTS[1], NUM_DATES, 2, config.NUM_IMAGE_CHANNELS + 1)
+
+    dataset = LocalSequenceDataset(store_dir, event_metadata(EVENTS), *preprocessing)
+    assert len(dataset) == 3 and {sample['event'] for sample in dataset.samples} == {EVENTS[0]}
+    assert EVENTS[1] not in dataset.event_store_dirs and EVENTS[1] not in dataset._open_stores
+
+def test_embedding_dataset_checks_the_image_store(make_event_store, preprocessing, tmp_path):
+    store_dir = make_event_store(EVENTS[0], NUM_DATES, 3, config.NUM_IMAGE_CHANNELS)
+    cache_event_dir = tmp_path / 'cache' / EVENTS[0]
+    cache_event_dir.mkdir(parents=True)
+    rng = np.random.default_rng(0)
+    np.save(cache_event_dir / EMBEDDINGS_FILENAME, rng.random((NUM_DATES, 3, config.FEATURE_VECTOR_SIZE), dtype=np.float32))
+    np.save(cache_event_dir / NDVI_MEANS_FILENAME, rng.random((NUM_DATES, 3), dtype=np.float32))
+
+    # The cached embeddings have FEATURE_VECTOR_SIZE channels, the image store NUM_IMAGE_CHANNELS
+    dataset = EmbeddingSequenceDataset(store_dir, str(tmp_path / 'cache'), event_metadata(EVENTS[:1]), *preprocessing)
+    assert len(dataset) == 3
+    (X_emb, _), _ = dataset[1]
+    assert X_emb.shape == (config.N_STEPS_IN, config.FEATURE_VECTOR_SIZE)
+
+def test_split_round_trips_by_event_and_patch(make_event_store, preprocessing, tmp_path):
+    make_event_store(EVENTS[0], NUM_DATES, 3, config.NUM_IMAGE_CHANNELS)
+    store_dir = make_event_store(EVENTS[1], NUM_DATES, 2, config.NUM_IMAGE_CHANNELS)
+    dataset = LocalSequenceDataset(store_dir, event_metadata(EVENTS), *preprocessing)
+    split_path = str(tmp_path / 'split.json')
+    save_split(split_path, dataset, [4, 0, 2], [1, 3])
+
+    train, val = load_split(split_path, dataset)
+    assert train.indices == [4, 0, 2] and val.indices == [1, 3]
+    assert train.dataset is dataset and val.dataset is dataset
+
+    # Rebuilt without the first event: its samples are in neither subset, the others keep their keys
+    rebuilt = LocalSequenceDataset(store_dir, event_metadata(EVENTS[1:]), *preprocessing)
+    train, val = load_split(split_path, rebuilt)
+    keys = lambda subset: [(rebuilt.samples[i]['event'], rebuilt.samples[i]['patch_idx']) for i in subset.indices]
+    assert keys(train) == [(EVENTS[1], 1)] and keys(val) == [(EVENTS[1], 0)]
@@ -0,0 +1,66 @@
+"""
+Training on cached CNN embeddings (EmbeddingSequenceDataset) against
+encoding the image sequences of LocalSequenceDataset directly.
+"""
+import os
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from src.config import globals as config
+from src.dataset.dataset import LocalSequenceDataset
+from src.dataset.embedding_cache import (ENCODER_FILENAME, CACHE_META_FILENAME, build_embedding_cache,
+                                         latest_cache_encoder, EmbeddingSequenceDataset)
+from src.models.light_encoder import LightEncoder
+
+EVENTS = list(config.EVENT_METADATA)[:2]
+NUM_DATES = config.N_STEPS_IN + config.N_STEPS_OUT + 1
+
+def make_encoder(seed):
+    torch.manual_seed(seed)
+    in_channels = config.NUM_IMAGE_CHANNELS + (config.NUM_TEXTURE_FEATURES if config.TEXTURE_MODE == 'planes' else 0)
+    return LightEncoder(feature_vector_size=16, in_channels=in_channels, width=4).eval()
+
+@pytest.fixture
+def toy_store(make_event_store):
+    make_event_store(EVENTS[0], NUM_DATES, 3, config.NUM_IMAGE_CHANNELS, seed=0)
+    return make_event_store(EVENTS[1], NUM_DATES, 2, config.NUM_IMAGE_CHANNELS, seed=1)
+
+def test_cached_samples_match_encoding_the_images(toy_store, preprocessing, tmp_path):
+    cnn = make_encoder(0)
+    metadata = {event_name: config.EVENT_METADATA[event_name] for event_name in EVENTS}
+    encoder_cache_dir = build_embedding_cache(cnn, toy_store, EVENTS, str(tmp_path / 'cache'), 'cpu', batch_size=2)
+
+    cached = EmbeddingSequenceDataset(toy_store, encoder_cache_dir, metadata, *preprocessing)
+    images = LocalSequenceDataset(toy_store, metadata, *preprocessing)
+    assert len(cached) == len(images) == 5
+    assert cached.samples == images.samples
+
+    for idx in (0, 4):
+        (X_emb, X_tab_cached), (y_class_cached, y_health_cached) = cached[idx]
+        (X_img, X_tab), (y_class, y_health) = images[idx]
+        with torch.no_grad():
+            expected = cnn(X_img)
+        torch.testing.assert_close(X_emb, expected, rtol=1e-4, atol=1e-5)
+        torch.testing.assert_close(X_tab_cached, X_tab)
+        assert y_class_cached == y_class
+        assert y_health_cached == pytest.approx(y_health, rel=1e-5)
+
+def test_cache_keeps_its_encoder_for_reuse(toy_store, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    cnn = make_encoder(0)
+    encoder_cache_dir = build_embedding_cache(cnn, toy_store, EVENTS, cache_dir, 'cpu', batch_size=2)
+    meta_path = os.path.join(encoder_cache_dir, EVENTS[0], CACHE_META_FILENAME)
+    built_at = os.stat(meta_path).st_mtime_ns
+    assert latest_cache_encoder(cache_dir) == os.path.join(encoder_cache_dir, ENCODER_FILENAME)
+
+    # Another randomly initialised encoder gets its own cache
+    other_cache_dir = build_embedding_cache(make_encoder(1), toy_store, EVENTS, cache_dir, 'cpu', batch_size=2)
+    assert other_cache_dir != encoder_cache_dir
+
+    # Loading the saved encoder explicitly reuses the first cache without re-encoding
+    reloaded = make_encoder(2)
+    reloaded.load_state_dict(torch.load(os.path.join(encoder_cache_dir, ENCODER_FILENAME)))
+    assert build_embedding_cache(reloaded, toy_store, EVENTS, cache_dir, 'cpu', batch_size=2) == encoder_cache_dir
+    assert os.stat(meta_path).st_mtime_ns == built_at
+    assert latest_cache_encoder(cache_dir) == os.path.join(encoder_cache_dir, ENCODER_FILENAME)
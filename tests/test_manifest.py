@@ -0,0 +1,83 @@
+"""
+The incremental-skip bookkeeping of the preprocessing manifest.
+"""
+import os
+from src.data_preprocessing.manifest import (fingerprint_files, date_entry, is_date_current, prune_dates,
+                                             count_patch_files, load_manifest, save_manifest)
+
+GRID = {'crs': 'EPSG:32643', 'transform': [30, 0, 0, 0, -30, 0], 'shape': [512, 512]}
+
+def write_band(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+def build_date(tmp_path, date_str, num_patches=2):
+    """One raw band file and the patch files its date task would write; returns (entry, output_dir)."""
+    band_path = str(tmp_path / f'{date_str}_B04.tif')
+    write_band(band_path, b'band data')
+    output_dir = tmp_path / 'processed' / date_str
+    output_dir.mkdir(parents=True)
+    for x_idx in range(num_patches):
+        (output_dir / f'patch_0_{x_idx}.mat').write_bytes(b'')
+    return band_path, str(output_dir)
+
+def record(manifest, date_str, band_path, output_dir):
+    """What run_pipeline's record_date stores once a date task finishes."""
+    entry = date_entry(fingerprint_files([band_path]), GRID)
+    manifest['dates'][date_str] = dict(entry, has_patches=True, num_patches=count_patch_files(output_dir))
+
+def test_unchanged_date_is_current(tmp_path):
+    manifest = load_manifest(str(tmp_path))
+    band_path, output_dir = build_date(tmp_path, '2023-01-01')
+    record(manifest, '2023-01-01', band_path, output_dir)
+    save_manifest(str(tmp_path), manifest)
+
+    reloaded = load_manifest(str(tmp_path))
+    entry = date_entry(fingerprint_files([band_path]), GRID)
+    assert is_date_current(reloaded, '2023-01-01', entry, output_dir)
+
+def test_changed_inputs_grid_or_settings_are_stale(tmp_path):
+    manifest = load_manifest(str(tmp_path))
+    band_path, output_dir = build_date(tmp_path, '2023-01-01')
+    record(manifest, '2023-01-01', band_path, output_dir)
+
+    assert not is_date_current(manifest, '2023-01-01', date_entry(fingerprint_files([band_path]), dict(GRID, shape=[256, 512])), output_dir)
+    changed_config = dict(date_entry(fingerprint_files([band_path]), GRID), config={'patch_size': 128})
+    assert not is_date_current(manifest, '2023-01-01', changed_config, output_dir)
+    write_band(band_path, b'reprocessed band data')
+    assert not is_date_current(manifest, '2023-01-01', date_entry(fingerprint_files([band_path]), GRID), output_dir)
+    assert not is_date_current(manifest, '2023-01-11', date_entry(fingerprint_files([band_path]), GRID), output_dir)
+
+def test_removed_band_file_is_stale_not_an_error(tmp_path):
+    manifest = load_manifest(str(tmp_path))
+    band_path, output_dir = build_date(tmp_path, '2023-01-01')
+    record(manifest, '2023-01-01', band_path, output_dir)
+    os.remove(band_path)
+    assert not is_date_current(manifest, '2023-01-01', date_entry(fingerprint_files([band_path]), GRID), output_dir)
+
+def test_missing_outputs_are_stale(tmp_path):
+    manifest = load_manifest(str(tmp_path))
+    band_path, output_dir = build_date(tmp_path, '2023-01-01', num_patches=3)
+    record(manifest, '2023-01-01', band_path, output_dir)
+    entry = date_entry(fingerprint_files([band_path]), GRID)
+
+    os.remove(os.path.join(output_dir, 'patch_0_1.mat'))
+    assert not is_date_current(manifest, '2023-01-01', entry, output_dir)
+    for f in os.listdir(output_dir):
+        os.remove(os.path.join(output_dir, f))
+    os.rmdir(output_dir)
+    assert not is_date_current(manifest, '2023-01-01', entry, output_dir)
+
+    # A date that produced no patches has no outputs to lose
+    manifest['dates']['2023-01-01'] = dict(entry, has_patches=False, num_patches=0)
+    assert is_date_current(manifest, '2023-01-01', entry, output_dir)
+
+def test_prune_drops_dates_without_raw_input(tmp_path):
+    manifest = load_manifest(str(tmp_path))
+    for date_str in ('2023-01-01', '2023-01-11', '2023-01-21'):
+        band_path, output_dir = build_date(tmp_path, date_str)
+        record(manifest, date_str, band_path, output_dir)
+
+    assert prune_dates(manifest, ['2023-01-01', '2023-01-21', '2023-01-31']) == ['2023-01-11']
+    assert sorted(manifest['dates']) == ['2023-01-01', '2023-01-21']
+    assert prune_dates(manifest, ['2023-01-01', '2023-01-21']) == []
@@ -0,0 +1,56 @@
+"""
+Placement of patch predictions on the map grid and naming of their classes.
+"""
+import json
+import numpy as np
+import pytest
+from src.config import globals as config
+from src.inference.map_generator import CLASS_NODATA, patch_grid_maps, square_layout_maps, legend_labels, generate_maps
+
+# Disease of each label in EVENT_METADATA; the disease encoder's sorted categories are in another order
+CLASS_NAMES = ['Bollworm', 'RedRot', 'Smut', 'Leafhopper', 'Rust']
+COORDS = [[0, 1], [1, 3], [2, 0]]
+
+def test_patches_are_placed_at_their_grid_cells():
+    class_map, health_map = patch_grid_maps([4, 1, 3], [0.25, 0.5, 0.75], COORDS)
+    assert class_map.shape == health_map.shape == (3, 4)
+    assert class_map[0, 1] == 4 and class_map[1, 3] == 1 and class_map[2, 0] == 3
+    assert health_map[0, 1] == 0.25 and health_map[1, 3] == 0.5 and health_map[2, 0] == 0.75
+    # Cells without a patch stay empty
+    assert np.isnan(class_map).sum() == np.isnan(health_map).sum() == 12 - 3
+    assert np.isnan(class_map[0, 0]) and np.isnan(health_map[2, 3])
+
+def test_square_layout_fills_rows_in_order():
+    class_map, health_map = square_layout_maps(list(range(6)), np.linspace(0, 1, 6))
+    np.testing.assert_array_equal(class_map, [[0, 1], [2, 3], [4, 5]])
+    assert health_map.shape == (3, 2) and health_map[2, 1] == 1
+    assert square_layout_maps(list(range(7)), [0.0] * 7)[0].shape == (7, 1)
+
+def test_legend_names_classes_by_label():
+    class_map, _ = patch_grid_maps([4, 1, 4], [0.0] * 3, COORDS)
+    assert legend_labels(class_map, CLASS_NAMES) == ([1, 4], ['RedRot', 'Rust'])
+
+def test_runner_class_names_follow_event_metadata_labels():
+    runner = pytest.importorskip('src.inference.runner', exc_type=ImportError)
+    assert runner.class_names(config.EVENT_METADATA) == CLASS_NAMES
+
+def test_geotiffs_hold_one_tile_per_patch_and_nodata_elsewhere(tmp_path):
+    rasterio = pytest.importorskip('rasterio')
+    from rasterio.crs import CRS
+    patch_size = 4
+    grid = {'crs': CRS.from_epsg(32643).to_wkt(), 'transform': [30, 0, 500000, 0, -30, 3400000],
+            'shape': [3 * patch_size + 2, 4 * patch_size]} # Partial cells at the bottom belong to no patch
+    store_index = {'coords': COORDS, 'grid': grid, 'patch_size': patch_size}
+
+    generate_maps([4, 1, 3], [0.25, 0.5, 0.75], CLASS_NAMES, 'toy', str(tmp_path), store_index)
+
+    with rasterio.open(tmp_path / 'disease_class_toy.tif') as src:
+        classes = src.read(1)
+        assert src.nodata == CLASS_NODATA and json.loads(src.tags()['classes']) == CLASS_NAMES
+    with rasterio.open(tmp_path / 'predicted_ndvi_toy.tif') as src:
+        ndvi = src.read(1)
+    expected_classes = np.full(classes.shape, CLASS_NODATA)
+    for value, (y_idx, x_idx) in zip([4, 1, 3], COORDS):
+        expected_classes[y_idx * patch_size:(y_idx + 1) * patch_size, x_idx * patch_size:(x_idx + 1) * patch_size] = value
+    np.testing.assert_array_equal(classes, expected_classes)
+    assert ndvi[patch_size, 3 * patch_size] == 0.5 and np.isnan(ndvi[0, 0]) and np.isnan(ndvi[-1, -1])
@@ -0,0 +1,82 @@
+"""
+The inference optimizations of src/inference/model_loader.py against the
+unmodified model, in eval mode.
+"""
+import copy
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('torchvision')
+
+from src.models.cnn_encoder import ResNetEncoder
+from src.models.light_encoder import LightEncoder
+from src.models.seq2seq_model import MultiModalSeq2Seq
+from src.inference.model_loader import fuse_resnet_batchnorm, fuse_sequential_batchnorm, optimize_for_inference
+
+CHANNELS, SIZE = 6, 64
+NUM_TABULAR_FEATURES, NUM_CLASSES = 5, 4
+
+def assert_outputs_close(actual, expected):
+    for a, e in zip(actual, expected):
+        torch.testing.assert_close(a, e, rtol=1e-4, atol=1e-4)
+
+def build_model(randomize_batchnorm):
+    torch.manual_seed(0)
+    cnn = ResNetEncoder(feature_vector_size=16, in_channels=CHANNELS, pretrained=False)
+    return randomize_batchnorm(MultiModalSeq2Seq(cnn, NUM_TABULAR_FEATURES, NUM_CLASSES)).eval()
+
+def example_inputs(batch_size=2, timesteps=3):
+    return (torch.randn(batch_size, timesteps, CHANNELS, SIZE, SIZE),
+            torch.randn(batch_size, timesteps, NUM_TABULAR_FEATURES))
+
+def test_fuse_resnet_batchnorm_preserves_outputs(randomize_batchnorm):
+    cnn = build_model(randomize_batchnorm).cnn
+    images = torch.randn(4, CHANNELS, SIZE, SIZE)
+    with torch.no_grad():
+        expected = cnn(images)
+        fused = fuse_resnet_batchnorm(copy.deepcopy(cnn))
+        actual = fused(images)
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in fused.modules())
+    torch.testing.assert_close(actual, expected, rtol=1e-4, atol=1e-4)
+
+def test_fused_model_preserves_outputs(randomize_batchnorm):
+    model = build_model(randomize_batchnorm)
+    inputs = example_inputs()
+    with torch.no_grad():
+        expected = model(*inputs)
+        actual = optimize_for_inference(copy.deepcopy(model))(*inputs)
+    assert_outputs_close(actual, expected)
+
+def test_traced_frozen_model_preserves_outputs(randomize_batchnorm):
+    model = build_model(randomize_batchnorm)
+    frozen = optimize_for_inference(copy.deepcopy(model), example_inputs())
+    assert isinstance(frozen, torch.jit.ScriptModule)
+    # Other inputs of the traced shape
+    inputs = example_inputs()
+    with torch.no_grad():
+        expected = model(*inputs)
+        actual = frozen(*inputs)
+    assert_outputs_close(actual, expected)
+
+def test_fuse_sequential_batchnorm_preserves_light_encoder_outputs(randomize_batchnorm):
+    torch.manual_seed(0)
+    cnn = randomize_batchnorm(LightEncoder(feature_vector_size=16, in_channels=CHANNELS, width=8)).eval()
+    images = torch.randn(4, CHANNELS, SIZE, SIZE)
+    with torch.no_grad():
+        expected = cnn(images)
+        fused = fuse_sequential_batchnorm(copy.deepcopy(cnn))
+        actual = fused(images)
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in fused.modules())
+    torch.testing.assert_close(actual, expected, rtol=1e-4, atol=1e-4)
+
+def test_frozen_model_runs_other_batch_sizes(randomize_batchnorm):
+    # inference.py traces on the first loader batch; the last batch is usually smaller
+    model = build_model(randomize_batchnorm)
+    frozen = optimize_for_inference(copy.deepcopy(model), example_inputs(batch_size=4))
+    for batch_size in (1, 3):
+        inputs = example_inputs(batch_size=batch_size)
+        with torch.no_grad():
+            expected = model(*inputs)
+            actual = frozen(*inputs)
+        assert actual[0].shape[0] == batch_size
+        assert_outputs_close(actual, expected)
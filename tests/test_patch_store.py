@@ -0,0 +1,83 @@
+"""
+Round trips through the packed patch store: .mat output in, memory maps out.
+"""
+import os
+import numpy as np
+import pytest
+
+scipy_io = pytest.importorskip('scipy.io')
+
+from src.dataset.patch_store import (STORE_FILENAME, NUM_TEXTURE_FEATURES, build_event_store,
+                                     build_event_store_from_patches, open_event_store, open_event_texture)
+
+NUM_PATCHES, SIZE, IMAGE_CHANNELS = 3, 4, 6
+
+def matlab_patches(rng, texture):
+    """(patches, H, W, C + 4) MATLAB output: image channels followed by constant texture planes."""
+    images = rng.random((NUM_PATCHES, SIZE, SIZE, IMAGE_CHANNELS), dtype=np.float32)
+    planes = np.broadcast_to(texture[:, None, None, :], (NUM_PATCHES, SIZE, SIZE, NUM_TEXTURE_FEATURES))
+    return np.concatenate([images, planes], axis=-1)
+
+def test_build_event_store_splits_images_and_texture(tmp_path):
+    rng = np.random.default_rng(0)
+    event_dir, store_dir = tmp_path / 'event', tmp_path / 'store'
+    event_dir.mkdir()
+    textures = rng.random((2, NUM_PATCHES, NUM_TEXTURE_FEATURES), dtype=np.float32)
+    textures[1, 2, 1] = np.nan # MATLAB's correlation of a constant patch
+    written = []
+    for d, date_str in enumerate(['2023-01-01', '2023-01-11']):
+        written.append(matlab_patches(rng, textures[d]))
+        scipy_io.savemat(str(event_dir / f'{date_str}.mat'), {'patches': written[-1]})
+
+    shape = build_event_store(str(event_dir), str(store_dir))
+    patches, index = open_event_store(str(store_dir))
+    texture = open_event_texture(str(store_dir))
+
+    assert shape == (2, NUM_PATCHES, SIZE, SIZE, IMAGE_CHANNELS) and patches.shape == shape
+    assert index['dates'] == ['2023-01-01', '2023-01-11'] and index['shape'] == list(shape)
+    np.testing.assert_array_equal(patches, np.stack(written)[..., :IMAGE_CHANNELS])
+    assert texture.shape == (2, NUM_PATCHES, NUM_TEXTURE_FEATURES)
+    np.testing.assert_array_equal(texture, np.nan_to_num(textures, nan=0.0))
+    assert texture[1, 2, 1] == 0
+    assert not any(f.endswith('.tmp.npy') for f in os.listdir(store_dir))
+
+def test_build_event_store_leaves_no_partial_store(tmp_path):
+    rng = np.random.default_rng(0)
+    event_dir, store_dir = tmp_path / 'event', tmp_path / 'store'
+    event_dir.mkdir()
+    texture = np.zeros((NUM_PATCHES, NUM_TEXTURE_FEATURES), dtype=np.float32)
+    scipy_io.savemat(str(event_dir / '2023-01-01.mat'), {'patches': matlab_patches(rng, texture)})
+    scipy_io.savemat(str(event_dir / '2023-01-11.mat'), {'patches': matlab_patches(rng, texture)[:2]})
+
+    with pytest.raises(ValueError):
+        build_event_store(str(event_dir), str(store_dir))
+    assert os.listdir(store_dir) == []
+
+def test_build_event_store_from_patches_places_patches_by_coordinate(tmp_path):
+    rng = np.random.default_rng(0)
+    processed_dir, store_dir = tmp_path / 'processed', tmp_path / 'store'
+    dates = ['2023-01-01', '2023-01-11']
+    # (0, 1) has too little cropland on the second date
+    date_coords = {dates[0]: [(0, 1), (2, 0)], dates[1]: [(2, 0), (1, 3)]}
+    written = {}
+    for date_str, coords in date_coords.items():
+        (processed_dir / date_str).mkdir(parents=True)
+        for y_idx, x_idx in coords:
+            written[date_str, (y_idx, x_idx)] = rng.random((SIZE, SIZE, IMAGE_CHANNELS), dtype=np.float32)
+            scipy_io.savemat(str(processed_dir / date_str / f'patch_{y_idx}_{x_idx}.mat'),
+                             {'patch_data': written[date_str, (y_idx, x_idx)]})
+
+    channel_names = ['blue', 'green', 'red', 'nir', 'ndvi', 'ndmi']
+    shape = build_event_store_from_patches(str(processed_dir), dates, str(store_dir), channel_names,
+                                           extra_index={'patch_size': SIZE})
+    patches, index = open_event_store(str(store_dir))
+
+    assert shape == (2, 3, SIZE, SIZE, IMAGE_CHANNELS) and patches.shape == shape
+    assert index['coords'] == [[0, 1], [1, 3], [2, 0]]
+    assert index['channels'] == channel_names and index['dates'] == dates and index['patch_size'] == SIZE
+    for d, date_str in enumerate(dates):
+        for n, coord in enumerate(index['coords']):
+            expected = written.get((date_str, tuple(coord)), np.zeros((SIZE, SIZE, IMAGE_CHANNELS), dtype=np.float32))
+            np.testing.assert_array_equal(patches[d, n], expected)
+    assert open_event_texture(str(store_dir)) is None
+    assert os.path.isfile(os.path.join(store_dir, STORE_FILENAME))
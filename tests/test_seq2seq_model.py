@@ -0,0 +1,44 @@
+"""
+Folding time into the batch (MultiModalSeq2Seq.encode_images) against
+encoding one timestep at a time.
+"""
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('torchvision')
+
+from src.models.cnn_encoder import ResNetEncoder
+from src.models.seq2seq_model import MultiModalSeq2Seq
+
+BATCH_SIZE, TIMESTEPS, CHANNELS, SIZE = 2, 3, 6, 64
+NUM_TABULAR_FEATURES, NUM_CLASSES = 5, 4
+
+def build_model(randomize_batchnorm, cnn_chunk_size=None):
+    torch.manual_seed(0)
+    cnn = ResNetEncoder(feature_vector_size=16, in_channels=CHANNELS, pretrained=False)
+    model = MultiModalSeq2Seq(cnn, NUM_TABULAR_FEATURES, NUM_CLASSES, cnn_chunk_size=cnn_chunk_size)
+    return randomize_batchnorm(model).eval()
+
+def per_timestep_features(model, image_seq):
+    """The previous behaviour: one CNN call per timestep, flattened batch-major."""
+    features = torch.stack([model.cnn(image_seq[:, t]) for t in range(image_seq.shape[1])], dim=1)
+    return features.reshape(-1, features.shape[-1])
+
+@pytest.mark.parametrize('cnn_chunk_size', [None, 4, 1])
+def test_encode_images_matches_per_timestep_encoding(randomize_batchnorm, cnn_chunk_size):
+    model = build_model(randomize_batchnorm, cnn_chunk_size)
+    image_seq = torch.randn(BATCH_SIZE, TIMESTEPS, CHANNELS, SIZE, SIZE)
+    with torch.no_grad():
+        expected = per_timestep_features(model, image_seq)
+        actual = model.encode_images(image_seq)
+    assert actual.shape == (BATCH_SIZE * TIMESTEPS, 16)
+    torch.testing.assert_close(actual, expected, rtol=1e-4, atol=1e-5)
+
+def test_forward_does_not_depend_on_chunking(randomize_batchnorm):
+    image_seq = torch.randn(BATCH_SIZE, TIMESTEPS, CHANNELS, SIZE, SIZE)
+    tabular_seq = torch.randn(BATCH_SIZE, TIMESTEPS, NUM_TABULAR_FEATURES)
+    with torch.no_grad():
+        expected = build_model(randomize_batchnorm)(image_seq, tabular_seq)
+        actual = build_model(randomize_batchnorm, cnn_chunk_size=4)(image_seq, tabular_seq)
+    for a, e in zip(actual, expected):
+        torch.testing.assert_close(a, e, rtol=1e-4, atol=1e-5)
@@ -0,0 +1,43 @@
+"""
+The native GLCM texture features against MATLAB's graycomatrix/graycoprops.
+"""
+import numpy as np
+import pytest
+from src.data_preprocessing.texture import NUM_LEVELS, quantize_nir, glcm_counts, glcm_properties, glcm_features
+
+def test_properties_match_matlab_graycoprops_example():
+    # The graycoprops documentation example:
+    # glcm = [0 1 2 3;1 1 2 3;1 0 2 0;0 0 0 3]; stats = graycoprops(glcm)
+    counts = np.zeros((1, NUM_LEVELS, NUM_LEVELS))
+    counts[0, :4, :4] = [[0, 1, 2, 3], [1, 1, 2, 3], [1, 0, 2, 0], [0, 0, 0, 3]]
+    contrast, correlation, energy, homogeneity = glcm_properties(counts)[0]
+    assert contrast == pytest.approx(2.8947, abs=1e-4)
+    assert correlation == pytest.approx(0.0783, abs=1e-4)
+    assert energy == pytest.approx(0.1191, abs=1e-4)
+    assert homogeneity == pytest.approx(0.5658, abs=1e-4)
+
+def test_quantization_matches_graycomatrix_scaling():
+    # A patch spanning 0..255 passes through mat2gray unchanged, so each value
+    # is scaled like a uint8 image: round(I * (NumLevels - 1) / 255), 0-based
+    values = np.arange(256, dtype=np.float64)
+    levels = quantize_nir(values.reshape(1, 16, 16))[0].ravel()
+    expected = np.floor(values * (NUM_LEVELS - 1) / 255 + 0.5)
+    np.testing.assert_array_equal(levels, expected)
+    assert levels[18] == 0 and levels[19] == 1
+    assert levels[236] == 6 and levels[237] == 7 and levels[255] == 7
+
+def test_counts_match_matlab_offsets():
+    # graycomatrix counts pairs (I(r, c), I(r + dr, c + dc)) with the offset [dr dc]
+    levels = np.array([[[0, 1], [2, 3]]])
+    assert glcm_counts(levels, 0, 1)[0, 0, 1] == 1 and glcm_counts(levels, 0, 1)[0, 2, 3] == 1
+    assert glcm_counts(levels, -1, 1)[0, 2, 1] == 1
+    assert glcm_counts(levels, -1, 0)[0, 2, 0] == 1 and glcm_counts(levels, -1, 0)[0, 3, 1] == 1
+    assert glcm_counts(levels, -1, -1)[0, 3, 0] == 1
+    assert glcm_counts(levels, 0, 1).sum() == 2
+
+def test_all_zero_patches_have_zero_features():
+    patches = np.zeros((2, 8, 8), dtype=np.float32)
+    patches[1] = np.arange(64).reshape(8, 8)
+    features = glcm_features(patches)
+    np.testing.assert_array_equal(features[0], 0)
+    assert np.all(np.isfinite(features[1])) and features[1, 2] < 1
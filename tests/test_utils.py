@@ -0,0 +1,57 @@
+"""
+The streaming histogram percentiles used to normalise the mosaics, against
+np.percentile of the same (positive, non-NaN) values.
+"""
+import numpy as np
+import pytest
+from src.data_preprocessing.utils import histogram_percentiles
+
+PERCENTILES = (0, 2, 25, 50, 75, 98, 100)
+
+def exact_percentiles(band):
+    values = band[band > 0] # NaN compares False, so it is excluded like in the estimator
+    return np.percentile(values, PERCENTILES)
+
+@pytest.mark.parametrize('bins', [256, 4096])
+def test_error_is_within_one_bin_width(bins):
+    rng = np.random.default_rng(0)
+    band = rng.gamma(2.0, 500.0, size=(300, 200)).astype(np.float32)
+    band[rng.random(band.shape) < 0.3] = 0 # Masked, non-cropland pixels
+
+    # Small row blocks, so the estimate is accumulated over many blocks
+    estimate = histogram_percentiles(band, PERCENTILES, bins=bins, block_rows=7)
+    expected = exact_percentiles(band)
+    positive = band[band > 0]
+    # The documented bound: (max - min) / bins
+    tolerance = (positive.max() - positive.min()) / bins
+    np.testing.assert_allclose(estimate, expected, rtol=0, atol=tolerance)
+
+def test_nan_pixels_are_ignored():
+    rng = np.random.default_rng(1)
+    band = rng.uniform(0.01, 0.6, size=(128, 96)).astype(np.float32)
+    band[rng.random(band.shape) < 0.2] = np.nan
+    band[:10] = np.nan # Whole blocks without data
+    band[rng.random(band.shape) < 0.1] = 0
+
+    estimate = histogram_percentiles(band, PERCENTILES, bins=4096, block_rows=10)
+    expected = exact_percentiles(band)
+    positive = band[band > 0]
+    tolerance = (positive.max() - positive.min()) / 4096
+    assert np.all(np.isfinite(estimate))
+    np.testing.assert_allclose(estimate, expected, rtol=0, atol=tolerance)
+
+def test_memory_mapped_band(tmp_path):
+    rng = np.random.default_rng(2)
+    path = str(tmp_path / 'band.npy')
+    np.save(path, rng.uniform(0, 3000, size=(257, 64)).astype(np.float32))
+    band = np.load(path, mmap_mode='r')
+
+    estimate = histogram_percentiles(band, (2, 98), bins=4096, block_rows=64)
+    positive = np.asarray(band)[np.asarray(band) > 0]
+    np.testing.assert_allclose(estimate, np.percentile(positive, (2, 98)), rtol=0,
+                               atol=(positive.max() - positive.min()) / 4096)
+
+def test_constant_and_empty_bands():
+    assert histogram_percentiles(np.full((8, 8), 5.0, dtype=np.float32), (2, 98)) == [5.0, 5.0]
+    assert histogram_percentiles(np.zeros((8, 8), dtype=np.float32), (2, 98)) is None
+    assert histogram_percentiles(np.full((8, 8), np.nan, dtype=np.float32), (2, 98)) is None
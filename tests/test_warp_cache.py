@@ -0,0 +1,78 @@
+"""
+The cached bilinear gather of WarpIndexCache against rasterio.warp.reproject.
+"""
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip('rasterio')
+
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+from rasterio.warp import reproject
+from src.data_preprocessing.warp_cache import WarpIndexCache
+
+CRS_UTM = CRS.from_epsg(32643)
+
+def open_source(memfile, data, transform, nodata=None):
+    """An open single-band rasterio dataset holding data."""
+    with memfile.open(driver='GTiff', height=data.shape[0], width=data.shape[1], count=1, dtype='float32',
+                      crs=CRS_UTM, transform=transform, nodata=nodata) as dst:
+        dst.write(data, 1)
+    return memfile.open()
+
+def test_matches_reproject_inside_the_source(tmp_path):
+    rng = np.random.default_rng(0)
+    data = rng.random((20, 20), dtype=np.float32) * 100
+    src_transform = from_origin(0, 20, 1, 1)
+    # A finer, shifted grid lying well inside the source footprint
+    dst_transform, dst_shape = from_origin(2.3, 17.7, 0.7, 0.7), (15, 15)
+
+    expected = np.zeros(dst_shape, dtype=np.float32)
+    reproject(source=data, destination=expected, src_transform=src_transform, src_crs=CRS_UTM,
+              dst_transform=dst_transform, dst_crs=CRS_UTM, resampling=Resampling.bilinear)
+
+    actual = np.zeros(dst_shape, dtype=np.float32)
+    with MemoryFile() as memfile, open_source(memfile, data, src_transform) as src:
+        WarpIndexCache(str(tmp_path / 'cache')).resample(src, actual, dst_transform, CRS_UTM)
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-3)
+
+def test_one_pixel_tall_source_interpolates_along_its_row(tmp_path):
+    data = np.array([[0, 10, 20, 30, 40]], dtype=np.float32)
+    src_transform = from_origin(0, 1, 1, 1)
+    # Half-pixel steps inside the single source row
+    dst_transform, dst_shape = from_origin(0.5, 1, 0.5, 1), (1, 8)
+
+    actual = np.full(dst_shape, -1, dtype=np.float32)
+    with MemoryFile() as memfile, open_source(memfile, data, src_transform) as src:
+        WarpIndexCache(str(tmp_path / 'cache')).resample(src, actual, dst_transform, CRS_UTM)
+    # Destination centres 0.75, 1.25, ... lie 0.25, 0.75, ... source pixels past the first centre
+    expected = np.interp(np.arange(8) * 0.5 + 0.25, np.arange(5), data[0])
+    np.testing.assert_allclose(actual[0], expected, atol=1e-4)
+
+def test_cache_hit_reuses_the_stored_indices(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    data = rng.random((20, 20), dtype=np.float32)
+    src_transform = from_origin(0, 20, 1, 1)
+    dst_transform, dst_shape = from_origin(2.3, 17.7, 0.7, 0.7), (15, 15)
+    cache_dir = str(tmp_path / 'cache')
+
+    first = np.zeros(dst_shape, dtype=np.float32)
+    with MemoryFile() as memfile, open_source(memfile, data, src_transform) as src:
+        WarpIndexCache(cache_dir).resample(src, first, dst_transform, CRS_UTM)
+        index = {name: np.array(values) for name, values in
+                 WarpIndexCache(cache_dir).get(src.crs, src.transform, src.shape, CRS_UTM, dst_transform, dst_shape).items()}
+
+        # A new cache over the same directory (another date or worker) must not rebuild
+        def fail_build(*args, **kwargs):
+            raise AssertionError("cache entry was rebuilt")
+        cache = WarpIndexCache(cache_dir)
+        monkeypatch.setattr(cache, '_build', fail_build)
+        second = np.zeros(dst_shape, dtype=np.float32)
+        cache.resample(src, second, dst_transform, CRS_UTM)
+        reused = cache.get(src.crs, src.transform, src.shape, CRS_UTM, dst_transform, dst_shape)
+
+    np.testing.assert_array_equal(second, first)
+    for name, values in index.items():
+        np.testing.assert_array_equal(reused[name], values)
@@ -1,21 +1,27 @@
 """
 Main script to orchestrate the model training process.
+
+With --distill, a light CNN encoder (src/models/light_encoder.py) is trained
+to reproduce the features and predictions of the trained ResNet-34 model,
+and saved for `python inference.py --encoder light`.
 """
 import os
 import torch
 import torch.nn as nn
-from torch.utils.data import DataLoader, random_split
+from torch.utils.data import random_split
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.utils.class_weight import compute_class_weight
 import pandas as pd
 import numpy as np
 import joblib
+import argparse
 
 # Import from our source library
 from src.config import globals as config
-from src.dataset.dataset import LocalSequenceDataset
-from src.models.cnn_encoder import ResNetEncoder
-from src.models.seq2seq_model import MultiModalSeq2Seq
+from src.dataset.dataset import LocalSequenceDataset, SPLIT_FILENAME, save_split, load_split
+from src.dataset.loader import make_loader, benchmark_loader
+from src.dataset.embedding_cache import build_embedding_cache, latest_cache_encoder, EmbeddingSequenceDataset
+from src.inference.model_loader import MODEL_FILENAMES, build_model, load_model
 from src.training.trainer import train_model
 
 def setup_preprocessing():
@@ -25,6 +31,22 @@ def setup_preprocessing():
     return iot_data, scalers, encoders
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the crop health model.")
+    parser.add_argument('--cached-embeddings', action='store_true',
+                        help='Freeze the CNN, cache its embeddings of every patch and train only the sequence model.')
+    parser.add_argument('--encoder-weights', type=str, default=None,
+                        help='Model checkpoint (.pth), or an encoder.pth saved with an embedding cache, to take the '
+                             'CNN encoder weights from. With --cached-embeddings the default is the encoder of the '
+                             'most recently used cache.')
+    parser.add_argument('--distill', action='store_true',
+                        help='Train the light encoder model by distillation from the trained ResNet model.')
+    parser.add_argument('--benchmark-loader', type=int, nargs='*', metavar='NUM_WORKERS',
+                        help='Report data-loader throughput for these worker counts (default: 0, 2, 4, ... up to '
+                             'the CPU count) and exit without training.')
+    args = parser.parse_args()
+    if args.distill and (args.cached_embeddings or args.encoder_weights):
+        parser.error('--distill trains a new encoder and cannot be combined with --cached-embeddings or --encoder-weights.')
+
     # --- 1. Setup ---
     os.makedirs(config.OUTPUT_MODEL_DIR, exist_ok=True)
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -47,27 +69,71 @@ if __name__ == '__main__':
         'disease': OneHotEncoder(handle_unknown='ignore', sparse_output=False).fit(all_diseases)
     }
     
-    # --- 3. Data Loading ---
-    full_dataset = LocalSequenceDataset(config.INPUT_DATA_DIR, config.EVENT_METADATA, iot_data, scalers, encoders)
-    train_size = int(0.8 * len(full_dataset))
-    val_size = len(full_dataset) - train_size
-    train_dataset, val_dataset = random_split(full_dataset, [train_size, val_size])
+    # --- 3. Model ---
+    teacher = None
+    if args.distill:
+        teacher_path = os.path.join(config.OUTPUT_MODEL_DIR, MODEL_FILENAMES['resnet'])
+        if not os.path.exists(teacher_path):
+            print(f"ERROR: Teacher model not found at {teacher_path}. Please run train.py first.")
+            raise SystemExit(1)
+        teacher = load_model(teacher_path, encoders, device)
+        for param in teacher.parameters():
+            param.requires_grad = False
+    # Input sizes come from model_dimensions, as for every model loaded at inference
+    model = build_model(encoders, encoder='light' if args.distill else 'resnet').to(device)
+    cnn = model.cnn
+    if teacher is not None:
+        print(f"Distilling into the light encoder ({sum(p.numel() for p in cnn.parameters()):,} CNN parameters, "
+              f"teacher: {sum(p.numel() for p in teacher.cnn.parameters()):,})")
+    encoder_weights = args.encoder_weights
+    if encoder_weights is None and args.cached_embeddings:
+        # The cached embeddings are only valid for the exact encoder they were computed with
+        encoder_weights = latest_cache_encoder(config.EMBEDDING_CACHE_DIR)
+    if encoder_weights:
+        state_dict = torch.load(encoder_weights, map_location=device)
+        if any(k.startswith('cnn.') for k in state_dict): # A full model checkpoint
+            state_dict = {k[len('cnn.'):]: v for k, v in state_dict.items() if k.startswith('cnn.')}
+        cnn.load_state_dict(state_dict)
+        print(f"Loaded encoder weights from {encoder_weights}")
+
+    # --- 4. Data Loading ---
+    if args.cached_embeddings:
+        # Train only cnn_feature_bn, the LSTM and the heads on frozen, precomputed CNN features
+        print("--- Building CNN embedding cache ---")
+        encoder_cache_dir = build_embedding_cache(cnn, config.PATCH_STORE_DIR, config.EVENT_METADATA.keys(),
+                                                  config.EMBEDDING_CACHE_DIR, device, config.EMBEDDING_BATCH_SIZE)
+        for param in cnn.parameters():
+            param.requires_grad = False
+        full_dataset = EmbeddingSequenceDataset(config.PATCH_STORE_DIR, encoder_cache_dir, config.EVENT_METADATA,
+                                                iot_data, scalers, encoders)
+    else:
+        full_dataset = LocalSequenceDataset(config.PATCH_STORE_DIR, config.EVENT_METADATA, iot_data, scalers, encoders)
+    if args.benchmark_loader is not None:
+        worker_counts = args.benchmark_loader or [0] + list(range(2, (os.cpu_count() or 2) + 1, 2))
+        benchmark_loader(full_dataset, device, worker_counts)
+        raise SystemExit
+    split_path = os.path.join(config.OUTPUT_MODEL_DIR, SPLIT_FILENAME)
+    if args.distill and os.path.exists(split_path):
+        # The student must not train on the samples the teacher was validated on
+        train_dataset, val_dataset = load_split(split_path, full_dataset)
+    else:
+        if args.distill:
+            print(f"WARNING: No {SPLIT_FILENAME} from the teacher's training run; the student's split may overlap "
+                  f"the teacher's validation samples.")
+        train_size = int(0.8 * len(full_dataset))
+        val_size = len(full_dataset) - train_size
+        train_dataset, val_dataset = random_split(full_dataset, [train_size, val_size])
+        # quantize.py and the benchmarks evaluate on exactly these validation samples
+        save_split(split_path, full_dataset, train_dataset.indices, val_dataset.indices)
     
-    train_loader = DataLoader(train_dataset, batch_size=config.BATCH_SIZE, shuffle=True, num_workers=0)
-    val_loader = DataLoader(val_dataset, batch_size=config.BATCH_SIZE, shuffle=False, num_workers=0)
+    train_loader = make_loader(train_dataset, device, shuffle=True)
+    val_loader = make_loader(val_dataset, device, shuffle=False)
     print(f"Created train ({len(train_dataset)}) and validation ({len(val_dataset)}) sets.")
 
-    # --- 4. Model & Optimizer ---
-    num_tabular_features = 3 + len(encoders['crop'].categories_[0]) + len(encoders['disease'].categories_[0])
-    num_classes = len(set(meta['label'] for meta in config.EVENT_METADATA.values()))
-    
-    cnn = ResNetEncoder(feature_vector_size=config.FEATURE_VECTOR_SIZE).to(device)
-    model = MultiModalSeq2Seq(cnn, num_tabular_features, num_classes).to(device)
-    
-    optimizer = torch.optim.Adam(model.parameters(), lr=config.LEARNING_RATE)
+    optimizer = torch.optim.Adam([p for p in model.parameters() if p.requires_grad], lr=config.LEARNING_RATE)
     
     # --- 5. Loss Functions with Class Weights ---
-    all_labels = [config.EVENT_METADATA[s['event']]['label'] for s in train_dataset.dataset.samples[train_dataset.indices]]
+    all_labels = [config.EVENT_METADATA[full_dataset.samples[i]['event']]['label'] for i in train_dataset.indices]
     class_weights = compute_class_weight('balanced', classes=np.unique(all_labels), y=all_labels)
     class_weights = torch.tensor(class_weights, dtype=torch.float).to(device)
     
@@ -76,6 +142,8 @@ if __name__ == '__main__':
     
     # --- 6. Start Training ---
     print("\n--- Starting Full Training and Validation Loop ---")
-    train_model(model, train_loader, val_loader, optimizer, class_criterion, health_criterion, device)
+    checkpoint_name = MODEL_FILENAMES['light' if args.distill else 'resnet']
+    train_model(model, train_loader, val_loader, optimizer, class_criterion, health_criterion, device,
+                teacher=teacher, checkpoint_name=checkpoint_name)
     
     print("\n--- TRAINING COMPLETE ---")